@@ -1,5 +1,6 @@
 __all__ = [ "ascii2gr", "ascii2th1", "ascii2th3", "mixtures" ]
 
+import numpy as np
 import ROOT
 
 def FlipTH2(h):
@@ -41,3 +42,14 @@ def ErrorHist(h):
 
     herr.GetZaxis().SetTitle("Relative error [%]");
     return herr
+
+def FillHist(h, val, err=None):
+    """ Set the content and errors of a TH1/TH2/TH3 histogram from numpy arrays in one call
+
+    val and err must be indexed as [x], [y,x] or [z,y,x] (the x index is the fastest)
+    and must not include the underflow and overflow bins.
+    """
+    pad = [(1, 1)] * val.ndim # ROOT stores underflow and overflow bins along each axis
+    h.SetContent(np.ascontiguousarray(np.pad(val, pad), dtype=np.float64).ravel())
+    if err is not None:
+        h.SetError(np.ascontiguousarray(np.pad(err, pad), dtype=np.float64).ravel())
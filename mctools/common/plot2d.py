@@ -11,6 +11,7 @@ from math  import sqrt
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 from mctools.common import FlipTH2, DynamicSlice, ErrorHist
+from mctools.fluka import plotgeom
 
 # runs in both Python 2 and 3
 try:
@@ -72,6 +73,7 @@ def main():
         parser.add_argument("-gcont", type=int, dest='gcont', help='Set the number of contour levels for geometry', default=25)
         parser.add_argument("-glwidth", type=int, dest='glwidth', help='Geometry line width', default=2)
         parser.add_argument("-glcolor", type=str, dest='glcolor', help='Geometry line color (ROOT names)', default="kBlack")
+        parser.add_argument("-plotgeom", type=str, dest='plotgeom', help='PLOTGEOM worms converted by plotgeom2root (.root or .npz) drawn over the data', default=None)
         parser.add_argument("-title",  type=str, dest='title',   help='Plot title',   default=None)
         parser.add_argument("-xtitle", type=str, dest='xtitle', help='horizontal axis title', default=None)
         parser.add_argument("-ytitle", type=str, dest='ytitle', help='vertical axis title', default=None)
@@ -202,6 +204,11 @@ def main():
             gh2.SetContour(args.gcont)
             gh2.Draw("same %s" % args.goption)
 
+        if args.plotgeom is not None:
+            if args.verbose: print("Drawing the PLOTGEOM worms")
+            points, offsets = plotgeom.load(args.plotgeom)
+            worms = plotgeom.draw(points, offsets, eval("ROOT.%s" % args.glcolor), args.glwidth, args.flip)
+
         ci = ROOT.TColor.GetFreeColorIndex()
         color = ROOT.TColor(ci,0.27843137254900002, 0.27843137254900002, 0.6)
 
@@ -0,0 +1,101 @@
+# https://github.com/kbat/mc-tools
+#
+# EVENTDAT binary output reader
+#
+
+from __future__ import print_function
+import os, struct
+import numpy as np
+from mctools.fluka.flair import fortran
+
+CHUNK = 65536 # number of events processed at once
+NSCAN = 64    # number of records used to find the event layout
+
+class EventDat:
+    """EVENTDAT file: the header and the fixed-size event records read in chunks as NumPy arrays.
+    Each event consists of the same sequence of fortran records: (NCASE, NDUM, MDUM), the energy balance
+    (ENDIST), the scored distributions in all regions and the random number generator seeds."""
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as f:
+            data = fortran.read(f)
+            if data is None or len(data) < 124:
+                raise IOError("%s: invalid EVENTDAT file" % fname)
+            (title, time, self.nregs, self.nsco) = struct.unpack("=80s32sii", data[:120])
+            self.title = title.strip()
+            self.time = time.strip()
+            self.iscore = struct.unpack("=%di" % self.nsco, data[120:120+4*self.nsco]) # scored distributions
+            self.offset = f.tell() # position of the first event
+            with fortran.Reader(f, "=", 4) as r:
+                sizes = [size for pos, size in r.records(NSCAN)]
+        self.sizes = self.getEventLayout(sizes)
+        self.dtype = self.getDtype()
+        length = os.path.getsize(fname) - self.offset
+        if length % self.dtype.itemsize:
+            raise IOError("%s: EVENTDAT events have different sizes" % fname)
+        self.nevents = length // self.dtype.itemsize
+
+    def getEventLayout(self, sizes):
+        """Return the list of record sizes of one event as the shortest period of the sizes sequence"""
+        for p in range(1, len(sizes)+1):
+            if all(sizes[i] == sizes[i+p] for i in range(len(sizes)-p)) and self.getDataRecords(sizes[:p]):
+                return sizes[:p]
+        raise IOError("%s: the event layout is not recognised" % self.fname)
+
+    def getDataRecords(self, sizes):
+        """Return the indices of the records with the scored distributions, either one record
+        with all distributions or one record per distribution (the last ones of the given size)"""
+        for n, size in ((1, 4*self.nregs*self.nsco), (self.nsco, 4*self.nregs)):
+            idx = [i for i, s in enumerate(sizes) if s == size]
+            if len(idx) >= n:
+                return idx[-n:]
+        return []
+
+    def getDtype(self):
+        """Return the structured dtype of one event including the fortran record markers"""
+        data = self.getDataRecords(self.sizes)
+        fields = []
+        for i, size in enumerate(self.sizes):
+            if i in data:
+                field = ("data%d" % data.index(i), "=f4", (size//4,))
+            elif size == 12:
+                field = ("event", "=i4", (3,))  # NCASE, NDUM, MDUM
+            elif size == 48:
+                field = ("endist", "=f4", (12,)) # energy balance
+            else:
+                field = ("rec%d" % i, "V%d" % size)
+            fields += [("size%d" % i, "=i4"), field, ("end%d" % i, "=i4")]
+        return np.dtype(fields)
+
+    def events(self, first=0, n=None):
+        """Return the memory-mapped array of n events starting from first"""
+        if n is None:
+            n = self.nevents - first
+        return np.memmap(self.fname, dtype=self.dtype, mode="r", offset=self.offset + first*self.dtype.itemsize, shape=(n,))
+
+    def check(self, ev):
+        """Raise IOError if the fortran record markers of the events are corrupted"""
+        for i, size in enumerate(self.sizes):
+            if np.any(ev["size%d" % i] != size) or np.any(ev["end%d" % i] != size):
+                raise IOError("%s: corrupted EVENTDAT record" % self.fname)
+
+    def chunks(self, chunk=CHUNK, first=0, n=None):
+        """Iterate over the checked arrays of at most chunk events"""
+        last = self.nevents if n is None else first + n
+        for i in range(first, last, chunk):
+            ev = self.events(i, min(chunk, last-i))
+            self.check(ev)
+            yield ev
+
+    def getData(self, ev):
+        """Return the (nevents, nsco, nregs) array of the scored distributions of the events"""
+        ndata = len(self.getDataRecords(self.sizes))
+        if ndata == 1:
+            return ev["data0"].reshape(len(ev), self.nsco, self.nregs)
+        return np.stack([ev["data%d" % i] for i in range(ndata)], axis=1)
+
+    def getNCase(self, ev):
+        """Return the event numbers, or None if the event record is not present"""
+        if "event" not in self.dtype.names:
+            return None
+        return ev["event"][:, 0]
@@ -1,24 +1,122 @@
-#! /usr/bin/python2 -W all
+#! /usr/bin/python -W all
 
 from __future__ import print_function
-import sys, argparse, os, struct
-from array import array
-from mctools.fluka.flair import fortran
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
+import sys, argparse, os, re, zipfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mctools import fluka
+from mctools.fluka.eventdat import EventDat, CHUNK
 
+def loadROOT():
+    """Import ROOT and declare the function which fills the tree with n events in one call"""
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    if not hasattr(ROOT, "eventdat2root_fill"):
+        ROOT.gInterpreter.Declare(
+"void eventdat2root_fill(TTree *T, Float_t *buf, Int_t *ncase, const Float_t *data, const Int_t *cases, Long64_t n, Int_t len) {\
+   for (Long64_t i=0; i<n; i++) {\
+      std::copy(data + i*len, data + (i+1)*len, buf);\
+      *ncase = cases[i];\
+      T->Fill();\
+   }\
+}" )
+    return ROOT
+
+def getBranchNames(ed):
+    """Return branch names of the scored distributions"""
+    return [re.sub(r"[^A-Za-z0-9_]", "_", fluka.particle.get(s, "d%d" % s)) for s in ed.iscore]
+
+def convertFile(fname, fout_name, chunk=CHUNK):
+    """Convert the EVENTDAT file into the EVENTDAT tree of the ROOT file fout_name, return fout_name"""
+    ROOT = loadROOT()
+    ed = EventDat(fname)
+    buf = np.zeros((ed.nsco, ed.nregs), dtype=np.float32)
+    ncase = np.zeros(1, dtype=np.int32)
+
+    fout = ROOT.TFile(fout_name, "recreate", ed.title)
+    T = ROOT.TTree("EVENTDAT", ed.time)
+    T.Branch("ncase", ncase, "ncase/I")
+    for i, name in enumerate(getBranchNames(ed)):
+        T.Branch(name, buf[i], "%s[%d]/F" % (name, ed.nregs))
+
+    for ev in ed.chunks(chunk):
+        data = np.ascontiguousarray(ed.getData(ev), dtype=np.float32)
+        cases = ed.getNCase(ev)
+        cases = np.arange(len(ev), dtype=np.int32) if cases is None else np.ascontiguousarray(cases, dtype=np.int32)
+        ROOT.eventdat2root_fill(T, buf, ncase, data, cases, len(ev), ed.nsco*ed.nregs)
+    T.Write()
+    fout.Close()
+    return fout_name
+
+def getColumnFileName(prefix, name):
+    """Return the .npy file name of the given array"""
+    return "%s.%s.npy" % (prefix, name)
+
+def writeFile(fname, prefix, first, chunk=CHUNK):
+    """Write the events of the EVENTDAT file into the preallocated .npy files starting from the event first"""
+    ed = EventDat(fname)
+    data = np.lib.format.open_memmap(getColumnFileName(prefix, "data"), mode="r+")
+    ncase = np.lib.format.open_memmap(getColumnFileName(prefix, "ncase"), mode="r+")
+    for ev in ed.chunks(chunk):
+        data[first:first+len(ev)] = ed.getData(ev)
+        cases = ed.getNCase(ev)
+        if cases is not None:
+            ncase[first:first+len(ev)] = cases
+        first += len(ev)
+    data.flush()
+    ncase.flush()
+
+def saveNPZ(eds, fname, workers, chunk=CHUNK):
+    """Save the scored distributions of all events into the (nevents, nsco, nregs) 'data' array
+    and the event numbers into the 'ncase' array of the NPZ file"""
+    prefix = fname[:-4] if fname.endswith(".npz") else fname
+    N = sum(ed.nevents for ed in eds)
+    np.lib.format.open_memmap(getColumnFileName(prefix, "data"), mode="w+", dtype=np.float32, shape=(N, eds[0].nsco, eds[0].nregs))
+    np.lib.format.open_memmap(getColumnFileName(prefix, "ncase"), mode="w+", dtype=np.int32, shape=(N,))
+    np.save(getColumnFileName(prefix, "iscore"), np.array(eds[0].iscore, dtype=np.int32))
+
+    first = np.cumsum([0] + [ed.nevents for ed in eds[:-1]])
+    with ProcessPoolExecutor(workers) as pool:
+        for job in [pool.submit(writeFile, ed.fname, prefix, f, chunk) for ed, f in zip(eds, first)]:
+            job.result()
+
+    with zipfile.ZipFile(prefix+".npz", "w", zipfile.ZIP_DEFLATED, allowZip64=True) as z:
+        for name in ("data", "ncase", "iscore"):
+            z.write(getColumnFileName(prefix, name), name+".npy")
+            os.unlink(getColumnFileName(prefix, name))
+
+def saveROOT(eds, fname, workers, chunk=CHUNK):
+    """Save the events of all files into the EVENTDAT tree of the ROOT file.
+    Each file is converted by a worker process into a separate ROOT file, the trees are concatenated in order at the end"""
+    if len(eds) == 1:
+        convertFile(eds[0].fname, fname, chunk)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(convertFile, ed.fname, "%s.%d" % (fname, i), chunk) for i, ed in enumerate(eds)]
+        parts = [job.result() for job in jobs]
+    ROOT = loadROOT()
+    chain = ROOT.TChain("EVENTDAT")
+    for part in parts:
+        chain.Add(part)
+    fout = ROOT.TFile(fname, "recreate", eds[0].title)
+    T = chain.CloneTree(-1, "fast")
+    T.Write()
+    fout.Close()
+    for part in parts:
+        os.unlink(part)
 
 def main():
-    """ Converts ustsuw output into a ROOT TH1F histogram """
+    """ Converts EVENTDAT output into a ROOT TTree or NPZ arrays """
 
     parser = argparse.ArgumentParser(description=main.__doc__,
                                      epilog="Homepage: https://github.com/kbat/mc-tools")
-    parser.add_argument('eventdat', type=str, nargs='*', help='list of eventdat files')
-    parser.add_argument('-o', dest='root', type=str, help='output ROOT file name', default="")
+    parser.add_argument('eventdat', type=str, nargs='+', help='list of eventdat files')
+    parser.add_argument('-o', dest='root', type=str, help='output file name (.root or .npz)', default="")
     parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='print what is being done')
-    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output ROOT file')
+    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output file')
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of events processed at once', default=CHUNK)
+    parser.add_argument('-workers', dest='workers', type=int, help='number of worker processes (default: number of CPUs)', default=None)
 
-    
     args = parser.parse_args()
 
     for f in args.eventdat:
@@ -26,51 +124,26 @@ def main():
             print("eventdat2root: File %s does not exist." % f, file=sys.stderr)
             return 1
 
-    if not args.overwrite and os.path.isfile(args.root):
-        sys.exit("%s exists. Use '-f' to overwrite it." % args.root)
-
-    first = True
-    for eventdat in args.eventdat:
-        with open(eventdat, 'rb') as f:
-            print(eventdat)
-            while True:
-                data = fortran.read(f)
-                if data is None:
-                    break
-                size = len(data)
-                print("\nsize:",size)
-                
-                if first:
-                    first = False
-
-                    title, time, nregs, nsco, dist = struct.unpack("=80s32siii", data)
-
-                    print("title:", title)
-                    print("time:", time)
-                    print("number of regions:",nregs)
-                    print("number of scoring distributions:", nsco)
-                    print("distribution:",dist)
-
-                    DATA = array('f', nsco*nregs*[0.0])
-                    
-                    fout = ROOT.TFile(args.root, "recreate", title)
-                    T = ROOT.TTree("EVENTDAT", time)
-                    T.Branch("DATA", DATA, "d%d[%d]/F" % (dist,nsco*nregs))
-                elif size == 12:
-                    pass
-                elif size == 48:
-                    pass
-                elif size == 8:
-                    pass
-                elif size == nregs*nsco*4:
-                    val = struct.unpack("%df" % nregs*nsco, data)
-                    for i,v in enumerate(val):
-                        DATA[i] = v
-                    T.Fill()
-            
-    T.Write()
-    fout.Close()
-    
+    out = args.root if args.root else args.eventdat[0] + ".root"
+    if not args.overwrite and os.path.isfile(out):
+        sys.exit("%s exists. Use '-f' to overwrite it." % out)
+
+    eds = [EventDat(f) for f in args.eventdat]
+    for ed in eds:
+        if (ed.nregs, ed.iscore) != (eds[0].nregs, eds[0].iscore):
+            sys.exit("eventdat2root: %s and %s have different scoring" % (eds[0].fname, ed.fname))
+        if args.verbose:
+            print(ed.fname)
+            print("title:", ed.title)
+            print("time:", ed.time)
+            print("number of regions:", ed.nregs)
+            print("scored distributions:", ed.iscore)
+            print("number of events:", ed.nevents)
+
+    if out.endswith(".npz"):
+        saveNPZ(eds, out, args.workers, args.chunk)
+    else:
+        saveROOT(eds, out, args.workers, args.chunk)
 
 if __name__=="__main__":
     sys.exit(main())
@@ -37,6 +37,7 @@
 __author__ = "Vasilis Vlachoudis"
 __email__  = "Vasilis.Vlachoudis@cern.ch"
 
+import os
 import re
 import math
 import mctools.fluka.flair.bmath as bmath
@@ -90,19 +91,24 @@ class Usrxxx:
 		self.detector = []
 		self.seekpos  = -1
 		self.statpos  = -1
+		self.hnd      = None
 
 	# ----------------------------------------------------------------------
 	# Read information from USRxxx file
-	# @return the handle to the file opened
+	# The header records are scanned with the buffered fortran.Reader
+	# @return the reader positioned after the header record, the derived
+	# classes continue with it and close it at the end of their header
 	# ----------------------------------------------------------------------
 	def readHeader(self, filename):
-		"""Read header information, and return the file handle"""
+		"""Read header information, and return the fortran reader"""
+		self.close()
 		self.reset()
 		self.file = filename
-		f = open(self.file, "rb")
+		self.hnd = open(self.file, "rb")
+		f = fortran.Reader(self.hnd, "=", 4)
 
 		# Read header
-		data = fortran.read(f)
+		data = f.read()
 		if data is None: raise IOError("Invalid USRxxx file")
 		size   = len(data)
 		over1b = 0
@@ -127,26 +133,43 @@ class Usrxxx:
 			raise IOError("Invalid USRxxx file")
 
 		if over1b>0:
-			self.ncase = long(self.ncase) + long(over1b)*1000000000
+			self.ncase = int(self.ncase) + int(over1b)*1000000000
 
 		self.title = title.strip()
 		self.time  = time.strip()
 
 		return f
 
+	# ----------------------------------------------------------------------
+	def close(self):
+		"""Close the file handle kept open after readHeader"""
+		if self.hnd is not None:
+			self.hnd.close()
+			self.hnd = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	# ----------------------------------------------------------------------
+	# Read the fortran record at the given position
+	# (the positions of detector records are recorded by readHeader)
+	# ----------------------------------------------------------------------
+	def readRecord(self, pos):
+		"""Read the fortran record starting at file position pos"""
+		if self.hnd is None:
+			self.hnd = open(self.file, "rb")
+		self.hnd.seek(pos)
+		return fortran.read(self.hnd)
+
 	# ----------------------------------------------------------------------
 	# Read detector data
 	# ----------------------------------------------------------------------
 	def readData(self, det):
 		"""Read detector det data structure"""
-		f = open(self.file,"rb")
-		fortran.skip(f)	# Skip header
-		for i in range(2*det):
-			fortran.skip(f)	# Detector Header & Data
-		fortran.skip(f)		# Detector Header
-		data = fortran.read(f)
-		f.close()
-		return data
+		return self.readRecord(self.detector[det].datapos)
 
 	# ----------------------------------------------------------------------
 	# Read detector statistical data
@@ -154,13 +177,54 @@ class Usrxxx:
 	def readStat(self, det):
 		"""Read detector det statistical data"""
 		if self.statpos < 0: return None
-		f = open(self.file,"rb")
-		f.seek(self.statpos)
-		for i in range(det):
-			fortran.skip(f)	# Detector Data
-		data = fortran.read(f)
-		f.close()
-		return data
+		return self.readRecord(self.detector[det].statpos)
+
+	# ----------------------------------------------------------------------
+	# Shape of the detector data array, defined by the derived classes
+	# lowneu: shape of the low energy neutron part of the data
+	# ----------------------------------------------------------------------
+	def getShape(self, det, lowneu=False):
+		"""Return shape of the numpy array of detector det data"""
+		raise NotImplementedError("%s does not define the data shape" % self.__class__.__name__)
+
+	# ----------------------------------------------------------------------
+	def toArray(self, data, det, lowneu=False):
+		"""Return a numpy view (without copy) of the binary data of detector det"""
+		shape  = self.getShape(det, lowneu)
+		offset = 0
+		if lowneu:	# low energy neutrons follow the high energy data
+			offset = 4*int(numpy.prod(self.getShape(det)))
+		return numpy.frombuffer(data, dtype="=f4",
+				count=int(numpy.prod(shape)), offset=offset).reshape(shape)
+
+	# ----------------------------------------------------------------------
+	def readDataArray(self, det, lowneu=False):
+		"""Read detector det data as numpy array of the getShape(det) shape"""
+		return self.toArray(self.readData(det), det, lowneu)
+
+	# ----------------------------------------------------------------------
+	def readStatArray(self, det, lowneu=False):
+		"""Read detector det relative errors as numpy array of the getShape(det) shape"""
+		data = self.readStat(det)
+		if data is None: return None
+		return self.toArray(data, det, lowneu)
+
+	# ----------------------------------------------------------------------
+	# Return detector data and relative errors
+	# If mmap is True the arrays are memory-mapped from the file, so
+	# slicing them reads only the pages which are actually accessed
+	# ----------------------------------------------------------------------
+	def array(self, det, mmap=True):
+		"""Return (data, errors) arrays of the getShape(det) shape, errors are None without statistics"""
+		if not mmap:
+			return (self.readDataArray(det), self.readStatArray(det))
+		shape = self.getShape(det)
+		d = self.detector[det]
+		# skip the fortran record marker
+		data = numpy.memmap(self.file, dtype="=f4", mode="r", offset=d.datapos+4, shape=shape)
+		if self.statpos < 0 or d.statpos < 0:
+			return (data, None)
+		return (data, numpy.memmap(self.file, dtype="=f4", mode="r", offset=d.statpos+4, shape=shape))
 
 	# ----------------------------------------------------------------------
 	def sayHeader(self):
@@ -187,29 +251,38 @@ class Resnuclei(Usrxxx):
 			self.evol = True
 			self.ncase = -self.ncase
 
-			data = fortran.read(f)
+			data = f.read()
 			nir = (len(data)-4)//8
 			self.irrdt = struct.unpack("=i%df"%(2*nir), data)
 		else:
 			self.evol  = False
 			self.irrdt = None
 
-		for i in range(1000):
+		while True:
 			# Header
-			data = fortran.read(f)
+			pos  = f.tell()
+			data = f.read()
 			if data is None: break
 			size = len(data)
 			self.irrdt = None
 
 			# Statistics are present?
-			if size == 14 and data[:8] ==	"ISOMERS:":
+			if size == 14 and data[:8] == b"ISOMERS:":
 				self.nisomers = struct.unpack("=10xi",data)[0]
-				data = fortran.read(f)
-				data = fortran.read(f)
+				self.detector[-1].isopos = pos
+				self.detector[-1].isodatapos = f.tell()
+				data = f.read()
+				data = f.read()
+				if data is None: break
 				size = len(data)
 
-			if size == 14 and data[:10] == "STATISTICS":
+			if size == 14 and data[:10] == b"STATISTICS":
 				self.statpos = f.tell()
+				nstat = 7 if self.nisomers else 6
+				for det in self.detector:
+					det.statpos = f.tell()
+					for j in range(nstat):
+						f.skip()
 				break
 
 			if size != 38:
@@ -231,42 +304,27 @@ class Resnuclei(Usrxxx):
 			self.detector.append(det)
 
 			if self.evol:
-				data = fortran.read(f)
+				data = f.read()
 				self.tdecay = struct.unpack("=f", data)
 			else:
 				self.tdecay = 0.0
 
+			det.datapos = f.tell()
+			det.isopos  = -1
+			det.isodatapos = -1
+			det.statpos = -1
 			size  = det.zhigh * det.mhigh * 4
-			if size != fortran.skip(f):
+			if size != f.skip():
 				raise IOError("Invalid RESNUCLEi file")
 
 		f.close()
+		return self.hnd
 
 	# ----------------------------------------------------------------------
-	# Read detector data
-	# ----------------------------------------------------------------------
-	def readData(self, n):
-		"""Read detector det data structure"""
-		f = open(self.file, "rb")
-		fortran.skip(f)
-		if self.evol:
-			fortran.skip(f)
-
-		for i in range(n):
-			fortran.skip(f)		# Detector Header & Data
-			if self.evol:
-				fortran.skip(f)	# TDecay
-			fortran.skip(f)		# Detector data
-			if self.nisomers:
-				fortran.skip(f)	# Isomers header
-				fortran.skip(f)	# Isomers data
-
-		fortran.skip(f)			# Detector Header & Data
-		if self.evol:
-			fortran.skip(f)		# TDecay
-		data = fortran.read(f)		# Detector data
-		f.close()
-		return data
+	def getShape(self, det, lowneu=False):
+		"""Return (mhigh, zhigh) shape of the residual nuclei data"""
+		det = self.detector[det]
+		return (det.mhigh, det.zhigh)
 
 	# ----------------------------------------------------------------------
 	# Read detector isomeric data
@@ -275,30 +333,9 @@ class Resnuclei(Usrxxx):
 	def readIso(self, n):
 		"""Read detector det data structure"""
 		#print "self.nisomers:", self.nisomers
-		if self.nisomers < 0: return None
-		f = open(self.file, "rb")
-		fortran.skip(f)
-		if self.evol:
-			fortran.skip(f)
-
-		for i in range(n):
-			fortran.skip(f)		# Detector Header & Data
-			if self.evol:
-				fortran.skip(f) # TDecay
-			fortran.skip(f)		# Detector data
-			if self.nisomers:
-				fortran.skip(f) # Isomers header
-				fortran.skip(f) # Isomers data
-		fortran.skip(f)
-		if self.evol:
-			fortran.skip(f) # TDecay
-		fortran.skip(f)		# Detector data
-		isohead = fortran.read(f) # Isomers header
-		data = fortran.read(f)	  # Isomers data
-		#print "isohead:",len(isohead)
-		header = struct.unpack("=10xi", isohead)
-		#print "isohead:",header[0]
-		f.close()
+		if self.nisomers <= 0 or self.detector[n].isopos < 0: return None
+		isohead = self.readRecord(self.detector[n].isopos) # Isomers header
+		data = fortran.read(self.hnd)	  # Isomers data
 		return (isohead, data)
 
 	# ----------------------------------------------------------------------
@@ -307,18 +344,8 @@ class Resnuclei(Usrxxx):
 	def readStat(self, n):
 		"""Read detector det statistical data"""
 		if self.statpos < 0: return None
-		f = open(self.file,"rb")
-		f.seek(self.statpos)
-
-		f.seek(self.statpos)
-		if self.nisomers:
-			nskip = 7*n
-		else:
-			nskip = 6*n
-		for i in range(nskip):
-			fortran.skip(f)	# Detector Data
-
-		total = fortran.read(f)
+		total = self.readRecord(self.detector[n].statpos)
+		f = self.hnd
 		A     = fortran.read(f)
 		errA  = fortran.read(f)
 		Z     = fortran.read(f)
@@ -328,7 +355,6 @@ class Resnuclei(Usrxxx):
 			iso = fortran.read(f)
 		else:
 			iso = None
-		f.close()
 		return (total, A, errA, Z, errZ, data, iso)
 
 	# ----------------------------------------------------------------------
@@ -359,9 +385,9 @@ class Usrbdx(Usrxxx):
 		"""Read boundary crossing detector information"""
 		f = Usrxxx.readHeader(self, filename)
 
-		for i in range(1000):
+		while True:
 			# Header
-			data = fortran.read(f)
+			data = f.read()
 			if data is None: break
 			size = len(data)
 
@@ -377,11 +403,13 @@ class Usrbdx(Usrxxx):
 				#   7: Double differential data
 				self.statpos = f.tell()
 				for det in self.detector:
-					data = unpackArray(fortran.read(f))
+					data = unpackArray(f.read())
 					det.total = data[0]
 					det.totalerror = data[1]
-					for j in range(6):
-						fortran.skip(f)
+					for j in range(5):
+						f.skip()
+					det.statpos = f.tell()
+					f.skip()
 				break
 			if size != 78: raise IOError("Invalid USRBDX file")
 
@@ -411,53 +439,26 @@ class Usrbdx(Usrxxx):
 			self.detector.append(det)
 
 			if det.lowneu:
-				data = fortran.read(f)
+				data = f.read()
 				det.ngroup = struct.unpack("=i",data[:4])[0]
 				det.egroup = struct.unpack("=%df"%(det.ngroup+1), data[4:])
 			else:
 				det.ngroup = 0
 				det.egroup = []
 
+			det.datapos = f.tell()
+			det.statpos = -1
 			size  = (det.ngroup+det.ne) * det.na * 4
-			if size != fortran.skip(f):
+			if size != f.skip():
 				raise IOError("Invalid USRBDX file")
 		f.close()
+		return self.hnd
 
 	# ----------------------------------------------------------------------
-	# Read detector data
-	# ----------------------------------------------------------------------
-	def readData(self, n):
-		"""Read detector n data structure"""
-		f = open(self.file, "rb")
-		fortran.skip(f)
-		for i in range(n):
-			fortran.skip(f)		# Detector Header
-			if self.detector[i].lowneu: fortran.skip(f)	# Detector low enetry neutron groups
-			fortran.skip(f)		# Detector data
-
-		fortran.skip(f)		# Detector Header
-		if self.detector[n].lowneu: fortran.skip(f)	# Detector low enetry neutron groups
-		data = fortran.read(f)	# Detector data
-		f.close()
-		return data
-
-	# ----------------------------------------------------------------------
-	# Read detector statistical data
-	# ----------------------------------------------------------------------
-	def readStat(self, n):
-		"""Read detector n statistical data"""
-		if self.statpos < 0: return None
-		f = open(self.file,"rb")
-		f.seek(self.statpos)
-		for i in range(n):
-			for j in range(7):
-				fortran.skip(f)	# Detector Data
-
-		for j in range(6):
-			fortran.skip(f)	# Detector Data
-		data = fortran.read(f)
-		f.close()
-		return data
+	def getShape(self, det, lowneu=False):
+		"""Return (na, ne) shape of the data, or (na, ngroup) of the low energy neutrons"""
+		det = self.detector[det]
+		return (det.na, det.ngroup if lowneu else det.ne)
 
 	# ----------------------------------------------------------------------
 	def say(self, det=None):
@@ -494,15 +495,18 @@ class Usrbin(Usrxxx):
 		"""Read USRBIN detector information"""
 		f = Usrxxx.readHeader(self, filename)
 
-		for i in range(1000):
+		while True:
 			# Header
-			data = fortran.read(f)
+			data = f.read()
 			if data is None: break
 			size = len(data)
 
 			# Statistics are present?
-			if size == 14 and data[:10] == "STATISTICS":
+			if size == 14 and data[:10] == b"STATISTICS":
 				self.statpos = f.tell()
+				for bin in self.detector:
+					bin.statpos = f.tell()
+					f.skip()
 				break
 			if size != 86: raise IOError("Invalid USRBIN file")
 
@@ -550,39 +554,38 @@ class Usrbin(Usrxxx):
 
 			self.detector.append(bin)
 
+			bin.datapos = f.tell()
+			bin.statpos = -1
 			size  = bin.nx * bin.ny * bin.nz * 4
-			if fortran.skip(f) != size:
+			if f.skip() != size:
 				raise IOError("Invalid USRBIN file")
 		f.close()
+		return self.hnd
 
 	# ----------------------------------------------------------------------
-	# Read detector data
-	# ----------------------------------------------------------------------
-	def readData(self, n):
-		"""Read detector det data structure"""
-		f = open(self.file, "rb")
-		fortran.skip(f)
-		for i in range(n):
-			fortran.skip(f)		# Detector Header
-			fortran.skip(f)		# Detector data
-		fortran.skip(f)		# Detector Header
-		data = fortran.read(f)	# Detector data
-		f.close()
-		return data
+	def getShape(self, det, lowneu=False):
+		"""Return (nz, ny, nx) shape of the data, i.e. x is the fastest index"""
+		bin = self.detector[det]
+		return (bin.nz, bin.ny, bin.nx)
 
 	# ----------------------------------------------------------------------
-	# Read detector statistical data
+	# Region of interest
 	# ----------------------------------------------------------------------
-	def readStat(self, n):
-		"""Read detector n statistical data"""
-		if self.statpos < 0: return None
-		f = open(self.file,"rb")
-		f.seek(self.statpos)
-		for i in range(n):
-			fortran.skip(f)	# Detector Data
-		data = fortran.read(f)
-		f.close()
-		return data
+	def getSlice(self, det, xlim=None, ylim=None, zlim=None):
+		"""Return the (z, y, x) tuple of slices selecting the bins which
+		overlap the given (low, high) coordinate ranges, e.g.
+		data, err = usr.array(det)
+		box = data[usr.getSlice(det, xlim=(-10,10), zlim=(100,200))]
+		"""
+		bin = self.detector[det]
+		def axis(lim, low, d, n):
+			if lim is None: return slice(None)
+			i0 = max(0, int(math.floor((lim[0]-low)/d)))
+			i1 = min(n, int(math.ceil((lim[1]-low)/d)))
+			return slice(i0, max(i0, i1))
+		return (axis(zlim, bin.zlow, bin.dz, bin.nz),
+			axis(ylim, bin.ylow, bin.dy, bin.ny),
+			axis(xlim, bin.xlow, bin.dx, bin.nx))
 
 	# ----------------------------------------------------------------------
 	def say(self, det=None):
@@ -603,6 +606,103 @@ class Usrbin(Usrxxx):
 			say("b2     : ", bin.b2)
 			say("tc     : ", bin.tc)
 
+#===============================================================================
+# Usrtrack/Usrcoll detector
+#===============================================================================
+class Usrtrack(Usrxxx):
+	# ----------------------------------------------------------------------
+	# Read information from a USRTRACK/USRCOLL file (produced by ustsuw)
+	# Fill the self.detector structure
+	# ----------------------------------------------------------------------
+	def readHeader(self, filename):
+		"""Read track-length/collision detector information"""
+		f = Usrxxx.readHeader(self, filename)
+
+		while True:
+			data = f.read()
+			if data is None: break
+			size = len(data)
+
+			# Statistics are present?
+			if size == 14 and data[:10] == b"STATISTICS":
+				# In statistics
+				#   1: total, error
+				#   2: N,NG,Elow (array with Emaxi)
+				#   3: Differential integrated over energy
+				#   4: -//- errors (in decreasing energy order)
+				#   5: Cumulative
+				#   6: -//- errors
+				self.statpos = f.tell()
+				for det in self.detector:
+					data = unpackArray(f.read())
+					det.total = data[0]
+					det.totalerror = data[1]
+					for j in range(2):
+						f.skip()
+					det.statpos = f.tell()
+					for j in range(3):
+						f.skip()
+				break
+
+			if size != 50: raise IOError("Invalid USRTRACK/USRCOLL file")
+
+			header = struct.unpack("=i10siiififfif", data)
+
+			det = Detector()
+			det.nb     = header[ 0]
+			det.name   = header[ 1].strip() # titutc - track/coll name
+			det.type   = header[ 2]		# itustc - type of binning: 1 - linear energy etc
+			det.dist   = header[ 3]		# idustc = distribution to be scored
+			det.reg    = header[ 4]		# nrustc = region
+			det.volume = header[ 5]		# vusrtc = volume (cm**3) of the detector
+			det.lowneu = header[ 6]		# llnutc = low energy neutron flag
+			det.elow   = header[ 7]		# etclow = minimum energy [GeV]
+			det.ehigh  = header[ 8]		# etchgh = maximum energy [GeV]
+			det.ne     = header[ 9]		# netcbn = number of energy intervals
+			det.de     = header[10]		# detcbn = energy bin width
+
+			self.detector.append(det)
+
+			if det.lowneu:
+				data = f.read()
+				det.ngroup = struct.unpack("=i",data[:4])[0]
+				det.egroup = struct.unpack("=%df"%(det.ngroup+1), data[4:])
+			else:
+				det.ngroup = 0
+				det.egroup = []
+
+			det.datapos = f.tell()
+			det.statpos = -1
+			size  = (det.ngroup+det.ne) * 4
+			if size != f.skip():
+				raise IOError("Invalid USRTRACK file")
+		f.close()
+		return self.hnd
+
+	# ----------------------------------------------------------------------
+	def getShape(self, det, lowneu=False):
+		"""Return (ne,) shape of the data, or (ngroup,) of the low energy neutrons"""
+		det = self.detector[det]
+		return (det.ngroup if lowneu else det.ne,)
+
+	# ----------------------------------------------------------------------
+	def say(self, det=None):
+		"""print header/detector information"""
+		if det is None:
+			self.sayHeader()
+		else:
+			det = self.detector[det]
+			say("Track  : ", det.nb)
+			say("Title  : ", det.name)
+			say("Type   : ", det.type)
+			say("Dist   : ", det.dist)
+			say("Region : ", det.reg)
+			say("Volume : ", det.volume)
+			say("LowNeu : ", det.lowneu)
+			say("Energy : [", det.elow,"..",det.ehigh,"] ne=", det.ne, "de=",det.de)
+			if det.lowneu:
+				say("LOWNeut : [",det.egroup[-1],"..",det.egroup[0],"] ne=",det.ngroup)
+
 #===============================================================================
 # MGDRAW output
 #===============================================================================
@@ -726,104 +826,142 @@ class Data1D:
 # Tablis format
 #===============================================================================
 def tabLis(filename, detector, block=-1):
-	f = open(filename,'r')
-	raw_data = f.read()				# read whole file as a single line
-	f.close()
-
-	#raw_data = raw_data.split(' # Detector n:  ')	# split in to chunks (detector data)
-	#if raw_data[0] == '':
-	#	del raw_data[0]				# delete blank header
-
-	dataset = raw_data.split('\n\n\n')
-
-	if block != -1:
-		datablock = dataset[detector].split('\n\n')
-		part = StringIO(datablock[block])
-	else:
-		part = StringIO(dataset[detector])
-
-	name = part.readline().split()[1]
-
-	# use the fact that it's a file object to make reading the data easy
-	x_bin_min, x_bin_max, x_vals, x_err = numpy.loadtxt(part, unpack=True)
-	return name, x_bin_min, x_bin_max, x_vals, x_err  # return the columns and detector name
+	"""Return the name and the first four columns (bin min, bin max, value, error)
+	of the block (the first one if -1) of the detector from a _tab.lis file"""
+	tab = _tabLisCache.get(filename)
+	if tab is None or tab.isModified():
+		tab = _tabLisCache[filename] = TabLis(filename)
+	data = tab.readData(detector, max(block,0))
+	x_bin_min, x_bin_max, x_vals, x_err = data.T[:4]
+	return tab.detector[detector].name, x_bin_min, x_bin_max, x_vals, x_err
 
+#===============================================================================
+# Index of the detectors and blocks of a _tab.lis file
+# Detectors are separated by two blank lines and start with the "# Detector n:"
+# line, blocks are separated by one blank line. The file is scanned once and
+# each block is read with one seek and parsed by numpy.
 #===============================================================================
 class TabLis:
-	def __init__(self, filename):
+	def __init__(self, filename=None):
 		self.filename = filename
+		self.detector = []
+		self.stat     = None
+		if filename is not None: self.read()
+
+	# ----------------------------------------------------------------------
+	def __len__(self):
+		return len(self.detector)
 
 	# ----------------------------------------------------------------------
-	def read(self, filename=None): #, onlyheader=True):
+	def isModified(self):
+		"""Return True if the file changed since it was indexed"""
+		try: st = os.stat(self.filename)
+		except OSError: return True
+		return self.stat != (st.st_size, st.st_mtime)
+
+	# ----------------------------------------------------------------------
+	def read(self, filename=None):
+		"""Scan the file and build the list of detectors. Each detector has
+		the name, the header lines and the list of blocks with their name,
+		header lines, number of columns and [start,end) byte offsets of data"""
 		if filename is not None: self.filename = filename
 
-		self.data = []
+		self.detector = []
 
-		try: f = open(self.filename,"r")
+		try: f = open(self.filename,"rb")
 		except IOError: return None
 
-		det	= 0
-		ind	= 1
-		half	= 0
-		block	= 1
-		lastind = 0
-
-		name  = "Detector"
-		blockname = ""
-		blockspresent = False
+		st = os.fstat(f.fileno())
+		self.stat = (st.st_size, st.st_mtime)
 
-		first = None
+		det    = None
+		block  = None	# block being read
+		header = []	# comment lines before the data of the next block
+		blank  = 0
+		pos    = 0
 		for line in f:
-			#line = line.strip()
-			if line=="\n":
-				half += 1
-				if half == 2:
-					half = 0
-					ind += 1
-
-			elif line.find("#")>=0:
+			start = pos
+			pos  += len(line)
+			line  = line.decode(errors="replace")
+			if not line.strip():
+				blank += 1
+				block  = None
+				continue
+
+			if blank >= 2 or det is None:
+				det = self._newDetector()
+				header = []
+			blank = 0
+
+			if line.lstrip().startswith("#"):
 				m = _detectorPattern.match(line)
 				if m:
+					if det.blocks or det.header:
+						det = self._newDetector()
+					header = []
 					name = m.group(1)
 					p = name.find("(")
 					if p>0: name = name[:p]
-					name = name.strip()
-					entry = "%d %s"%(ind, name)
-					self.det.insert(END, entry)
-					lastind = ind
-					if not first:
-						first = entry
-					half  = 0
-					block = 0
-					blockspresent = False
+					det.name = name.strip()
+					det.header.append(line.strip()[1:].strip())
 					continue
+				block = None
+				header.append(line.strip()[1:].strip())
+				continue
+
+			if block is None:
+				block = Detector()
+				block.name   = ""
+				block.header = header
+				for h in header:
+					m = _blockPattern.match("# "+h)
+					if m: block.name = m.group(1).strip()
+				block.ncols  = len(line.split())
+				block.start  = start
+				header = []
+				det.blocks.append(block)
+			block.end = pos
+		f.close()
 
+		for i,det in enumerate(self.detector):
+			if not det.name: det.name = "Detector%d"%(i+1)
+		return self.detector
 
-				m = _blockPattern.match(line)
-				if m:
-					blockname = m.group(1)
-					blockspresent = True
-					half = 1
-					continue
+	# ----------------------------------------------------------------------
+	def _newDetector(self):
+		det = Detector()
+		det.name   = ""
+		det.header = []
+		det.blocks = []
+		self.detector.append(det)
+		return det
 
-				if lastind != ind:
-					self.det.insert(END, "%d %s"%(ind,line[1:].strip()))
-					lastind = ind
+	# ----------------------------------------------------------------------
+	def readData(self, n, block=0):
+		"""Return the 2D array of the numeric columns of the block of detector n"""
+		b = self.detector[n].blocks[block]
+		with open(self.filename,"rb") as f:
+			f.seek(b.start)
+			raw = f.read(b.end-b.start).decode()
+		data = numpy.fromstring(raw, sep=" ")
+		if b.ncols == 0 or len(data) % b.ncols:
+			data = numpy.loadtxt(StringIO(raw), ndmin=2)
+		return data.reshape(-1, b.ncols)
 
-			else:
-				if half == 1:
-					block += 1
-#					if blockname != "":
-#						self.det.insert(END, "%d-%d %s %s"%(ind,block,name,blockname))
-#						lastind = ind
-#					elif not blockspresent:
-##						self.det.insert(END, "%d-%d %s ?"%(ind,block,name))
-#						lastind = ind
-#					blockname = ""
-				half = 0
-		f.close()
-#		if first:
-#			self.det.set(first)
+	# ----------------------------------------------------------------------
+	def say(self, n=None):
+		"""print detector information"""
+		if n is None:
+			say("File    : ",self.filename)
+			say("Detectors: ",len(self.detector))
+			return
+		det = self.detector[n]
+		say("Det     : ",det.name)
+		for h in det.header: say("        : ",h)
+		for i,b in enumerate(det.blocks):
+			say("Block %d : %s columns=%d bytes=[%d,%d)"%(i,b.name,b.ncols,b.start,b.end))
+
+_tabLisCache = {}
 
 #===============================================================================
 if __name__ == "__main__":
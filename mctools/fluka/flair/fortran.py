@@ -38,6 +38,8 @@
 __author__ = "Vasilis Vlachoudis"
 __email__  = "Vasilis.Vlachoudis@cern.ch"
 
+import io
+import mmap
 import struct
 
 #-------------------------------------------------------------------------------
@@ -80,3 +82,147 @@ def write(f, d):
 	f.write(struct.pack("=i",len(d)))
 	f.write(d)
 	return f.write(struct.pack("=i",len(d)))
+
+#-------------------------------------------------------------------------------
+# Buffered reader of fortran records
+# The whole file is memory-mapped (or kept in memory for streams and bytes),
+# so the records are returned as memoryview slices without any copy or
+# system call. The byte order and the size of the record markers (4 or 8 bytes)
+# are detected from the first record unless given.
+#-------------------------------------------------------------------------------
+class Reader:
+	MARKERS = (("<",4), (">",4), ("<",8), (">",8))
+
+	def __init__(self, f, endian=None, marker=None):
+		self.file = None
+		self.mmap = None
+		if isinstance(f, (bytes, bytearray, memoryview)):
+			self.buf = f
+			self.pos = 0
+		else:
+			if isinstance(f, str):
+				f = self.file = open(f, "rb")
+			self.pos = f.tell()
+			try:
+				self.buf = self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+				# empty files and in-memory streams
+				f.seek(0)
+				self.buf = f.read()
+				f.seek(self.pos)
+		self.view = memoryview(self.buf)
+		self.size = len(self.view)
+		if endian is None or marker is None:
+			endian, marker = self.detect(endian, marker)
+		self.endian = endian
+		self.marker = marker
+		self.struct = struct.Struct(endian + ("i" if marker==4 else "q"))
+
+	# ----------------------------------------------------------------------
+	def detect(self, endian=None, marker=None):
+		"""Return (endian, marker size) whose leading and trailing markers
+		of the first record match, native 4-byte markers if undecidable"""
+		for e,m in self.MARKERS:
+			if endian not in (None, e) or marker not in (None, m): continue
+			if self.pos + 2*m > self.size: continue
+			fmt = e + ("i" if m==4 else "q")
+			(n,) = struct.unpack_from(fmt, self.view, self.pos)
+			end = self.pos + m + n
+			if n >= 0 and end + m <= self.size and \
+			   struct.unpack_from(fmt, self.view, end)[0] == n:
+				return e,m
+		return (endian or "="), (marker or 4)
+
+	# ----------------------------------------------------------------------
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def __iter__(self):
+		while True:
+			data = self.read()
+			if data is None: return
+			yield data
+
+	# ----------------------------------------------------------------------
+	def close(self):
+		self.view.release()
+		if self.mmap is not None:
+			try: self.mmap.close()
+			except BufferError: pass	# records still referenced
+		if self.file is not None:
+			self.file.close()
+
+	# ----------------------------------------------------------------------
+	def tell(self):
+		return self.pos
+
+	def seek(self, pos):
+		self.pos = pos
+
+	# ----------------------------------------------------------------------
+	# @return (payload offset, size) of the record at pos, None for EOF
+	# ----------------------------------------------------------------------
+	def header(self, pos):
+		if pos >= self.size: return None
+		m = self.marker
+		if pos + m > self.size:
+			raise IOError("Reading fortran block at byte %d"%(pos))
+		(n,) = self.struct.unpack_from(self.view, pos)
+		end = pos + m + n
+		if n < 0 or end + m > self.size or \
+		   self.struct.unpack_from(self.view, end)[0] != n:
+			raise IOError("Reading fortran block at byte %d"%(pos))
+		return pos+m, n
+
+	# ----------------------------------------------------------------------
+	# Read the next record
+	# @return memoryview of the data, None for EOF
+	# ----------------------------------------------------------------------
+	def read(self):
+		h = self.header(self.pos)
+		if h is None: return None
+		start, n = h
+		self.pos = start + n + self.marker
+		return self.view[start:start+n]
+
+	# ----------------------------------------------------------------------
+	# Skip the next record
+	# @return size, 0 for EOF
+	# ----------------------------------------------------------------------
+	def skip(self):
+		h = self.header(self.pos)
+		if h is None: return 0
+		self.pos = h[0] + h[1] + self.marker
+		return h[1]
+
+	# ----------------------------------------------------------------------
+	# Read the next record into the preallocated writable buffer b
+	# (bytearray, numpy array...)
+	# @return size, 0 for EOF
+	# ----------------------------------------------------------------------
+	def readinto(self, b):
+		data = self.read()
+		if data is None: return 0
+		out = memoryview(b).cast("B")
+		if len(out) < len(data):
+			raise IOError("Buffer of %d bytes is too small for the fortran block of %d bytes"%(len(out),len(data)))
+		out[:len(data)] = data
+		return len(data)
+
+	# ----------------------------------------------------------------------
+	# Scan the record markers from the current position without moving it
+	# @param n	maximum number of records, all if None
+	# @return list of (payload offset, size) of the records
+	# ----------------------------------------------------------------------
+	def records(self, n=None):
+		out = []
+		pos = self.pos
+		while n is None or len(out) < n:
+			h = self.header(pos)
+			if h is None: break
+			out.append(h)
+			pos = h[0] + h[1] + self.marker
+		return out
@@ -4,11 +4,12 @@
 
 from __future__ import print_function
 import sys, math, struct
-from mctools.mcnp.ssw import fortranRead
+import numpy as np
+from mctools.fluka.flair import fortran
 
 def sr2deg(val):
-    """Converts steradians to degrees"""
-    return math.acos(max([1.0-val/math.pi/2.0, -1.0])) * 180.0/math.pi;
+    """Converts steradians to degrees (works on scalars and arrays)"""
+    return np.degrees(np.arccos(np.maximum(1.0-np.asarray(val)/math.pi/2.0, -1.0)))
 
 
 class USRBDXCARD:
@@ -53,6 +54,8 @@ class USRBDXCARD:
         self.totresp = 0  # total responce
         self.totresperr = 0  # total responce error
 
+        self.aedges = None # cached (binning, edges [sr], edges [deg]) of the angular bins
+
     def isOneWay(self):
         return not self.lwusbx
 
@@ -65,52 +68,73 @@ class USRBDXCARD:
     def getNEbinsTotal(self):
         return self.nebxbn + self.igmusx
 
-    def getALowEdge(self):
-        """Return solid angle lower edges vector"""
-        vec = []
-        val = 0
-        for ia in range(self.nabxbn+1):
+    def getAEdges(self):
+        """Return the cached (edges [sr], edges [deg]) arrays of the angular bins, computed once per binning"""
+        binning = (self.itusbx, self.abxlow, self.dabxbn, self.nabxbn)
+        if self.aedges is None or self.aedges[0] != binning:
+            ia = np.arange(self.nabxbn+1)
             if abs(self.itusbx)<=1: # linear in angle
-                val = self.abxlow + ia*self.dabxbn
-                vec.append(val)
-            else: # logarithmic in angle
-                if ia==0: # first bin
-                    vec.append(0.0) # see note 2 for USRBDX on page 237
-                    val = self.abxlow
-                    vec.append(val)
-                else:
-                    if ia!=self.nabxbn:
-                        val = self.abxlow*pow(self.dabxbn, ia)
-                        vec.append(val)
-        return vec
+                vec = self.abxlow + ia*self.dabxbn
+            else: # logarithmic in angle, the first edge is 0: see note 2 for USRBDX on page 237
+                vec = np.concatenate(([0.0], self.abxlow*np.power(self.dabxbn, ia[:-1])))
+            vec = np.asarray(vec, dtype=np.float64)
+            self.aedges = (binning, vec, sr2deg(vec))
+        return self.aedges[1:]
 
-    def getData(self, ie, ia, unit, lowneut=False):
+    def getALowEdge(self):
+        """Return solid angle edges vector [sr]"""
+        return self.getAEdges()[0]
+
+    def getALowEdgeDeg(self):
+        """Return angular edges vector [deg]"""
+        return self.getAEdges()[1]
+
+    def getDegFactor(self):
+        """Return the per-sr to per-deg conversion factors of the angular bins"""
+        sr, deg = self.getAEdges()
+        return np.diff(sr) / np.diff(deg)
+
+    def getLayout(self, lowneut=False):
+        """Return (number of energy bins, offset) of the high energy data or of the low energy neutron groups in gdstor.
+        The low energy neutron groups of all angular bins follow the high energy data"""
+        if lowneut:
+            return self.igmusx, self.nebxbn*self.nabxbn
+        return self.nebxbn, 0
+
+    def getValues(self, unit='sr', lowneut=False):
         """
-        Return a list of 
-        data (above low energy neutrons) in energy bin ie and angular bin ia
+        Return the (ne, na) arrays of data and their relative errors
         unit == sr:  [Part/sr/GeV/cmq/pr]
         unit == deg: [Part/deg/GeV/cmq/pr]
-        and its relative error
         if lowneut = False then return high energy data (default)
         if lowneut = True then return low energy neutron data
         """
-
-        if lowneut:
-            y = ie + ia*self.igmusx 
-            val = self.gdstor[y]  # !!! FIX THIS !!!
-            err = self.gbstor[y]
-#            print("ie,ia,y, val,err", ie, ia, y, val, err)
-            val /= self.engmax[y-1]-self.engmax[y]
+        n, offset = self.getLayout(lowneut)
+        shape = (self.nabxbn, n)
+        val = np.asarray(self.gdstor[offset:offset+n*self.nabxbn], dtype=np.float64).reshape(shape).T
+        if len(self.gbstor):
+            err = np.asarray(self.gbstor[offset:offset+n*self.nabxbn], dtype=np.float64).reshape(shape).T
         else:
-            y = ie + ia*self.nebxbn 
-            val = self.gdstor[y]
-            err = self.gbstor[y]
+            err = np.zeros(val.shape)
+        if unit == 'sr':
+            return val, err
+        elif unit == 'deg':
+            return val * self.getDegFactor(), err
+        else: raise IOError("unit %s is not supported" % unit)
 
+    def getData(self, ie, ia, unit, lowneut=False):
+        """
+        Return data in energy bin ie and angular bin ia and its relative error
+        (see getValues for the units)
+        """
+        n, offset = self.getLayout(lowneut)
+        y = offset + ie + ia*n
+        val = float(self.gdstor[y])
+        err = float(self.gbstor[y])
         if unit == 'sr':
             return val,err
         elif unit == 'deg':
-            vec = self.getALowEdge()
-            return val * (vec[ia+1]-vec[ia]) / (sr2deg(vec[ia+1])-sr2deg(vec[ia])), err
+            return val * self.getDegFactor()[ia], err
         else: raise IOError("unit %s is not supported" % unit)
 
 
@@ -164,11 +188,11 @@ class USRBDXCARD:
             print("\n\tLowest boundary (GeV):", self.engmax[i])
             print(self.igmusx)
 #            print("here", len(self.gbstor), len(self.gdstor), self.nabxbn)
-            print("\n\tFlux (Part/GeV/cmq/pr): (!!! SOMETHING IS WRONG WITH VALUE NORMALISATION HERE (not divided by energy?), BUT ERRORS ARE OK !!!)\n\t", end='')
+            print("\n\tFlux (Part/deg/GeV/cmq/pr):\n\t", end='')
+            val, err = self.getValues('deg', True)
             for ie in range(self.igmusx):
                 for ia in range(self.nabxbn):
-                    val = self.getData(ie+1, ia, 'deg', True)
-                    PrintVE(val[0], 100*val[1], (ie+1)%2)
+                    PrintVE(val[ie,ia], 100*err[ie,ia], (ie+1)%2)
                 
 
         print("\n\t**** Cumulative Fluxes as a function of energy ****", end='')
@@ -203,23 +227,23 @@ class USRBDXCARD:
             for i, val in enumerate(alowedges[1:], 1):
                 PrintV(val, i%5)
 
-            alowedgesdeg = map(sr2deg, alowedges)
+            alowedgesdeg = self.getALowEdgeDeg()
             print("\n\tAngular minimum value (deg.): ", alowedgesdeg[0])
             print("\tAngular upper boundaries (deg.):\n\t", end='')
             for i,val in enumerate(alowedgesdeg[1:], 1):
                 PrintV(val, i%5)
 
         # high-energy part
+            valsr, err = self.getValues('sr')
+            valdeg = valsr * self.getDegFactor()
             for ie in range(self.nebxbn):
                 print("\n\tEnergy interval (GeV): %e %e" % (self.epgmax[ie], self.epgmax[ie+1]))
                 print("\tFlux (Part/sr/GeV/cmq/pr):\n\t", end='')
                 for ia in range(self.nabxbn):
-                    val = self.getData(self.nebxbn-ie-1, ia, 'sr')
-                    PrintVE(val[0], 100*val[1], (ia+1)%2)
+                    PrintVE(valsr[self.nebxbn-ie-1,ia], 100*err[self.nebxbn-ie-1,ia], (ia+1)%2)
                 print("Flux (Part/deg/GeV/cmq/pr):\n\t", end='')
                 for ia in range(self.nabxbn):
-                    val = self.getData(self.nebxbn-ie-1, ia, 'deg')
-                    PrintVE(val[0], 100*val[1], (ia+1)%2)
+                    PrintVE(valdeg[self.nebxbn-ie-1,ia], 100*err[self.nebxbn-ie-1,ia], (ia+1)%2)
 
 
         # low-energy part
@@ -251,8 +275,8 @@ class USXSUW:
         self.ubsarray = []   # array ob USRBDXCARD objects
         self.nrecords = 0    # number of USRBDX cards
 
-        self.file = open(self.fname, "rb")
-        data = fortranRead(self.file)
+        self.file = fortran.Reader(self.fname, "=", 4) # buffered, the records are memoryviews of the mapped file
+        data = self.file.read()
         if data is None: raise IOError("Invalid USXSUW file")
 
         self.title, self.time, self.wctot, self.nctot, self.mctot, self.mbatch = struct.unpack("=80s32s1f3i", data)
@@ -263,12 +287,7 @@ class USXSUW:
 
     def checkStatFlag(self, data):
         """Checks whether data == 'STATISTICS'"""
-        s = 'STATISTICS'
-        l = len(data)
-        if l == 14:
-            val = struct.unpack("=10s4s", data)
-            if val[0] == s: return True
-        else: return False
+        return data is not None and len(data) == 14 and data[:10] == b'STATISTICS'
 
 
     def Read(self):
@@ -276,7 +295,7 @@ class USXSUW:
         record = 0
         while True:
             ubs = USRBDXCARD()
-            data = fortranRead(self.file)
+            data = self.file.read()
             if self.checkStatFlag(data): break
 
             ubs.nx, ubs.titusx, ubs.itusbx, ubs.idusbx, ubs.nr1usx, ubs.nr2usx, ubs.ausbdx, ubs.lwusbx, ubs.lfusbx, ubs.llnusx, ubs.ebxlow, ubs.ebxhgh, ubs.nebxbn, ubs.debxbn, ubs.abxlow, ubs.abxhgh, ubs.nabxbn, ubs.dabxbn  = struct.unpack("=1i10s4i1f3i2f1i1f2f1i1f", data)
@@ -284,16 +303,14 @@ class USXSUW:
             ubs.lwusbx, ubs.lfusbx, ubs.llnusx = map(bool, (ubs.lwusbx, ubs.lfusbx, ubs.llnusx))
 
             if (ubs.llnusx): # if low energy neutrons
-                data = fortranRead(self.file)
-                l = (len(data)-4)/4
-                vtmp = struct.unpack("=i%df" % l, data)
-                ubs.igmusx = vtmp[0] # number of groups
-                ubs.engmax = vtmp[1:]
+                data = self.file.read()
+                ubs.igmusx = struct.unpack("=i", data[:4])[0] # number of groups
+                ubs.engmax = np.frombuffer(data, dtype="=f4", offset=4)
             else:
                 ubs.igmusx = 0
 
-            data = fortranRead(self.file)
-            ubs.gdstor = struct.unpack("=%df" % ubs.getNbinsTotal(), data)
+            data = self.file.read()
+            ubs.gdstor = np.frombuffer(data, dtype="=f4", count=ubs.getNbinsTotal())
             record += 1
             self.ubsarray.append(ubs)
 
@@ -301,41 +318,29 @@ class USXSUW:
         print(self.nrecords, "USRBDX cards found")
 
         for record in range(self.nrecords):
-            data = fortranRead(self.file)
+            data = self.file.read()
             ubs = self.ubsarray[record]
             ubs.totresp, ubs.totresperr = struct.unpack("=2f", data)
 #            print(ubs.igmusx)
-            data = fortranRead(self.file)
+            data = self.file.read()
 #            print("here:", len(data)/4,  ubs.nebxbn+ubs.igmusx, ubs.getNbinsTotal())
-            vtmp = struct.unpack("=2i2f%df" % ubs.getNEbinsTotal(), data)
-            print("check:")
-            if vtmp[0] != ubs.nebxbn: raise IOError("nebxbn record is wrong")
-            if vtmp[1] != ubs.igmusx: raise IOError("igmusx record is wrong")
-            print("emin, emax:", vtmp[2], vtmp[3]) # !!! maybe not only these 2 records are written when more than 1 user interval ???
-            ubs.epgmax = vtmp[3:][:]
-
-            data = fortranRead(self.file)
-            ubs.flux = struct.unpack("=%df" % ubs.getNEbinsTotal(), data)
-#            print(ubs.flux[1:10])
-#            print(ubs.gdstor[1:10])
-
-            data = fortranRead(self.file)
-            ubs.fluxerr = struct.unpack("=%df" % ubs.getNEbinsTotal(), data)
-
-            data = fortranRead(self.file)
-            ubs.cumulflux = struct.unpack("=%df" % ubs.getNEbinsTotal(), data)
+            nebxbn, igmusx = struct.unpack("=2i", data[:8])
+            if nebxbn != ubs.nebxbn: raise IOError("nebxbn record is wrong")
+            if igmusx != ubs.igmusx: raise IOError("igmusx record is wrong")
+            ubs.epgmax = np.frombuffer(data, dtype="=f4", offset=8)[1:] # the lowest boundary is followed by the upper boundaries
 
-            data = fortranRead(self.file)
-            ubs.cumulfluxerr = struct.unpack("=%df" % ubs.getNEbinsTotal(), data)
+            for name in ("flux", "fluxerr", "cumulflux", "cumulfluxerr"):
+                data = self.file.read()
+                setattr(ubs, name, np.frombuffer(data, dtype="=f4", count=ubs.getNEbinsTotal()))
 
             if ubs.nabxbn:
-                data = fortranRead(self.file)
-                ubs.gbstor = struct.unpack("=%df" % ubs.getNbinsTotal(), data)
+                data = self.file.read()
+                ubs.gbstor = np.frombuffer(data, dtype="=f4", count=ubs.getNbinsTotal())
                 
 
 
         print("")
-        #data = fortranRead(self.file)
+        #data = self.file.read()
         #print(len(data))
 
         self.file.close()
@@ -2,8 +2,10 @@
 from __future__ import print_function
 import sys, re, os, argparse
 import glob
-import tempfile
+import tempfile, struct, importlib, hashlib, json
 from distutils.spawn import find_executable
+from concurrent.futures import ProcessPoolExecutor
+from mctools.fluka import flukamerge, usrascii
 
 def str2int(s):
     try:
@@ -12,6 +14,16 @@ def str2int(s):
         ret = int(float(s))
     return ret
 
+def getHash(files, options):
+    """ Return the SHA-1 digest of the given files content and options """
+    h = hashlib.sha1(repr(options).encode())
+    for fname in files:
+        h.update(os.path.basename(fname).encode())
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1<<20), b""):
+                h.update(block)
+    return h.hexdigest()
+
 def printincolor(s,col=33):
     """
     Print a string with a given color using ANSI/VT100 Terminal Control Escape Sequences
@@ -21,9 +33,10 @@ def printincolor(s,col=33):
 
 
 class Estimator:
-    def __init__(self, name, converter):
+    def __init__(self, name, converter, module=None):
         self.name = name
-        self.converter = converter
+        self.converter = converter # merge tool
+        self.module = module if module else converter+"2root" # ROOT converter module
         self.units = {} # dictionary of units and corresponding files
 
     def addUnit(self, u):
@@ -45,18 +58,22 @@ class Estimator:
         return self.name+" "+self.converter+" "+str(self.units)
 
 class Converter:
-    def __init__(self, inp, overwrite, verbose):
+    def __init__(self, inp, overwrite, verbose, flutil=False, workers=None, incremental=False):
         self.inp        = inp # all input files
-        self.overwrite  = overwrite
+        self.overwrite  = overwrite or incremental
+        self.incremental = incremental # reuse histograms of the units with unchanged input
         self.verbose    = verbose
+        self.flutil     = flutil  # merge with the FLUKA tools from $FLUTIL
+        self.workers    = workers # number of worker processes (number of CPUs if None)
         self.parallel   = find_executable("parallel") is not None
         self.estimators = [Estimator("USRBIN",   "usbsuw"),
                            Estimator("USRBDX",   "usxsuw"),
-                           Estimator("USRTRACK", "ustsuw")]
+                           Estimator("USRTRACK", "ustsuw"),
+                           Estimator("RESNUCLE", "usrsuw", "resnuclei2root")]
         self.opened = {}         # dict of opened units (if any)
 
-        self.out_root_files = [] # list of output ROOT files
         self.datafiles = [] # list of data files (to delete)
+        self.manifest = {}  # unit key : {"hash" : input hash, "hists" : list of histogram names}
 
         # Generate the output root file name:
         self.root  = self.getROOTFileName()
@@ -158,7 +175,7 @@ class Converter:
                             unit = line[30:40]
                         unit = str2int(unit.strip())
                         name = line[70:80].strip()
-                        if unit<0: # we are interested in binary files only
+                        if unit<0 or e.name != "RESNUCLE": # formatted output is merged by usrascii
                             if not unit in e.units:
                                 e.addUnit(unit)
                         else:
@@ -175,18 +192,120 @@ class Converter:
                         if f not in e.units[u]: # TODO: this can be done smarter
                             e.addFile(u,f)
 
-    def Merge(self):
-        """ Merge all data with standard FLUKA tools
+    def getUnitKey(self, e, u):
+        """ Return the manifest key of the unit u of the estimator e """
+        return "%s %d" % (e.name, u)
+
+    def getManifestFileName(self):
+        """ Return the build manifest file name """
+        return self.basename + ".manifest.json"
+
+    def readManifest(self):
+        """ Return the manifest of the previous build, or empty dictionary if there is none """
+        try:
+            with open(self.getManifestFileName()) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def writeManifest(self):
+        with open(self.getManifestFileName(), "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+    def getReused(self, pool):
+        """ Hash the input of all units in the pool and return the set of
+        unit keys whose input is unchanged since the previous build.
+        ROOT is not imported here: the worker processes are started by the
+        jobs submitted later, so the presence of the histograms in the previous
+        output file is checked by checkReused after all jobs are submitted.
+        """
+        jobs = {}
+        for e in self.estimators:
+            for u in e.units:
+                options = (e.converter, self.flutil)
+                jobs[self.getUnitKey(e,u)] = pool.submit(getHash, sorted(e.units[u]), options)
+
+        old = self.readManifest() if os.path.isfile(self.root) else {}
+        reused = set()
+        for key, job in jobs.items():
+            self.manifest[key] = { "hash" : job.result(), "hists" : [] }
+            if key in old and old[key]["hash"] == self.manifest[key]["hash"]:
+                self.manifest[key]["hists"] = old[key]["hists"]
+                reused.add(key)
+        return reused
+
+    def checkReused(self, jobs):
+        """ Merge the reused units whose histograms are missing in the previous output file
+        (in this process since all jobs are submitted already) and return the updated list of jobs
+        """
+        import ROOT
+        fin = ROOT.TFile(self.root)
+        names = set(k.GetName() for k in fin.GetListOfKeys())
+        fin.Close()
+        checked = []
+        for e, u, suwfile, job in jobs:
+            key = self.getUnitKey(e,u)
+            if suwfile is None and not names.issuperset(self.manifest[key]["hists"]):
+                suwfile = self.getSuwFileName(e,u)
+                self.manifest[key]["hists"] = []
+                try:
+                    (usrascii.merge if u>0 else flukamerge.merge)(e.converter, sorted(e.units[u]), suwfile)
+                except (IOError, struct.error) as err:
+                    if u>0:
+                        self.skipFormatted(e, u, err)
+                        continue
+                    printincolor("Could not merge an estimator: %s" % err)
+                    sys.exit(2)
+            checked.append((e, u, suwfile, job))
+        if self.verbose:
+            print("Unchanged units:", " ".join(sorted(self.getUnitKey(e,u) for e, u, suwfile, job in checked if suwfile is None)))
+        return checked
+
+    def skipFormatted(self, e, u, err):
+        """ Warn that the formatted output of the unit u of the estimator e can't be read, so that the unit is skipped,
+        and remove the unit from the manifest to try it again at the next build
+        """
+        printincolor("Warning: unit %d of %s skipped: %s" % (u, e.name, err))
+        self.manifest.pop(self.getUnitKey(e,u), None)
+
+    def Merge(self, pool, reused=set()):
+        """ Submit merging of all units but the reused ones to the pool (or merge with standard FLUKA tools if flutil is set)
+        Return the list of (estimator, unit, merged file name, future) tuples,
+        future is None if merged already and the file name is None if the unit is reused
         """
         if self.verbose:
             print("Merging...")
 
+        if self.flutil:
+            self.MergeFLUTIL(reused)
+
+        jobs = []
+        for e in self.estimators:
+            for u in e.units:
+                if self.getUnitKey(e,u) in reused:
+                    jobs.append((e, u, None, None))
+                    continue
+                suwfile = self.getSuwFileName(e,u)
+                if self.verbose:
+                    print("unit=%d" % u, e.name, suwfile)
+                if u>0: # formatted output, the FLUKA tools can't merge it
+                    job = pool.submit(usrascii.merge, e.converter, sorted(e.units[u]), suwfile)
+                else:
+                    job = None if self.flutil else pool.submit(flukamerge.merge, e.converter, sorted(e.units[u]), suwfile)
+                jobs.append((e, u, suwfile, job))
+        return jobs
+
+    def MergeFLUTIL(self, reused=set()):
+        """ Merge all data but the reused units with standard FLUKA tools
+        """
         tmpfiles=[]
         for e in self.estimators:
             if not len(e.units):
                 continue
 
             for u in e.units:
+                if self.getUnitKey(e,u) in reused or u>0:
+                    continue
                 temp_path = tempfile.mktemp(".%s" % e.converter)
                 if self.verbose:
                     print("unit=%d" % u, e.name, temp_path)
@@ -203,6 +322,9 @@ class Converter:
 
                     tmpfiles.append(tmpfile.name)
 
+        if not tmpfiles:
+            return
+
         verbose = "" if self.verbose else ">/dev/null"
         if self.parallel:
             command="parallel --max-args=1 mc-tools-fluka-merge ::: " + " ".join(tmpfiles) + verbose
@@ -218,65 +340,80 @@ class Converter:
                     printincolor(command)
                 return_value = os.system(command)
                 if return_value:
-                    sys.exit(printincolor("Coult not convert an estimator"));
+                    printincolor("Could not convert an estimator")
+                    sys.exit(2)
 
         if not self.verbose:
             for f in tmpfiles:
                 os.unlink(f)
 
     def Convert(self):
-        """Convert merged files into ROOT
+        """Merge the units in a process pool and write all histograms into the single output ROOT file.
+        In the incremental mode the histograms of the unchanged units are copied from the previous output file.
         """
-        if self.verbose:
-            print("Converting...")
-
-        v = "-v" if self.verbose else ""
-
-        for e in self.estimators:
-            if not len(e.units):
-                continue
-
-            datafiles = []
-            for u in e.units:
-                suwfile = self.getSuwFileName(e,u)
-                rootfile = suwfile + ".root"
-                self.out_root_files.append(rootfile)
-                datafiles.append(suwfile)
-
-            if self.parallel:
-                command="parallel --max-args=1 %s2root %s {} ::: %s" % (e.converter,v,' '.join(datafiles))
-                if self.verbose:
-                    printincolor(command)
-                return_value = os.system(command)
-                if return_value:
-                    sys.exit(2)
-            else:
-                for u in e.units:
-                    suwfile = self.getSuwFileName(e,u)
-                    rootfile = suwfile + ".root"
-                    command = "%s2root %s %s %s" % (e.converter, v , suwfile, rootfile)
-                    if self.verbose:
-                        printincolor(command)
-                    return_value = os.system(command)
-                    if return_value:
-                        sys.exit(2)
-            self.datafiles.append(datafiles)
-
-        if self.verbose:
-            print("ROOT files produced: ", self.out_root_files)
-
-        f = "-f" if self.overwrite else ""
-        command = "hadd %s %s %s" % (f, self.root, ' '.join(self.out_root_files)) + ("" if self.verbose else " > /dev/null")
-        if self.verbose:
-            printincolor(command)
-        return_value = os.system(command)
-        if return_value is 0:
-            command = "rm -f %s %s" % (v, ' '.join(self.out_root_files + [item for sublist in self.datafiles for item in sublist]))
+        with ProcessPoolExecutor(self.workers) as pool:
+            reused = self.getReused(pool) if self.incremental else set()
+            jobs = self.Merge(pool, reused)
+
+            # ROOT is imported after all jobs are submitted, so it is not loaded in the worker processes
+            import ROOT
+            ROOT.PyConfig.IgnoreCommandLineOptions = True
+            if reused:
+                jobs = self.checkReused(jobs)
+                reused = set(self.getUnitKey(e,u) for e, u, suwfile, job in jobs if suwfile is None)
+            writers = dict((e.converter, importlib.import_module("mctools.fluka." + e.module).write) for e in self.estimators)
             if self.verbose:
-                printincolor(command)
-            return_value = os.system(command)
+                print("Converting...")
+
+            if reused:
+                os.rename(self.root, self.root + ".old")
+                fin = ROOT.TFile(self.root + ".old")
+            fout = ROOT.TFile(self.root, "recreate")
+            try:
+                for e, u, suwfile, job in jobs:
+                    key = self.getUnitKey(e,u)
+                    fout.cd()
+                    if suwfile is None:
+                        for name in self.manifest[key]["hists"]:
+                            fin.Get(name).Write(name)
+                        continue
+                    try:
+                        if job is not None:
+                            job.result()
+                        b = flukamerge.readers[e.converter](suwfile)
+                    except (IOError, struct.error) as err:
+                        if u>0: # formatted output which usrascii can't read, the other units are converted
+                            self.skipFormatted(e, u, err)
+                            continue
+                        printincolor("Could not merge an estimator: %s" % err)
+                        sys.exit(2)
+                    if self.verbose:
+                        print(suwfile, "->", self.root)
+                    keys = set(k.GetName() for k in fout.GetListOfKeys())
+                    writers[e.converter](b)
+                    if key in self.manifest:
+                        self.manifest[key]["hists"] = [k.GetName() for k in fout.GetListOfKeys() if k.GetName() not in keys]
+                    b.close()
+                    self.datafiles.append(suwfile)
+            except BaseException: # restore the previous output file
+                fout.Close()
+                if reused:
+                    fin.Close()
+                    os.rename(self.root + ".old", self.root)
+                raise
+            fout.Close()
+
+        if reused:
+            fin.Close()
+            os.unlink(self.root + ".old")
+
+        for f in self.datafiles:
+            os.unlink(f)
+
+        if self.incremental:
+            self.writeManifest()
 
-        return return_value
+        return 0
 
 def main():
     """fluka2root - a script to convert the output of some FLUKA estimators (supported by the mc-tools project) into a single ROOT file.
@@ -285,16 +422,16 @@ def main():
     parser = argparse.ArgumentParser(description=main.__doc__,
                                      epilog="Homepage: https://github.com/kbat/mc-tools")
     parser.add_argument('inp', type=str, nargs="+", help='FLUKA input file(s). If multiple files are given, the script will assume the input files differ only in the random seed and average all corresponding data files.')
-    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output ROOT files produced by hadd')
+    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output ROOT file')
     parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='print what is being done')
+    parser.add_argument('-flutil', action='store_true', default=False, dest='flutil', help='merge the cycles with the usbsuw/usxsuw/ustsuw tools from $FLUTIL instead of the built-in merger')
+    parser.add_argument('-workers', type=int, default=None, dest='workers', help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-incremental', action='store_true', default=False, dest='incremental', help='record the hash of the input of each unit in the manifest file and copy the histograms of the unchanged units from the existing output ROOT file instead of merging and converting them again')
 
     args = parser.parse_args()
 
-    c = Converter(args.inp, args.overwrite, args.verbose)
-    c.Merge()
-    val = c.Convert()
-
-    return val
+    c = Converter(args.inp, args.overwrite, args.verbose, args.flutil, args.workers, args.incremental)
+    return c.Convert()
 
 
 
@@ -0,0 +1,243 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, struct, argparse
+import numpy as np
+from mctools.fluka.flair import Data, fortran
+from mctools.fluka import resnuclei2root
+
+class Batch:
+    """Weighted batch statistics of an array averaged over the cycles (as in the FLUKA usxsuw tools)"""
+    def __init__(self):
+        self.n = 0       # number of cycles
+        self.sumw = 0.0  # sum of cycle weights
+        self.sumwx = None
+        self.sumwx2 = None
+
+    def add(self, x, w):
+        """Add the array x of the cycle with weight w"""
+        x = np.asarray(x, dtype=np.float64)
+        if self.sumwx is None:
+            self.sumwx = np.zeros_like(x)
+            self.sumwx2 = np.zeros_like(x)
+        self.n += 1
+        self.sumw += w
+        self.sumwx += w*x
+        self.sumwx2 += w*x*x
+
+    def getMean(self):
+        """Return the weighted mean"""
+        return self.sumwx/self.sumw
+
+    def getError(self):
+        """Return the relative error of the weighted mean (zero with a single cycle)"""
+        mean = self.getMean()
+        if self.n < 2:
+            return np.zeros_like(mean)
+        var = np.maximum(self.sumwx2/self.sumw - mean*mean, 0.0) / (self.n-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(mean != 0, np.sqrt(var)/np.abs(mean), 0.0)
+
+
+def getBins(n, low, high, log):
+    """Return n+1 lin or log bin edges"""
+    if log:
+        return np.geomspace(low, high, n+1)
+    return np.linspace(low, high, n+1)
+
+def getBdxType(n):
+    """Return i1 of the decrypted what(1) of usrbdx"""
+    for i1 in (-2,-1,1,2):
+        for i2 in (0,1):
+            for i3 in (0,1):
+                if i1+10*i2+100*i3 == n:
+                    return i1
+    raise IOError("flukamerge: usrbdx what(1) == %d undefined" % n)
+
+def getEnergyBins(usr, det):
+    """Return ascending energy bin edges of the detector det"""
+    if isinstance(usr, Data.Usrbdx):
+        log = getBdxType(det.type) in (-2,-1)
+    else:
+        log = det.type == -1
+    return getBins(det.ne, det.elow, det.ehigh, log)
+
+def getSpectrum(usr, i, data):
+    """Return the (differential, bin width) arrays of the energy spectrum of
+    detector i in decreasing energy order: high energy bins followed by the low energy neutron groups.
+    USRBDX data are integrated over the solid angle."""
+    det = usr.detector[i]
+    high = usr.toArray(data, i)
+    low  = usr.toArray(data, i, True)
+    if isinstance(usr, Data.Usrbdx):
+        dOmega = np.diff(getBins(det.na, det.alow, det.ahigh, getBdxType(det.type) in (-2,2)))
+        high = dOmega.dot(high)
+        low = dOmega.dot(low)
+    dE = np.diff(getEnergyBins(usr, det))
+    dG = -np.diff(det.egroup) if det.ngroup else np.zeros(0)
+    return (np.concatenate((high[::-1], low)), np.concatenate((dE[::-1], dG)))
+
+
+class Merger:
+    """Average the per-cycle output of USRBIN, USRBDX, USRTRACK or RESNUCLEi into the usbsuw/usxsuw/ustsuw/usrsuw binary format"""
+    def __init__(self, reader):
+        self.reader = reader # Data.Usrbin, Data.Usrbdx, Data.Usrtrack or Data.Resnuclei
+        self.first = None    # reader of the first cycle
+        self.weight = 0.0
+        self.ncase = 0
+        self.nbatch = 0
+        self.data = []  # Batch of each detector data
+        self.iso = []   # Batch of each detector isomer data (RESNUCLEi)
+        self.stat = []  # list of Batch of the getStatistics arrays of each detector
+
+    def add(self, fname):
+        """Add the cycle file"""
+        usr = self.reader(fname)
+        if self.first is None:
+            self.first = usr
+            self.data = [Batch() for det in usr.detector]
+            self.iso = [Batch() for det in usr.detector]
+            self.stat = [[] for det in usr.detector]
+        elif len(usr.detector) != len(self.first.detector):
+            raise IOError("flukamerge: %s and %s have different number of detectors" % (self.first.file, fname))
+
+        for i in range(len(usr.detector)):
+            data = usr.readData(i)
+            self.data[i].add(np.frombuffer(data, dtype="=f4"), usr.weight)
+            stat = self.getStatistics(usr, i, data)
+            if not self.stat[i]:
+                self.stat[i] = [Batch() for x in stat]
+            for b, x in zip(self.stat[i], stat):
+                b.add(x, usr.weight)
+            if getattr(usr.detector[i], "isodatapos", -1) >= 0:
+                self.iso[i].add(np.frombuffer(usr.readRecord(usr.detector[i].isodatapos), dtype="=f4"), usr.weight)
+
+        self.weight += usr.weight
+        self.ncase += usr.ncase
+        self.nbatch += usr.nbatch
+        if usr is not self.first:
+            usr.close()
+
+    def getStatistics(self, usr, i, data):
+        """Return the list of arrays derived from the data of detector i, whose means and errors are stored in the statistics records:
+        [total, differential, cumulative] energy spectra of USRBDX and USRTRACK and [total, A, Z] projections of RESNUCLEi"""
+        if self.reader is Data.Usrbin:
+            return []
+        if self.reader is Data.Resnuclei:
+            val = usr.toArray(data, i)
+            Z, eZ, A, eA = resnuclei2root.project(usr.detector[i], val, np.zeros(val.shape))
+            return [Z.sum(keepdims=True), A, Z]
+        diff, width = getSpectrum(usr, i, data)
+        cumul = np.cumsum(diff*width)
+        return [cumul[-1:], diff, cumul]
+
+    def getHeader(self):
+        """Return the header record"""
+        ncase = int(self.ncase)
+        if getattr(self.first, "evol", False): # negative ncase flags the decay data
+            return struct.pack("=80s32sfii", self.first.title.ljust(80), self.first.time.ljust(32), self.weight,
+                               -ncase, self.nbatch)
+        return struct.pack("=80s32sfiii", self.first.title.ljust(80), self.first.time.ljust(32), self.weight,
+                           ncase % 1000000000, ncase // 1000000000, self.nbatch)
+
+    def getEnergyRecord(self, i):
+        """Return the N,NG,Elow,(Emax_i) statistics record of the detector i"""
+        det = self.first.detector[i]
+        ebins = getEnergyBins(self.first, det)
+        elow = det.egroup[-1] if det.ngroup else det.elow
+        e = np.concatenate(([elow], ebins[::-1], det.egroup[1:]))
+        return struct.pack("=2i", det.ne, det.ngroup) + e.astype("=f4").tobytes()
+
+    def writeStatistics(self, f):
+        """Write the statistics records"""
+        fortran.write(f, struct.pack("=10si", b"STATISTICS", 0))
+        for i in range(len(self.data)):
+            err = self.data[i].getError().astype("=f4").tobytes()
+            if self.reader is Data.Usrbin:
+                fortran.write(f, err)
+                continue
+            if self.reader is Data.Resnuclei:
+                total, A, Z = self.stat[i]
+                fortran.write(f, struct.pack("=2f", total.getMean()[0], total.getError()[0]))
+                for b in (A, Z):
+                    fortran.write(f, b.getMean().astype("=f4").tobytes())
+                    fortran.write(f, b.getError().astype("=f4").tobytes())
+                fortran.write(f, err)
+                if self.first.nisomers:
+                    fortran.write(f, self.iso[i].getError().astype("=f4").tobytes() if self.iso[i].n else b"")
+                continue
+            total, diff, cumul = self.stat[i]
+            fortran.write(f, struct.pack("=2f", total.getMean()[0], total.getError()[0]))
+            fortran.write(f, self.getEnergyRecord(i))
+            for b in (diff, cumul):
+                fortran.write(f, b.getMean().astype("=f4").tobytes())
+                fortran.write(f, b.getError().astype("=f4").tobytes())
+            if self.reader is Data.Usrbdx:
+                fortran.write(f, err)
+
+    def write(self, fname):
+        """Write the averaged data and statistics.
+        The records of the first cycle are copied with the detector data replaced by the averages."""
+        if self.first is None:
+            raise IOError("flukamerge: no cycles to merge")
+        data = dict((det.datapos, self.data[i]) for i, det in enumerate(self.first.detector))
+        data.update((det.isodatapos, self.iso[i]) for i, det in enumerate(self.first.detector)
+                    if getattr(det, "isodatapos", -1) >= 0)
+        src = self.first.hnd
+        src.seek(0)
+        with open(fname, "wb") as f:
+            while True:
+                pos = src.tell()
+                rec = fortran.read(src)
+                if rec is None or (len(rec) == 14 and rec[:10] == b"STATISTICS"):
+                    break
+                if pos == 0:
+                    rec = self.getHeader()
+                elif pos in data:
+                    rec = data[pos].getMean().astype("=f4").tobytes()
+                fortran.write(f, rec)
+            self.writeStatistics(f)
+        self.first.close()
+
+readers = { "usbsuw" : Data.Usrbin,
+            "usxsuw" : Data.Usrbdx,
+            "ustsuw" : Data.Usrtrack,
+            "usrsuw" : Data.Resnuclei }
+
+def getReader(fname):
+    """Return the Data reader class of the binary file by the size of its first detector record, None if unknown"""
+    sizes = { 86 : Data.Usrbin, 78 : Data.Usrbdx, 50 : Data.Usrtrack, 38 : Data.Resnuclei }
+    try:
+        with open(fname, "rb") as f:
+            fortran.skip(f)
+            return sizes.get(fortran.skip(f))
+    except (IOError, OSError, ValueError, struct.error): # formatted output or a file being written
+        return None
+
+def merge(tool, fnames, fout_name):
+    """Average the cycle files with the given merge tool (usbsuw, usxsuw, ustsuw or usrsuw) and return the output file name"""
+    m = Merger(readers[tool])
+    for fname in fnames:
+        m.add(fname)
+    m.write(fout_name)
+    return fout_name
+
+def main():
+    """
+    Averages the binary output of the FLUKA cycles as the usbsuw, usxsuw, ustsuw and usrsuw
+    tools of $FLUTIL do, but without the need of a FLUKA installation.
+    Example: flukamerge usbsuw -o example.usrbin example001_fort.50 example002_fort.50
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tool', type=str, choices=sorted(readers), help='merge tool to emulate')
+    parser.add_argument('cycles', type=str, nargs='+', help='binary files of the cycles')
+    parser.add_argument('-o', dest='out', type=str, required=True, help='output file name')
+    arguments = parser.parse_args()
+
+    merge(arguments.tool, arguments.cycles, arguments.out)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, os, re, glob, time, struct, argparse
+import numpy as np
+from mctools.fluka import flukamerge
+from mctools.fluka.flair import Data
+
+class Welford:
+    """Running weighted mean and variance of an array (Welford/West algorithm)"""
+    def __init__(self):
+        self.n = 0       # number of cycles
+        self.sumw = 0.0  # sum of cycle weights
+        self.mean = None
+        self.m2 = None   # weighted sum of squared deviations from the mean
+
+    def add(self, x, w):
+        """Add the array x of the cycle with weight w"""
+        x = np.asarray(x, dtype=np.float64)
+        if self.mean is None:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        self.n += 1
+        self.sumw += w
+        delta = x - self.mean
+        self.mean += (w/self.sumw) * delta
+        self.m2 += w * delta * (x - self.mean)
+
+    def getMean(self):
+        """Return the weighted mean"""
+        return self.mean
+
+    def getError(self):
+        """Return the relative error of the weighted mean as computed by the FLUKA merge tools"""
+        if self.n < 2:
+            return np.zeros_like(self.mean)
+        var = np.maximum(self.m2/self.sumw, 0.0) / (self.n-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.mean != 0, np.sqrt(var)/np.abs(self.mean), 0.0)
+
+
+def getSignature(fname):
+    """Return (size, modification time) of the file, None if it does not exist any more"""
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+def read(reader, fname):
+    """Return (weight, list of (detector name, data array)) of the cycle file, None if it cannot be read (yet)"""
+    try:
+        usr = reader(fname)
+    except (IOError, struct.error):
+        return None
+    try:
+        return usr.weight, [(det.name.decode(), np.frombuffer(usr.readData(i), dtype="=f4")) for i, det in enumerate(usr.detector)]
+    except (IOError, struct.error):
+        return None
+    finally:
+        usr.close()
+
+
+class Monitor:
+    """Relative errors of the USRBIN, USRBDX and USRTRACK detectors updated with each new cycle file"""
+    fortPattern = re.compile(r"_fort\.(\d+)$")
+
+    def __init__(self, units=None, detectors=None):
+        self.units = units         # units to monitor (all if None)
+        self.detectors = detectors # names of detectors to monitor (all if None)
+        self.files = set()         # files already added
+        self.rejected = {}         # file : (size, modification time) of the files which could not be added
+        self.cycles = {}           # unit : list of the added files
+        self.stat = {}             # unit : list of (detector name, Welford)
+
+    def getUnit(self, fname):
+        """Return the unit of the cycle file name, None if it is not monitored"""
+        m = self.fortPattern.search(fname)
+        if m is None:
+            return None
+        unit = int(m.group(1))
+        if self.units is not None and unit not in self.units:
+            return None
+        return unit
+
+    def add(self, fname):
+        """Add the cycle file, return its unit or None if the file is not monitored or cannot be added yet"""
+        unit = self.getUnit(fname)
+        reader = None if unit is None else flukamerge.getReader(fname)
+        if unit is None or reader is Data.Resnuclei:
+            self.files.add(fname)
+            return None
+        cycle = None if reader is None else read(reader, fname)
+        if cycle is None or (unit in self.stat and len(cycle[1]) < len(self.stat[unit])):
+            # formatted output, a file being written or with missing detectors: checked again when it changes
+            self.rejected[fname] = getSignature(fname)
+            return None
+        if unit in self.stat and len(cycle[1]) > len(self.stat[unit]):
+            # the previous cycles were added while being written: add them again
+            fnames = self.cycles.pop(unit)
+            del self.stat[unit]
+            self.files.difference_update(fnames)
+            for f in [fname] + fnames:
+                self.add(f)
+            return unit
+        self.rejected.pop(fname, None)
+        self.files.add(fname)
+        self.cycles.setdefault(unit, []).append(fname)
+        weight, data = cycle
+        if unit not in self.stat:
+            self.stat[unit] = [(name, Welford()) for name, x in data]
+        for (name, w), (dname, x) in zip(self.stat[unit], data):
+            if self.detectors is None or name in self.detectors:
+                w.add(x, weight)
+        return unit
+
+    def update(self, path):
+        """Add the new cycle files found in the directory, return the list of updated units.
+        The files which could not be added are checked again only when their size or modification time changes."""
+        fnames = glob.glob(os.path.join(path, "*_fort.*"))
+        new = sorted((f for f in fnames if f not in self.files and (f not in self.rejected or getSignature(f) != self.rejected[f])),
+                     key=os.path.getmtime)
+        return [u for u in (self.add(f) for f in new) if u is not None]
+
+    def getErrors(self, unit, name):
+        """Return relative errors of the non-empty bins of the given detector"""
+        w = dict(self.stat[unit])[name]
+        if w.mean is None:
+            return np.zeros(0)
+        return w.getError()[w.getMean() != 0]
+
+    def getSummary(self, percentiles):
+        """Return list of (unit, detector name, number of cycles, non-empty bins, max error, percentiles of errors)"""
+        summary = []
+        for unit in sorted(self.stat):
+            for name, w in self.stat[unit]:
+                if w.mean is None:
+                    continue
+                err = self.getErrors(unit, name)
+                p = np.percentile(err, percentiles) if len(err) else np.zeros(len(percentiles))
+                summary.append((unit, name, w.n, len(err), err.max() if len(err) else 0.0, p))
+        return summary
+
+    def isConverged(self, target, percentile):
+        """Return True if the given percentile of the relative errors of all monitored detectors is below target"""
+        summary = self.getSummary([percentile])
+        return len(summary) > 0 and all(n > 1 and p[0] < target for unit, name, n, nbins, emax, p in summary)
+
+
+def main():
+    """
+    Monitors the convergence of the FLUKA estimators while the cycles are running.
+    The run directory is scanned for new *_fort.NN files (moved there by rfluka at the end of each cycle),
+    and the running mean and variance of each bin are updated with only the new files.
+    After each update the maximum relative error and its percentiles over the non-empty bins are printed.
+    Example: flukamonitor . -unit 50 -target 0.05 -percentile 95 -stop
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', type=str, nargs='?', default='.', help='run directory')
+    parser.add_argument('-unit', dest='units', type=int, nargs='+', default=None, help='units to monitor (absolute values)')
+    parser.add_argument('-detector', dest='detectors', type=str, nargs='+', default=None, help='names of detectors to monitor')
+    parser.add_argument('-percentile', dest='percentile', type=float, default=95.0, help='percentile of the relative errors compared with target')
+    parser.add_argument('-target', dest='target', type=float, default=None, help='target relative error: exit when the percentile of errors of all monitored detectors is below it')
+    parser.add_argument('-stop', dest='stop', action='store_true', default=False, help='touch rfluka.stop in the fluka_* run directories when target is reached')
+    parser.add_argument('-interval', dest='interval', type=float, default=10.0, help='time interval between directory scans [s]')
+    parser.add_argument('-once', dest='once', action='store_true', default=False, help='process the existing files and exit')
+    arguments = parser.parse_args()
+
+    m = Monitor(arguments.units, arguments.detectors)
+    percentiles = [50, arguments.percentile]
+    while True:
+        if m.update(arguments.path):
+            for unit, name, n, nbins, emax, p in m.getSummary(percentiles):
+                print("unit %d %-10s cycles: %d bins: %d max: %.3g median: %.3g p%g: %.3g" % (unit, name, n, nbins, emax, p[0], percentiles[1], p[1]))
+            sys.stdout.flush()
+            if arguments.target is not None and m.isConverged(arguments.target, arguments.percentile):
+                print("target relative error %g reached" % arguments.target)
+                if arguments.stop:
+                    for d in glob.glob(os.path.join(arguments.path, "fluka_*")):
+                        open(os.path.join(d, "rfluka.stop"), "a").close()
+                return 0
+        if arguments.once:
+            return 0
+        time.sleep(arguments.interval)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# https://github.com/kbat/mc-tools
+#
+# Chunked reader of the MGDRAW binary dumps
+#
+
+from __future__ import print_function
+import os, collections
+import numpy as np
+
+CHUNK = 1<<26 # number of bytes read at once
+
+TRACK, DEPOSIT, SOURCE = "track", "deposit", "source" # event types
+
+# The primary field is the number of source events preceding the event in the chunk:
+# 0 for the events of a primary started in a previous chunk.
+
+# track segments: the points of track i are points[first[i]:first[i]+ntrack[i]+1]
+# and its energy deposits are dtrack[dfirst[i]:dfirst[i]+mtrack[i]]
+trackDtype = np.dtype([("ntrack", "=i4"), ("mtrack", "=i4"), ("jtrack", "=i4"),
+                       ("etrack", "=f4"), ("wtrack", "=f4"), ("ctrack", "=f4"),
+                       ("first", "=i8"), ("dfirst", "=i8"), ("primary", "=i4")])
+# energy deposition events
+depositDtype = np.dtype([("icode", "=i4"), ("jtrack", "=i4"), ("etrack", "=f4"), ("wtrack", "=f4"),
+                         ("x", "=f4"), ("y", "=f4"), ("z", "=f4"), ("rull", "=f4"), ("primary", "=i4")])
+# source particles, one row per particle of the stack
+sourceDtype = np.dtype([("primary", "=i4"), ("ncase", "=i4"), ("nstmax", "=i4"), ("tkesum", "=f4"), ("weipri", "=f4"),
+                        ("iloflk", "=i4"), ("tkeflk", "=f4"), ("x", "=f4"), ("y", "=f4"), ("z", "=f4"),
+                        ("tx", "=f4"), ("ty", "=f4"), ("tz", "=f4"), ("wtflk", "=f4")])
+
+Chunk = collections.namedtuple("Chunk", "tracks points dtrack deposits sources")
+
+def scan(wi, n):
+    """Return the array of word offsets of the events entirely contained in the first n words
+    of the int32 array wi, and the offset of the first incomplete event.
+    Each event is the 20-byte header record followed by the data record.
+    The candidates are the words with the markers of the header record. The events are
+    the chain of candidates linked by their lengths starting at word 0, which is followed
+    by pointer doubling, so that the false candidates inside the data records are skipped
+    without a loop over the events."""
+    wi = wi[:n]
+    if n < 8:
+        return np.zeros(0, dtype=np.int64), 0
+    i = np.flatnonzero((wi[:n-7] == 20) & (wi[6:n-1] == 20))
+    length = wi[i+7]
+    i, length = i[(length >= 0) & (length % 4 == 0)], length[(length >= 0) & (length % 4 == 0)]
+    end = i + 9 + (length >> 2)
+    complete = end <= n
+    valid = ~complete
+    valid[complete] = wi[end[complete]-1] == length[complete]
+    i, end = i[valid], end[valid]
+    if not len(i) or i[0] != 0:
+        raise IOError("Invalid MGDRAW record at word 0")
+
+    # successor of each candidate, m is the sink
+    m = len(i)
+    k = np.minimum(np.searchsorted(i, end), m-1)
+    jump = np.where(i[k] == end, k, m)
+    jump = np.append(jump, m)
+    chain = np.zeros(m+1, dtype=bool)
+    chain[0] = True
+    while True:
+        reached = np.flatnonzero(chain)
+        new = jump[reached]
+        if chain[new].all():
+            break
+        chain[new] = True
+        jump = jump[jump] # 2^k steps
+    starts = np.flatnonzero(chain[:m])
+
+    last = starts[-1]
+    if end[last] > n: # incomplete event
+        return i[starts[:-1]], int(i[last])
+    if end[last] <= n-8: # room for the next header, but it is not a valid event
+        raise IOError("Invalid MGDRAW record at word %d" % end[last])
+    return i[starts], int(end[last])
+
+def gather(first, count):
+    """Return indices of the concatenated [first[k], first[k]+count[k]) ranges"""
+    total = int(count.sum())
+    offsets = np.cumsum(count) - count
+    return np.repeat(first - offsets, count) + np.arange(total)
+
+class Mgdraw:
+    """MGDRAW dump read in chunks of events classified by their header:
+    tracking (ndum > 0), energy deposition (ndum == 0) and source (ndum < 0)"""
+    def __init__(self, fname):
+        self.fname = fname
+        self.size = os.path.getsize(fname)
+
+    def chunks(self, types=(TRACK, DEPOSIT, SOURCE), chunk=CHUNK, start=0, stop=None):
+        """Iterate over the Chunk tuples of the events between the byte offsets start and stop.
+        The arrays of the types not requested are None and their data are not decoded."""
+        stop = self.size if stop is None else stop
+        with open(self.fname, "rb") as f:
+            pos = start
+            while pos < stop:
+                f.seek(pos)
+                buf = f.read(min(chunk, stop-pos))
+                nwords = len(buf) // 4
+                starts, end = scan(np.frombuffer(buf, dtype="=i4", count=nwords), nwords)
+                if not len(starts):
+                    if len(buf) < min(chunk, stop-pos) or chunk >= stop-pos:
+                        raise IOError("Truncated MGDRAW file %s" % self.fname)
+                    chunk *= 2 # event larger than the chunk
+                    continue
+                yield self.decode(buf, starts, types)
+                pos += 4*end
+
+    def decode(self, buf, starts, types):
+        """Return the Chunk of the events starting at the given word offsets of buf"""
+        wi = np.frombuffer(buf, dtype="=i4", count=len(buf)//4)
+        wf = wi.view("=f4")
+        length = wi[starts+7] # data record length
+        if np.any(wi[starts+6] != 20) or np.any(wi[starts+8+length//4] != length):
+            raise IOError("Corrupted MGDRAW record in %s" % self.fname)
+
+        ndum = wi[starts+1]
+        data = starts + 8 # first word of the data record
+        primary = np.cumsum(ndum < 0)
+        tracks = points = dtrack = deposits = sources = None
+
+        if TRACK in types:
+            sel = ndum > 0
+            s, d = starts[sel], data[sel]
+            n, m = wi[s+1], wi[s+2]
+            if np.any(length[sel] != 4*(3*(n+1)+m+1)):
+                raise IOError("Invalid track event in %s" % self.fname)
+            tracks = np.zeros(len(s), dtype=trackDtype)
+            tracks["ntrack"], tracks["mtrack"], tracks["jtrack"] = n, m, wi[s+3]
+            tracks["etrack"], tracks["wtrack"] = wf[s+4], wf[s+5]
+            tracks["ctrack"] = wf[d + 3*(n+1) + m]
+            tracks["first"] = np.cumsum(n+1) - (n+1)
+            tracks["dfirst"] = np.cumsum(m) - m
+            tracks["primary"] = primary[sel]
+            points = wf[gather(d, 3*(n+1))].reshape(-1, 3)
+            dtrack = wf[gather(d + 3*(n+1), m)]
+
+        if DEPOSIT in types:
+            sel = ndum == 0
+            s, d = starts[sel], data[sel]
+            if np.any(length[sel] != 16):
+                raise IOError("Invalid energy deposition event in %s" % self.fname)
+            deposits = np.zeros(len(s), dtype=depositDtype)
+            deposits["icode"], deposits["jtrack"] = wi[s+2], wi[s+3]
+            deposits["etrack"], deposits["wtrack"] = wf[s+4], wf[s+5]
+            deposits["primary"] = primary[sel]
+            for k, name in enumerate(("x", "y", "z", "rull")):
+                deposits[name] = wf[d+k]
+
+        if SOURCE in types:
+            sel = ndum < 0
+            s, d = starts[sel], data[sel]
+            npflka = wi[s+2]
+            if np.any(length[sel] != 36*npflka):
+                raise IOError("Invalid source event in %s" % self.fname)
+            p = d.repeat(npflka) + 9*(np.arange(npflka.sum()) - np.repeat(np.cumsum(npflka) - npflka, npflka))
+            sources = np.zeros(len(p), dtype=sourceDtype)
+            sources["primary"] = np.repeat(primary[sel], npflka)
+            sources["ncase"] = np.repeat(-ndum[sel], npflka)
+            sources["nstmax"] = np.repeat(wi[s+3], npflka)
+            sources["tkesum"] = np.repeat(wf[s+4], npflka)
+            sources["weipri"] = np.repeat(wf[s+5], npflka)
+            sources["iloflk"] = wi[p]
+            for k, name in enumerate(("tkeflk", "x", "y", "z", "tx", "ty", "tz", "wtflk")):
+                sources[name] = wf[p+1+k]
+
+        return Chunk(tracks, points, dtrack, deposits, sources)
+
+    def isValid(self, wi, starts):
+        """Return True if the record markers of the events starting at the given word offsets are correct"""
+        length = wi[starts+7]
+        end = starts+8+length//4
+        return bool(np.all(end < len(wi)) and np.all(wi[starts+6] == 20) and np.all(wi[end] == length))
+
+    def sync(self, pos, window=1<<20, source=False):
+        """Return the byte offset of the first event (source event if source is True) starting at or after pos"""
+        pos -= pos % 4 # the records are word aligned
+        with open(self.fname, "rb") as f:
+            while pos < self.size:
+                f.seek(pos)
+                buf = f.read(window)
+                wi = np.frombuffer(buf, dtype="=i4", count=len(buf)//4)
+                n = len(wi)
+                # candidates have the markers of the 20-byte header record
+                candidates = (wi[:n-8] == 20) & (wi[6:n-2] == 20)
+                if source:
+                    candidates &= wi[1:n-7] < 0
+                for i in np.nonzero(candidates)[0]:
+                    try:
+                        starts, end = scan(wi[i:], n-i)
+                    except IOError:
+                        continue
+                    if len(starts) and self.isValid(wi[i:], starts):
+                        return pos + 4*int(i)
+                if pos + len(buf) >= self.size:
+                    break
+                pos += len(buf) - 32
+        return self.size
+
+    def getRanges(self, n, source=False):
+        """Return up to n (start, stop) byte ranges with whole events for parallel processing.
+        If source is True the ranges start with source events, so that no primary is split between them."""
+        bounds = sorted(set([0, self.size] + [self.sync(k*self.size//n, source=source) for k in range(1, n)]))
+        return list(zip(bounds[:-1], bounds[1:]))
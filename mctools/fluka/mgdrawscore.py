@@ -0,0 +1,261 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+# Scoring of the MGDRAW dumps on Cartesian meshes
+#
+
+from __future__ import print_function
+import sys, os, argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mctools.fluka.mgdraw import Mgdraw, CHUNK, TRACK, DEPOSIT, SOURCE, gather
+from mctools.fluka.flukamerge import Batch
+
+ENERGY, LENGTH = "energy", "length" # scored quantities
+
+class Mesh:
+    """Cartesian mesh defined by the bin edges along x, y and z"""
+    def __init__(self, x, y, z):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in (x, y, z)]
+        for e in self.edges:
+            if len(e) < 2 or np.any(np.diff(e) <= 0):
+                raise ValueError("Mesh: bin edges must be increasing")
+        self.shape = tuple(len(e)-1 for e in self.edges)
+        self.size = int(np.prod(self.shape))
+
+    def getIndices(self, x, axis):
+        """Return the bin indices of the coordinates x along the axis: -1 below and n above the mesh"""
+        e = self.edges[axis]
+        return np.clip(np.searchsorted(e, x, side='right')-1, -1, len(e)-1)
+
+    def getBins(self, xyz):
+        """Return the flat bin indices of the (n,3) points, -1 outside the mesh"""
+        idx = [self.getIndices(xyz[:,a], a) for a in range(3)]
+        ok = np.all([(i >= 0) & (i < n) for i, n in zip(idx, self.shape)], axis=0)
+        bins = np.full(len(xyz), -1, dtype=np.int64)
+        bins[ok] = np.ravel_multi_index([i[ok] for i in idx], self.shape)
+        return bins
+
+    def getVolumes(self):
+        """Return the (nx,ny,nz) array of the bin volumes"""
+        dx, dy, dz = (np.diff(e) for e in self.edges)
+        return dx[:,None,None]*dy[None,:,None]*dz[None,None,:]
+
+    def split(self, p0, p1):
+        """Split the segments p0-p1 at the mesh planes.
+        Return the (segment index, flat bin, fraction of the segment length) arrays of the pieces inside the mesh"""
+        nseg = len(p0)
+        seg = [np.arange(nseg), np.arange(nseg)]
+        t = [np.zeros(nseg), np.ones(nseg)]
+        for a, e in enumerate(self.edges):
+            i0, i1 = self.getIndices(p0[:,a], a), self.getIndices(p1[:,a], a)
+            count = np.abs(i1-i0) # number of planes crossed
+            s = np.repeat(np.arange(nseg), count)
+            k = gather(np.minimum(i0, i1)+1, count)
+            seg.append(s)
+            t.append((e[k] - p0[s,a]) / (p1[s,a] - p0[s,a]))
+        seg, t = np.concatenate(seg), np.concatenate(t)
+        order = np.lexsort((t, seg))
+        seg, t = seg[order], t[order]
+        same = (seg[1:] == seg[:-1]) & (t[1:] > t[:-1])
+        s, t0, t1 = seg[:-1][same], t[:-1][same], t[1:][same]
+        bins = self.getBins(p0[s] + ((t0+t1)/2)[:,None]*(p1[s]-p0[s]))
+        ok = bins >= 0
+        return s[ok], bins[ok], (t1-t0)[ok]
+
+
+class Score(Batch):
+    """Sums of the values binned on the mesh per primary: sumwx is the sum of the values s and
+    sumwx2 the sum of s*s/w, where w is the primary weight, so that Batch treats s/w as the value of a cycle of weight w.
+    The values of the last primary of a chunk are kept until the next chunk since the primary may continue there."""
+    def __init__(self, size):
+        Batch.__init__(self)
+        self.size = size
+        self.sumwx = np.zeros(size)
+        self.sumwx2 = np.zeros(size)
+        self.pending = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        self.weight = 1.0 # weight of the pending primary
+
+    def add(self, primary, bins, values, weights):
+        """Add the binned values of a chunk with len(weights)-1 source events.
+        primary is the index of the primary of each value, 0 for the one continued from the previous chunk,
+        weights are the primary weights indexed the same way (weights[0] is ignored)"""
+        nprimaries = len(weights)-1
+        weights = np.array(weights, dtype=np.float64)
+        weights[0] = self.weight
+        bins = np.concatenate((self.pending[0], bins))
+        values = np.concatenate((self.pending[1], values))
+        primary = np.concatenate((np.zeros(len(self.pending[0]), dtype=np.int64), primary))
+        last = primary == nprimaries
+        self.pending = (bins[last], values[last])
+        self.weight = weights[nprimaries]
+        self.accumulate(primary[~last], bins[~last], values[~last], weights)
+
+    def accumulate(self, primary, bins, values, weights):
+        """Add the sums of the values of each primary in each bin"""
+        if not len(bins):
+            return
+        key, inv = np.unique(primary.astype(np.int64)*self.size + bins, return_inverse=True)
+        s = np.bincount(inv.ravel(), weights=values)
+        w = weights[key // self.size]
+        self.sumwx += np.bincount(key % self.size, weights=s, minlength=self.size)
+        self.sumwx2 += np.bincount(key % self.size, weights=s*s/w, minlength=self.size)
+
+    def flush(self):
+        """Close the pending primary"""
+        self.accumulate(np.zeros(len(self.pending[0]), dtype=np.int64), *self.pending, weights=np.array([self.weight]))
+        self.pending = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+    def merge(self, other):
+        """Add the sums of another Score"""
+        self.n += other.n
+        self.sumw += other.sumw
+        self.sumwx += other.sumwx
+        self.sumwx2 += other.sumwx2
+
+def getTrackValues(mesh, c, particles, quantities):
+    """Return the dictionary of the (primary, bin, value) arrays of the track segments of the Chunk c.
+    The continuous energy losses are distributed along the track proportionally to the length."""
+    tracks = c.tracks
+    if particles is not None:
+        tracks = tracks[np.isin(tracks["jtrack"], particles)]
+    ntr = len(tracks)
+    n = tracks["ntrack"].astype(np.int64)
+    i0 = gather(tracks["first"], n) # first points of the segments
+    track = np.repeat(np.arange(ntr), n)
+    p0, p1 = c.points[i0].astype(np.float64), c.points[i0+1].astype(np.float64)
+    length = np.sqrt(((p1-p0)**2).sum(axis=1))
+    s, bins, frac = mesh.split(p0, p1)
+    tr = track[s]
+    w = tracks["wtrack"].astype(np.float64)
+    out = {}
+    if LENGTH in quantities:
+        out[LENGTH] = (tracks["primary"][tr], bins, w[tr]*frac*length[s])
+    if ENERGY in quantities:
+        m = tracks["mtrack"].astype(np.int64)
+        edep = np.bincount(np.repeat(np.arange(ntr), m), weights=c.dtrack[gather(tracks["dfirst"], m)], minlength=ntr)
+        total = np.bincount(track, weights=length, minlength=ntr)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.where(total[tr] > 0, w[tr]*edep[tr]*frac*length[s]/total[tr], 0.0)
+        # losses of the tracks of zero length are scored at their first point
+        point = np.nonzero((total == 0) & (edep != 0))[0]
+        pbins = mesh.getBins(c.points[tracks["first"][point]].astype(np.float64))
+        ok = pbins >= 0
+        out[ENERGY] = (np.concatenate((tracks["primary"][tr], tracks["primary"][point][ok])),
+                       np.concatenate((bins, pbins[ok])),
+                       np.concatenate((value, (w*edep)[point][ok])))
+    return out
+
+def getDepositValues(mesh, c, particles):
+    """Return the (primary, bin, value) arrays of the energy deposition events of the Chunk c"""
+    dep = c.deposits
+    if particles is not None:
+        dep = dep[np.isin(dep["jtrack"], particles)]
+    bins = mesh.getBins(np.stack((dep["x"], dep["y"], dep["z"]), axis=1).astype(np.float64))
+    ok = bins >= 0
+    return (dep["primary"][ok], bins[ok], (dep["rull"].astype(np.float64)*dep["wtrack"])[ok])
+
+def scoreRange(fname, mesh, quantities, particles, start, stop, chunk=CHUNK):
+    """Return the dictionary of the Score of each quantity for the events of the dump between the byte offsets start and stop"""
+    scores = dict((q, Score(mesh.size)) for q in quantities)
+    types = (SOURCE, TRACK, DEPOSIT) if ENERGY in quantities else (SOURCE, TRACK)
+    for c in Mgdraw(fname).chunks(types, chunk, start, stop):
+        primary, first = np.unique(c.sources["primary"], return_index=True)
+        nprimaries = len(primary)
+        weights = np.zeros(nprimaries+1)
+        weights[primary] = c.sources["weipri"][first]
+        values = dict((q, []) for q in quantities)
+        for q, v in getTrackValues(mesh, c, particles, quantities).items():
+            values[q].append(v)
+        if ENERGY in quantities:
+            values[ENERGY].append(getDepositValues(mesh, c, particles))
+        for q, v in values.items():
+            scores[q].add(*[np.concatenate(x) for x in zip(*v)], weights=weights)
+            scores[q].n += nprimaries
+            scores[q].sumw += float(weights[1:].sum())
+    for s in scores.values():
+        s.flush()
+    return scores
+
+def score(fnames, mesh, quantities=(ENERGY, LENGTH), particles=None, workers=None, chunk=CHUNK):
+    """Score the dumps on the mesh in parallel and return the dictionary of the Score of each quantity.
+    Each dump is split into byte ranges starting with source events, so that the primaries are not split between the workers."""
+    workers = workers or os.cpu_count() or 1
+    scores = dict((q, Score(mesh.size)) for q in quantities)
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(scoreRange, fname, mesh, quantities, particles, start, stop, chunk)
+                for fname in fnames for start, stop in Mgdraw(fname).getRanges(workers, source=True)]
+        for job in jobs:
+            for q, s in job.result().items():
+                scores[q].merge(s)
+    for q, s in scores.items():
+        if not s.n:
+            raise IOError("mgdrawscore: no source events found, the primaries must be dumped by SODRAW")
+    return scores
+
+def getDensity(mesh, s):
+    """Return the (value per primary and cm3, relative error) arrays of the Score s"""
+    return (s.getMean().reshape(mesh.shape)/mesh.getVolumes(), s.getError().reshape(mesh.shape))
+
+def saveNPZ(mesh, scores, fname):
+    """Save the densities, their relative errors and the bin edges into the NPZ file"""
+    out = { "x" : mesh.edges[0], "y" : mesh.edges[1], "z" : mesh.edges[2] }
+    for q, s in scores.items():
+        out[q], out[q+"_err"] = getDensity(mesh, s)
+        out["nprimaries"] = s.n
+    np.savez_compressed(fname, **out)
+
+def saveROOT(mesh, scores, fname):
+    """Save the densities as TH3F histograms into the ROOT file"""
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    from mctools.common import FillHist
+    titles = { ENERGY : ";x [cm];y [cm];z [cm];GeV/cm^{3}/primary",
+               LENGTH : ";x [cm];y [cm];z [cm];track length density [cm/cm^{3}/primary]" }
+    fout = ROOT.TFile(fname, "recreate")
+    x, y, z = (np.ascontiguousarray(e) for e in mesh.edges)
+    for q, s in scores.items():
+        val, err = getDensity(mesh, s)
+        h = ROOT.TH3F(q, titles[q], mesh.shape[0], x, mesh.shape[1], y, mesh.shape[2], z)
+        FillHist(h, val.T, (err*val).T)
+        h.SetEntries(s.n)
+        h.Write()
+    fout.Close()
+
+def main():
+    """
+    Scores the energy deposition and track length density of the MGDRAW dumps on a Cartesian mesh
+    without rerunning FLUKA. The statistical errors are estimated from the per primary contributions,
+    therefore the dumps must contain the source events (SODRAW).
+    Example: mgdrawscore -x -10 10 100 -y -10 10 100 -z 0 50 50 -o edep.npz example001_dump example002_dump
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dump', type=str, nargs='+', help='MGDRAW dump files')
+    parser.add_argument('-o', dest='out', type=str, required=True, help='output file name (.root or .npz)')
+    for axis in "xyz":
+        parser.add_argument('-'+axis, dest=axis, type=float, nargs=3, required=True, metavar=('MIN', 'MAX', 'N'), help='%s binning' % axis)
+    parser.add_argument('-quantity', dest='quantity', type=str, nargs='+', choices=(ENERGY, LENGTH), default=(ENERGY, LENGTH), help='scored quantities')
+    parser.add_argument('-particle', dest='particle', type=int, nargs='+', default=None, help='FLUKA codes of the scored particles (default: all)')
+    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output file')
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of bytes read at once', default=CHUNK)
+    parser.add_argument('-workers', dest='workers', type=int, help='number of worker processes (default: number of CPUs)', default=None)
+    args = parser.parse_args()
+
+    for f in args.dump:
+        if not os.path.isfile(f):
+            print("mgdrawscore: File %s does not exist." % f, file=sys.stderr)
+            return 1
+    if not args.overwrite and os.path.isfile(args.out):
+        sys.exit("%s exists. Use '-f' to overwrite it." % args.out)
+
+    mesh = Mesh(*[np.linspace(low, high, int(n)+1) for low, high, n in (args.x, args.y, args.z)])
+    scores = score(args.dump, mesh, tuple(args.quantity), args.particle, args.workers, args.chunk)
+
+    if args.out.endswith(".npz"):
+        saveNPZ(mesh, scores, args.out)
+    else:
+        saveROOT(mesh, scores, args.out)
+
+if __name__ == "__main__":
+    sys.exit(main())
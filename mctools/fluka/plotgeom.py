@@ -0,0 +1,110 @@
+# https://github.com/kbat/mc-tools
+#
+# PLOTGEOM binary output reader
+#
+
+from __future__ import print_function
+import struct
+import numpy as np
+from mctools.fluka.flair import fortran
+
+class PlotGeom:
+    """PLOTGEOM file: the title, the plot basis and the worms (polylines) of the region boundaries.
+    The coordinates of all worms are stored in the (n,2) float32 array xy, the points of
+    the worm i are xy[offsets[i]:offsets[i+1]]."""
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as f:
+            buf = f.read()
+        records = self.getRecords(buf)
+        if len(records) < 2 or records[0][1] != 80 or records[1][1] != 56:
+            raise IOError("%s: invalid PLOTGEOM file" % fname)
+        self.title = buf[records[0][0]:records[0][0]+80].strip()
+        # http://www.fluka.org/fluka.php?id=man_onl&sub=63
+        self.basis = np.frombuffer(buf, dtype="=f4", count=14, offset=records[1][0])
+        (self.X0, self.Y0, self.Z0, self.X1, self.Y1, self.Z1, self.TYX, self.TYY, self.TYZ,
+         self.TXX, self.TXY, self.TXZ, self.XAXLEN, self.YAXLEN) = self.basis.tolist()
+
+        # each worm is the (windex, dummy, wlength) record followed by the wlength (x,y) pairs
+        windex, start, length = [], [], []
+        for (pos, size), (nextpos, nextsize) in zip(records[2:], records[3:]):
+            if size == 12:
+                i, dummy, wlength = struct.unpack("=3i", buf[pos:pos+12])
+                if wlength > 0 and nextsize == 8*wlength:
+                    windex.append(i)
+                    start.append(nextpos//4)
+                    length.append(wlength)
+        self.windex = np.array(windex, dtype=np.int32)
+        length = np.array(length, dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(length)))
+        w = np.frombuffer(buf, dtype="=f4", count=len(buf)//4)
+        first = np.repeat(np.array(start, dtype=np.int64) - 2*self.offsets[:-1], 2*length) # word of the first coordinate
+        self.xy = w[first + np.arange(2*self.offsets[-1])].reshape(-1, 2) + np.array([self.Y0, self.X0], dtype=np.float32)
+
+    def getRecords(self, buf):
+        """Return the list of (payload offset, size) of the fortran records"""
+        try:
+            return fortran.Reader(buf, "=", 4).records()
+        except IOError as e:
+            raise IOError("%s: %s" % (self.fname, e))
+
+    def __len__(self):
+        return len(self.windex)
+
+    def getWorm(self, i):
+        """Return the (n,2) array of the points of the worm i"""
+        return self.xy[self.offsets[i]:self.offsets[i+1]]
+
+    def getSeparated(self):
+        """Return the (n+nworms-1,2) array of all points with the worms separated by (nan, nan)"""
+        n = len(self)
+        out = np.full((len(self.xy)+max(n-1, 0), 2), np.nan, dtype=np.float32)
+        out[np.arange(len(self.xy)) + np.repeat(np.arange(n), np.diff(self.offsets))] = self.xy
+        return out
+
+def split(xy):
+    """Return the (points, offsets) of the worms separated by (nan, nan) in the xy array"""
+    nan = np.isnan(xy[:,0])
+    points = xy[~nan]
+    if not len(points):
+        return points, np.zeros(1, dtype=np.int64)
+    breaks = np.nonzero(nan)[0] - np.arange(nan.sum())
+    return points, np.concatenate(([0], breaks, [len(points)])).astype(np.int64)
+
+def load(fname, name="worms"):
+    """Return the (points, offsets) of the worms of the NPZ file or of the TGraph name in the ROOT file"""
+    if fname.endswith(".npz"):
+        with np.load(fname) as f:
+            return f["xy"], f["offsets"]
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    f = ROOT.TFile(fname)
+    g = f.Get(name)
+    if not g:
+        raise IOError("%s: can't find object '%s'" % (fname, name))
+    n = g.GetN()
+    xy = np.stack((np.frombuffer(g.GetX(), dtype=np.float64, count=n),
+                   np.frombuffer(g.GetY(), dtype=np.float64, count=n)), axis=1)
+    f.Close()
+    return split(xy)
+
+def draw(points, offsets, color=1, width=1, flip=False):
+    """Draw the worms as polylines on the current pad and return the list holding them"""
+    import ROOT
+    if not hasattr(ROOT, "plotgeom_draw"):
+        ROOT.gInterpreter.Declare(
+"TList *plotgeom_draw(const Double_t *x, const Double_t *y, const Long64_t *offsets, Long64_t n, Color_t color, Width_t width) {\
+   TList *l = new TList();\
+   l->SetOwner();\
+   for (Long64_t i=0; i<n; i++) {\
+      TPolyLine *p = new TPolyLine(offsets[i+1]-offsets[i], x+offsets[i], y+offsets[i]);\
+      p->SetLineColor(color);\
+      p->SetLineWidth(width);\
+      p->Draw();\
+      l->Add(p);\
+   }\
+   return l;\
+}" )
+    x = np.ascontiguousarray(points[:,1 if flip else 0], dtype=np.float64)
+    y = np.ascontiguousarray(points[:,0 if flip else 1], dtype=np.float64)
+    return ROOT.plotgeom_draw(x, y, np.ascontiguousarray(offsets, dtype=np.int64), len(offsets)-1, color, width)
@@ -1,23 +1,35 @@
-#! /usr/bin/python2 -W all
+#! /usr/bin/python -W all
 
 from __future__ import print_function
-import sys, argparse, os, struct
-from array import array
-from mctools.fluka.flair import fortran
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
-
+import sys, argparse, os
+import numpy as np
+from mctools.fluka.plotgeom import PlotGeom
+
+def saveNPZ(pg, fname):
+    """Save the worms as the (n,2) 'xy' array of all points with the 'offsets' index, their indices and the plot basis"""
+    np.savez_compressed(fname, xy=pg.xy, offsets=pg.offsets, windex=pg.windex, basis=pg.basis, title=pg.title)
+
+def saveROOT(pg, fname, name="worms"):
+    """Save the worms as a single TGraph object with the worms separated by (nan, nan) points"""
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    xy = pg.getSeparated().astype(np.float64)
+    fout = ROOT.TFile(fname, "recreate", pg.fname)
+    g = ROOT.TGraph(len(xy), np.ascontiguousarray(xy[:,0]), np.ascontiguousarray(xy[:,1]))
+    g.SetName(name)
+    g.SetTitle(pg.title.decode() if isinstance(pg.title, bytes) else pg.title)
+    g.Write()
+    fout.Close()
 
 def main():
-    """ Converts PLOTGEOM output into a ROOT TMuiltiGraph object """
+    """ Converts PLOTGEOM output into a single ROOT TGraph object (worms separated by NaN points) or NPZ arrays """
 
     parser = argparse.ArgumentParser(description=main.__doc__,
                                      epilog="Homepage: https://github.com/kbat/mc-tools")
     parser.add_argument('plotgeom', type=str, nargs='*', help='list of plotgeom files')
-    parser.add_argument('-o', dest='root', type=str, help='output ROOT file name', default="")
+    parser.add_argument('-o', dest='root', type=str, help='output file name (.root or .npz)', default="")
     parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='print what is being done')
-    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output ROOT file')
-
+    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output file')
 
     args = parser.parse_args()
 
@@ -25,8 +37,6 @@ def main():
         if not os.path.isfile(f):
             sys.exit("plotgeom2root: File %s does not exist." % f)
 
-    wlength = 0
-    title = ""
     for plotgeom in args.plotgeom:
         if args.root == "":
             rootFileName = "%s%s" % (plotgeom,".root")
@@ -36,80 +46,21 @@ def main():
         if not args.overwrite and os.path.isfile(rootFileName):
             sys.exit("%s exists. Use '-f' to overwrite it." % rootFileName)
 
-        with open(plotgeom, 'rb') as f:
-            data = fortran.read(f)
-            size = len(data)
-            if size != 80:
-                sys.exit("Format error [title]")
-            title = struct.unpack("=80s", data)[0].strip()
-            if args.verbose:
-                print(title)
-
-            data = fortran.read(f)
-            size = len(data)
-            if size != 14*4:
-                print("Format error [basis]")
-            X0,Y0,Z0,X1,Y1,Z1,TYX,TYY,TYZ,TXX,TXY,TXZ,XAXLEN,YAXLEN = struct.unpack("=14f", data) # http://www.fluka.org/fluka.php?id=man_onl&sub=63
-            if not args.verbose:
-                print("Bottom left corner:",X0,Y0,Z0)
-                print("Top right corner:",X1,Y1,Z1)
-                print("Direction cosines of the x-axis:",TXX,TXY,TXZ)
-                print("Direction cosines of the y-axis:",TYX,TYY,TYZ)
-                print("x and y axis length:",XAXLEN,YAXLEN)
-#                print(X0,Y0,Z0,X1,Y1,Z1,TYX,TYY,TYZ,TXX,TXY,TXZ,XAXLEN,YAXLEN)
-
-            for i in range(1):
-                data = fortran.read(f)
-                size = len(data)
-                if args.verbose:
-                    print("size: ",size)
-                if size==8:
-                    NWORMS,dummy = struct.unpack("=2i", data)
-                    if args.verbose:
-                        print("NWORMS:",NWORMS,dummy)
-#                elif size==12: # this is never called
-#                    NWORMS,dummy,dummy1 = struct.unpack("=3i", data)
-#                    print(NWORMS,dummy,dummy1)
-
-            i = 0
-            fout = ROOT.TFile(rootFileName, "recreate", plotgeom)
-            mg = ROOT.TMultiGraph("mg", title)
-            while True:
-                i = i + 1
-                data = fortran.read(f)
-                if data is None:
-                    break
-                size = len(data)
-                if args.verbose:
-                    print("\nsize:",size)
-
-                if size == 12:
-                    windex,dummy,wlength = struct.unpack("=3i",data)
-                    if args.verbose:
-                        print(windex,dummy,wlength)
-                elif size==8:
-                    tmp = struct.unpack("=2i", data)
-                    if args.verbose:
-                        print("size8:",tmp)
-##                    break
-                elif size==24:
-                    tmp = struct.unpack("=3i3f", data)
-                    if args.verbose:
-                        print("size24:",tmp)
-                else:
-                    if args.verbose:
-                        print("a",wlength)
-                    coord = struct.unpack("=%df" % (wlength*2),data) # pairs of x,y
-                    if args.verbose:
-                        print(coord[:10])
-                    x = map(lambda x:x+Y0, coord[::2]) #[x+Y0 for x in coord[::2]]
-                    y = map(lambda y:y+X0, coord[1::2])
-                    g = ROOT.TGraph(len(x), array('f', x), array('f', y))
-                    g.SetName("g%d" % i)
-                    mg.Add(g)
-
-        mg.Write()
-        fout.Close()
+        pg = PlotGeom(plotgeom)
+        if args.verbose:
+            print(pg.title)
+            print("Bottom left corner:", pg.X0, pg.Y0, pg.Z0)
+            print("Top right corner:", pg.X1, pg.Y1, pg.Z1)
+            print("Direction cosines of the x-axis:", pg.TXX, pg.TXY, pg.TXZ)
+            print("Direction cosines of the y-axis:", pg.TYX, pg.TYY, pg.TYZ)
+            print("x and y axis length:", pg.XAXLEN, pg.YAXLEN)
+            print("Number of worms:", len(pg))
+            print("Number of points:", len(pg.xy))
+
+        if rootFileName.endswith(".npz"):
+            saveNPZ(pg, rootFileName)
+        else:
+            saveROOT(pg, rootFileName)
 
 
 if __name__=="__main__":
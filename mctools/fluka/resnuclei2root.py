@@ -0,0 +1,147 @@
+#! /usr/bin/python -W all
+
+from __future__ import print_function
+import sys, argparse
+from os import path
+import numpy as np
+from mctools.fluka.flair import Data
+
+def getMassNumbers(det):
+    """ Return the (mhigh, zhigh) array of mass numbers of the data bins """
+    m, z = np.indices((det.mhigh, det.zhigh))
+    return m + 2*(z+1) + det.nmzmin + 1
+
+def getAmax(det):
+    """ Return the maximal mass number """
+    return 2*det.zhigh + det.mhigh + det.nmzmin
+
+def toAZ(det, x):
+    """ Return the (amax, zhigh) array of the (mhigh, zhigh) array x indexed by A-1 and Z-1 """
+    a = getMassNumbers(det)
+    z = np.broadcast_to(np.arange(det.zhigh), a.shape)
+    ok = (a >= 1) & (a <= getAmax(det))
+    az = np.zeros((getAmax(det), det.zhigh), dtype=x.dtype)
+    az[a[ok]-1, z[ok]] = x[ok]
+    return az
+
+def project(det, val, err):
+    """ Return the (Z, Zerr, A, Aerr) projections of the (mhigh, zhigh) data val with relative errors err
+    The errors are summed in quadrature assuming uncorrelated bins """
+    val = np.asarray(val, dtype=np.float64)
+    var = (val*err)**2
+    a = getMassNumbers(det).ravel()
+    ok = (a >= 1) & (a <= getAmax(det))
+    Z  = val.sum(axis=0)
+    eZ = np.sqrt(var.sum(axis=0))
+    A  = np.bincount(a[ok]-1, weights=val.ravel()[ok], minlength=getAmax(det))
+    eA = np.sqrt(np.bincount(a[ok]-1, weights=var.ravel()[ok], minlength=getAmax(det)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (Z, np.where(Z > 0, eZ/Z, 0.0), A, np.where(A > 0, eA/A, 0.0))
+
+def getTable(det, val, err):
+    """ Return the structured array of (Z, A, value, relative error) of the non-zero bins """
+    m, z = np.nonzero(val)
+    table = np.zeros(len(m), dtype=[("Z", "i4"), ("A", "i4"), ("value", "f8"), ("error", "f8")])
+    table["Z"] = z+1
+    table["A"] = getMassNumbers(det)[m, z]
+    table["value"] = val[m, z]
+    table["error"] = err[m, z]
+    return table
+
+def read(b, i):
+    """ Return dictionary of the (value, relative error) arrays of the detector i of the Data.Resnuclei b:
+    the (mhigh, zhigh) data, its Z and A projections and the isomer data (if present) """
+    det = b.detector[i]
+    shape = b.getShape(i)
+    val = b.readDataArray(i)
+    stat = b.readStat(i)
+    if stat is not None:
+        total, A, errA, Z, errZ, err, iso = [None if s is None else np.frombuffer(s, dtype="=f4") for s in stat]
+        err = err.reshape(shape)
+    else:
+        err = np.zeros(shape)
+    Zp, eZp, Ap, eAp = project(det, val, err)
+    if stat is not None: # projections with correlations taken into account by the merge tool
+        Zp, eZp, Ap, eAp = Z, errZ, A, errA
+
+    data = { "" : (val, err), "_Z" : (Zp, eZp), "_A" : (Ap, eAp) }
+
+    isomers = b.readIso(i)
+    if isomers is not None and len(isomers[1]) == 4*det.mhigh*det.zhigh:
+        isoval = np.frombuffer(isomers[1], dtype="=f4").reshape(shape)
+        isoerr = iso.reshape(shape) if stat is not None and iso is not None else np.zeros(shape)
+        data["_iso"] = (isoval, isoerr)
+    return data
+
+def write(b):
+    """ Write histograms of all detectors of the Data.Resnuclei b into the current ROOT directory """
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    from mctools.common import FillHist
+    for i, det in enumerate(b.detector):
+        name = det.name.decode() if isinstance(det.name, bytes) else det.name
+        amax = getAmax(det)
+        title = "reg %d #diamond %g cm^{3}" % (det.region, det.volume)
+        for suffix, (val, err) in read(b, i).items():
+            if suffix == "_Z":
+                h = ROOT.TH1F(name+suffix, title+";Z;nuclei/primary", det.zhigh, 0.5, det.zhigh+0.5)
+            elif suffix == "_A":
+                h = ROOT.TH1F(name+suffix, title+";A;nuclei/primary", amax, 0.5, amax+0.5)
+            else:
+                h = ROOT.TH2F(name+suffix, title+";Z;A;nuclei/primary", det.zhigh, 0.5, det.zhigh+0.5, amax, 0.5, amax+0.5)
+                val, err = toAZ(det, val), toAZ(det, err)
+            FillHist(h, val, err*val)
+            h.SetEntries(b.weight)
+            h.Write()
+
+def saveNPZ(b, fname):
+    """ Save the data, projections and tables of the non-zero bins of all detectors into the NPZ file """
+    out = {}
+    for i, det in enumerate(b.detector):
+        name = det.name.decode() if isinstance(det.name, bytes) else det.name
+        for suffix, (val, err) in read(b, i).items():
+            out[name+suffix] = val
+            out[name+suffix+"_err"] = err
+            if suffix in ("", "_iso"):
+                out[name+suffix+"_table"] = getTable(det, val, err)
+    np.savez_compressed(fname, **out)
+
+def main():
+    """ Converts usrsuw (RESNUCLEi) output into ROOT histograms (A vs Z, A and Z projections, isomers) or NPZ arrays """
+
+    parser = argparse.ArgumentParser(description=main.__doc__,
+                                     epilog="Homepage: https://github.com/kbat/mc-tools")
+    parser.add_argument('resnuclei', type=str, help='usrsuw binary output')
+    parser.add_argument('out', type=str, nargs='?', help='output file name (.root or .npz)', default="")
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='print what is being done')
+
+    args = parser.parse_args()
+
+    if not path.isfile(args.resnuclei):
+        print("resnuclei2root: File %s does not exist." % args.resnuclei, file=sys.stderr)
+        return 1
+
+    out = args.out if args.out else args.resnuclei + ".root"
+
+    b = Data.Resnuclei()
+    b.readHeader(args.resnuclei)
+
+    if args.verbose:
+        b.sayHeader()
+        print("\n%d tallies found:" % len(b.detector))
+        for i in range(len(b.detector)):
+            b.say(i)
+            print("")
+
+    if out.endswith(".npz"):
+        saveNPZ(b, out)
+    else:
+        import ROOT
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        fout = ROOT.TFile(out, "recreate")
+        write(b)
+        fout.Close()
+    b.close()
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# https://github.com/kbat/mc-tools
+#
+# Sparse (COO) storage of the USRBIN meshes
+#
+
+from __future__ import print_function
+import numpy as np
+
+AXES = ("xlow", "xhigh", "nx", "ylow", "yhigh", "ny", "zlow", "zhigh", "nz")
+
+def getAxes(det):
+    """Return the (xlow, xhigh, nx, ylow, yhigh, ny, zlow, zhigh, nz) array of the Data.Usrbin detector"""
+    return np.array([getattr(det, a) for a in AXES], dtype=np.float64)
+
+def toCOO(val, err):
+    """Return the (flat index, value, relative error) arrays of the non-zero bins of the val array"""
+    index = np.flatnonzero(val)
+    dtype = np.int32 if val.size < 2**31 else np.int64
+    return index.astype(dtype), val.ravel()[index], err.ravel()[index]
+
+class SparseBin:
+    """USRBIN mesh stored as the sorted flat indices of the non-zero bins of the (nz, ny, nx) array
+    with their values and relative errors"""
+    def __init__(self, axes, index, value, error, btype=0):
+        self.axes = np.asarray(axes, dtype=np.float64)
+        self.type = int(btype)
+        self.shape = tuple(int(n) for n in self.axes[[8, 5, 2]]) # (nz, ny, nx)
+        self.index = index
+        self.value = value
+        self.error = error
+
+    def __len__(self):
+        return len(self.index)
+
+    def getOccupancy(self):
+        """Return the fraction of the non-zero bins"""
+        return len(self.index) / float(np.prod(self.shape))
+
+    def getEdges(self, axis):
+        """Return the bin edges along the axis 'x', 'y' or 'z'"""
+        low, high, n = self.axes[3*"xyz".index(axis):][:3]
+        return np.linspace(low, high, int(n)+1)
+
+    def toDense(self, values):
+        """Return the (nz, ny, nx) array with the given values of the non-zero bins"""
+        out = np.zeros(int(np.prod(self.shape)), dtype=values.dtype)
+        out[self.index] = values
+        return out.reshape(self.shape)
+
+    def dense(self):
+        """Return the dense (nz, ny, nx) arrays of the values and relative errors"""
+        return self.toDense(self.value), self.toDense(self.error)
+
+    def getSlice(self, axis, i):
+        """Return the dense 2D arrays of the values and relative errors of the bin i along the axis 'x', 'y' or 'z'.
+        The z slices are found by bisection since the indices are sorted, the others by a mask of the indices"""
+        nz, ny, nx = self.shape
+        if axis == "z":
+            first, last = np.searchsorted(self.index, [i*ny*nx, (i+1)*ny*nx])
+            sel, shape, local = slice(first, last), (ny, nx), self.index[first:last] - i*ny*nx
+        elif axis == "y":
+            iz, rest = np.divmod(self.index, ny*nx)
+            sel = np.nonzero(rest // nx == i)[0]
+            shape, local = (nz, nx), iz[sel]*nx + rest[sel] % nx
+        elif axis == "x":
+            sel = np.nonzero(self.index % nx == i)[0]
+            shape, local = (nz, ny), self.index[sel] // nx
+        else:
+            raise ValueError("SparseBin: axis must be 'x', 'y' or 'z'")
+        val = np.zeros(shape[0]*shape[1], dtype=self.value.dtype)
+        err = np.zeros(shape[0]*shape[1], dtype=self.error.dtype)
+        val[local] = self.value[sel]
+        err[local] = self.error[sel]
+        return val.reshape(shape), err.reshape(shape)
+
+def save(fname, bins):
+    """Save the dictionary of SparseBin objects into the NPZ file"""
+    out = {}
+    for name, s in bins.items():
+        out[name+"_index"] = s.index
+        out[name+"_value"] = s.value
+        out[name+"_error"] = s.error
+        out[name+"_axes"]  = s.axes
+        out[name+"_type"]  = s.type
+    np.savez_compressed(fname, **out)
+
+def load(fname):
+    """Return the dictionary of SparseBin objects saved in the NPZ file"""
+    bins = {}
+    with np.load(fname) as f:
+        for key in f.files:
+            if key.endswith("_axes"):
+                name = key[:-5]
+                bins[name] = SparseBin(f[key], f[name+"_index"], f[name+"_value"], f[name+"_error"], f[name+"_type"])
+    return bins
@@ -1,20 +1,66 @@
-#! /usr/bin/python2 -W all
+#! /usr/bin/python -W all
 
 from __future__ import print_function
 import sys, argparse
 from os import path
+import numpy as np
 from mctools import fluka
 from mctools.fluka.flair import Data
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
+from mctools.fluka import sparsebin
+
+def write(b):
+    """ Write histograms of all detectors of the Data.Usrbin b into the current ROOT directory """
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    from mctools.common import FillHist
+    ND = len(b.detector)
+    for i in range(ND):
+        val = b.readDataArray(i) # (nz, ny, nx)
+        stat = b.readStatArray(i) # None for single-cycle files
+        err = np.zeros(val.shape, dtype=val.dtype) if stat is None else stat * val
+        bin = b.detector[i]
+
+        title = fluka.particle.get(bin.score, "unknown")
+        if bin.type % 10 in (0, 3, 4, 5, 6):  # Fluka Manual, pages 250-251
+            title = title +  ";x [cm];y [cm];z [cm]"
+        h = ROOT.TH3F(bin.name, title, bin.nx, bin.xlow, bin.xhigh, bin.ny, bin.ylow, bin.yhigh, bin.nz, bin.zlow, bin.zhigh)
+
+        FillHist(h, val, err)
+        h.SetEntries(b.weight)
+        h.Write()
+
+def getName(bin):
+    """ Return the detector name as str """
+    return bin.name.decode() if isinstance(bin.name, bytes) else bin.name
+
+def saveNPZ(b, fname, sparse=False):
+    """ Save all detectors of the Data.Usrbin b into the NPZ file.
+    Dense: the (nz, ny, nx) value and relative error arrays with the axes.
+    Sparse: the flat indices, values and relative errors of the non-zero bins only (see sparsebin). """
+    if sparse:
+        bins = {}
+        for i, bin in enumerate(b.detector):
+            val, err = b.readDataArray(i), b.readStatArray(i)
+            bins[getName(bin)] = sparsebin.SparseBin(sparsebin.getAxes(bin), *sparsebin.toCOO(val, np.zeros(val.shape, dtype=val.dtype) if err is None else err), btype=bin.type)
+        sparsebin.save(fname, bins)
+        return
+    out = {}
+    for i, bin in enumerate(b.detector):
+        val, err = b.readDataArray(i), b.readStatArray(i)
+        name = getName(bin)
+        out[name] = val
+        out[name+"_err"] = np.zeros(val.shape, dtype=val.dtype) if err is None else err
+        out[name+"_axes"] = sparsebin.getAxes(bin)
+    np.savez_compressed(fname, **out)
 
 def main():
-    """ Converts usbsuw output into a ROOT histogram """
+    """ Converts usbsuw output into a ROOT histogram or NPZ arrays """
 
     parser = argparse.ArgumentParser(description=main.__doc__,
                                      epilog="Homepage: https://github.com/kbat/mc-tools")
     parser.add_argument('usrbin', type=str, help='usrxxx binary output (produced by usbsuw)')
-    parser.add_argument('root', type=str, nargs='?', help='output ROOT file name', default="")
+    parser.add_argument('root', type=str, nargs='?', help='output file name (.root or .npz)', default="")
+    parser.add_argument('-sparse', action='store_true', default=False, dest='sparse', help='store only the non-zero bins (NPZ output only)')
     parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='Print some output')
     
     args = parser.parse_args()
@@ -27,6 +73,10 @@ def main():
         rootFileName = "%s%s" % (args.usrbin,".root")
     else:
         rootFileName = args.root
+
+    if args.sparse and not rootFileName.endswith(".npz"):
+        print("usrbin2root: -sparse requires the NPZ output (.npz file name)", file=sys.stderr)
+        return 1
     
     b = Data.Usrbin()
     b.readHeader(args.usrbin)
@@ -40,27 +90,14 @@ def main():
             b.say(i)
             print("")
 
-    fout = ROOT.TFile(rootFileName, "recreate")
-    for i in range(ND):
-        val = Data.unpackArray(b.readData(i))
-        err = Data.unpackArray(b.readStat(i))
-        bin = b.detector[i]
-
-        title = fluka.particle.get(bin.score, "unknown")
-        if bin.type % 10 in (0, 3, 4, 5, 6):  # Fluka Manual, pages 250-251
-            title = title +  ";x [cm];y [cm];z [cm]"
-        h = ROOT.TH3F(bin.name, title, bin.nx, bin.xlow, bin.xhigh, bin.ny, bin.ylow, bin.yhigh, bin.nz, bin.zlow, bin.zhigh)
-        
-        for i in range(bin.nx):
-            for j in range(bin.ny):
-                for k in range(bin.nz):
-                    gbin = i + j * bin.nx + k * bin.nx * bin.ny
-                    h.SetBinContent(i+1, j+1, k+1, val[gbin])
-                    h.SetBinError(i+1, j+1, k+1, err[gbin]*val[gbin])
-        h.SetEntries(b.weight)
-        h.Write()
-
-    fout.Close()
+    if rootFileName.endswith(".npz"):
+        saveNPZ(b, rootFileName, args.sparse)
+    else:
+        import ROOT
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        fout = ROOT.TFile(rootFileName, "recreate")
+        write(b)
+        fout.Close()
 
 if __name__=="__main__":
     sys.exit(main())
@@ -0,0 +1,160 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, argparse
+from os import path
+import numpy as np
+from mctools.fluka.flair import Data
+
+CYLINDRICAL = (1, 7, 11, 17) # R-Phi-Z binnings
+UNSUPPORTED = (2, 8, 12, 18) # region and special binnings
+
+def getName(bin):
+    """ Return the detector name as str """
+    return bin.name.decode() if isinstance(bin.name, bytes) else bin.name
+
+def getEdges(bin):
+    """ Return the bin edges along x (R), y (Phi) and z """
+    return [np.linspace(low, high, n+1) for low, high, n in
+            ((bin.xlow, bin.xhigh, bin.nx), (bin.ylow, bin.yhigh, bin.ny), (bin.zlow, bin.zhigh, bin.nz))]
+
+def getPoints(bin):
+    """ Return the (nz+1, nphi+1, nr+1, 3) array of the structured grid points of the R-Phi-Z mesh.
+    A single Phi bin is represented by the R-Z half-plane at Phi=0. """
+    r, phi, z = getEdges(bin)
+    if bin.ny == 1:
+        phi = np.zeros(1)
+    Z, P, R = np.meshgrid(z, phi, r, indexing="ij")
+    return np.stack((R*np.cos(P), R*np.sin(P), Z), axis=-1)
+
+def getArrays(b, i):
+    """ Return the (nz, ny, nx) value and relative error arrays of the detector i """
+    val = b.readDataArray(i)
+    err = b.readStatArray(i)
+    return val, np.zeros(val.shape, dtype=val.dtype) if err is None else err
+
+def writeVTK(b, i, fname):
+    """ Write the detector i into the binary legacy VTK file:
+    rectilinear grid for the Cartesian meshes and structured grid for the R-Phi-Z meshes """
+    bin = b.detector[i]
+    val, err = getArrays(b, i)
+    with open(fname, "wb") as f:
+        title = b.title.decode() if isinstance(b.title, bytes) else b.title
+        f.write(("# vtk DataFile Version 3.0\n%s %s\nBINARY\n" % (getName(bin), title.strip()))[:256].encode())
+        if bin.type in CYLINDRICAL:
+            points = getPoints(bin)
+            f.write(("DATASET STRUCTURED_GRID\nDIMENSIONS %d %d %d\n" % points.shape[2::-1][:3]).encode())
+            f.write(("POINTS %d float\n" % (points.size//3)).encode())
+            f.write(points.astype(">f4").tobytes())
+            f.write(b"\n")
+        else:
+            edges = getEdges(bin)
+            f.write(("DATASET RECTILINEAR_GRID\nDIMENSIONS %d %d %d\n" % tuple(len(e) for e in edges)).encode())
+            for axis, e in zip("XYZ", edges):
+                f.write(("%s_COORDINATES %d float\n" % (axis, len(e))).encode())
+                f.write(e.astype(">f4").tobytes())
+                f.write(b"\n")
+        # x is the fastest index of the (nz, ny, nx) arrays as VTK expects
+        f.write(("CELL_DATA %d\n" % val.size).encode())
+        for name, a in (("value", val), ("error", err)):
+            f.write(("SCALARS %s float 1\nLOOKUP_TABLE default\n" % name).encode())
+            f.write(a.astype(">f4").tobytes())
+            f.write(b"\n")
+
+def writeXDMF(b, fname, detectors):
+    """ Write the detectors into the HDF5 file with the XDMF description fname """
+    try:
+        import h5py
+    except ImportError:
+        sys.exit("usbsuw2vtk: the XDMF output requires h5py")
+    h5name = path.splitext(fname)[0] + ".h5"
+    grids = []
+    with h5py.File(h5name, "w") as h5:
+        for i in detectors:
+            bin = b.detector[i]
+            name = getName(bin)
+            val, err = getArrays(b, i)
+            g = h5.create_group(name)
+            if bin.type in CYLINDRICAL:
+                points = getPoints(bin)
+                if bin.ny == 1: # R-Z half-plane
+                    points, val, err = points[:,0], val[:,0], err[:,0]
+                nodes = " ".join("%d" % n for n in points.shape[:-1])
+                g["points"] = points.astype(np.float32)
+                geometry = """      <Topology TopologyType="%dDSMesh" Dimensions="%s"/>
+      <Geometry GeometryType="XYZ">
+        <DataItem Dimensions="%s 3" NumberType="Float" Precision="4" Format="HDF">%s:/%s/points</DataItem>
+      </Geometry>""" % (points.ndim-1, nodes, nodes, path.basename(h5name), name)
+            else:
+                edges = getEdges(bin)
+                for axis, e in zip("xyz", edges):
+                    g[axis] = e
+                nodes = "%d %d %d" % tuple(len(e) for e in edges[::-1])
+                geometry = """      <Topology TopologyType="3DRectMesh" Dimensions="%s"/>
+      <Geometry GeometryType="VXVYVZ">
+%s
+      </Geometry>""" % (nodes, "\n".join('        <DataItem Dimensions="%d" NumberType="Float" Precision="8" Format="HDF">%s:/%s/%s</DataItem>'
+                                      % (len(e), path.basename(h5name), name, axis) for axis, e in zip("xyz", edges)))
+            g["value"] = val
+            g["error"] = err
+            cells = " ".join("%d" % n for n in val.shape)
+            attributes = "\n".join("""      <Attribute Name="%s" AttributeType="Scalar" Center="Cell">
+        <DataItem Dimensions="%s" NumberType="Float" Precision="4" Format="HDF">%s:/%s/%s</DataItem>
+      </Attribute>""" % (a, cells, path.basename(h5name), name, a) for a in ("value", "error"))
+            grids.append("""    <Grid Name="%s" GridType="Uniform">
+%s
+%s
+    </Grid>""" % (name, geometry, attributes))
+    with open(fname, "w") as f:
+        f.write("""<?xml version="1.0" ?>
+<Xdmf Version="3.0">
+  <Domain>
+%s
+  </Domain>
+</Xdmf>
+""" % "\n".join(grids))
+
+def main():
+    """ Converts usbsuw output into binary VTK files (one per detector) or into XDMF+HDF5 for ParaView.
+    Cartesian meshes are written as rectilinear grids and R-Phi-Z meshes as structured grids. """
+
+    parser = argparse.ArgumentParser(description=main.__doc__,
+                                     epilog="Homepage: https://github.com/kbat/mc-tools")
+    parser.add_argument('usrbin', type=str, help='usrxxx binary output (produced by usbsuw)')
+    parser.add_argument('out', type=str, nargs='?', help='output file name: .xmf/.xdmf for XDMF+HDF5, otherwise the prefix of the VTK files', default="")
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, dest='verbose', help='print what is being done')
+
+    args = parser.parse_args()
+
+    if not path.isfile(args.usrbin):
+        print("usbsuw2vtk: File %s does not exist." % args.usrbin, file=sys.stderr)
+        return 1
+
+    out = args.out if args.out else args.usrbin
+
+    b = Data.Usrbin()
+    b.readHeader(args.usrbin)
+
+    detectors = []
+    for i, bin in enumerate(b.detector):
+        if bin.type in UNSUPPORTED:
+            print("usbsuw2vtk: binning type %d of %s is not supported" % (bin.type, getName(bin)), file=sys.stderr)
+        else:
+            detectors.append(i)
+
+    if out.endswith((".xmf", ".xdmf")):
+        writeXDMF(b, out, detectors)
+        if args.verbose:
+            print(out)
+    else:
+        for i in detectors:
+            fname = "%s_%s.vtk" % (out, getName(b.detector[i]))
+            writeVTK(b, i, fname)
+            if args.verbose:
+                print(fname)
+    b.close()
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# https://github.com/kbat/mc-tools
+#
+# Readers of the formatted (ASCII) output of USRBIN, USRBDX and USRTRACK
+# written by FLUKA to the positive logical units
+#
+
+from __future__ import print_function
+import re, os, struct, shutil, tempfile
+import numpy as np
+from mctools.fluka.flair import fortran
+from mctools.fluka.flair.Data import Detector
+from mctools.fluka import flukamerge
+
+# detector headers of the formatted output
+_usrbin   = re.compile(r'^\s*(.+?)\s+binning n\.\s*(\d+)\s+"(.{0,10})"\s*,\s*generalized particle n\.\s*(-?\d+)', re.M)
+_usrbdx   = re.compile(r'^\s*Bdrx n\.\s*(\d+)\s+"(.{0,10})"\s*,\s*generalized particle n\.\s*(-?\d+)\s*,'
+                       r'\s*from region n\.\s*(-?\d+)\s*to region n\.\s*(-?\d+)', re.M)
+_usrtrack = re.compile(r'^\s*(?:Track|Coll) n\.\s*(\d+)\s+"(.{0,10})"\s*,\s*generalized particle n\.\s*(-?\d+)\s*,'
+                       r'\s*region n\.\s*(-?\d+)', re.M)
+
+_title  = re.compile(r"\*{5}\s*(.*?)\s*\*{5}")
+_time   = re.compile(r"^\s*(DATE:.*?)\s*$", re.M)
+_ncase  = re.compile(r"Total number of particles followed\s+(\d+)\s*,\s*for a total weight of\s+(\S+)")
+_coord  = re.compile(r"([XYZRP])\s+coordinate:\s*from\s*(\S+)\s+to\s+(\S+)\s*\w*\s*,\s*(\d+)\s+bins\s*\(\s*([^\s)]+)")
+_energy = re.compile(r"(linear|logar\.)\s+energy binning from\s*(\S+)\s+to\s+(\S+)\s*\w*\s*,\s*(\d+)\s+bins\s*\(\s*(?:ratio\s*:\s*)?([^\s)]+)")
+_angle  = re.compile(r"(linear|logar\.)\s+angular binning from\s*(\S+)\s+to\s+(\S+)\s*\w*\s*,\s*(\d+)\s+bins\s*\(\s*(?:ratio\s*:\s*)?([^\s)]+)")
+_area   = re.compile(r"detector area:\s*(\S+)")
+_volume = re.compile(r"detector volume:\s*(\S+)")
+_groups = re.compile(r"low energy neutron data from group\s+(\d+)\s+to group\s+(\d+)", re.I)
+_bounds = re.compile(r"energy boundaries", re.I)
+_format = re.compile(r"format\s*\(.*\)\s*$", re.M)
+_number = re.compile(r"^[ \t]*[-+]?\.?\d", re.M)   # first line of a numeric block
+_text   = re.compile(r"^[ \t]*[^-+.\d\s]", re.M)   # first line after a numeric block
+
+BINNINGS = { "cartesian" : 0, "r - phi - z" : 1, "region" : 2, "special" : 8 }
+
+def getBlock(text, pos, count, fname):
+    """Return (array, end position) of the numeric block of count values following the text position pos.
+    The block is the run of lines starting with a number and is parsed at once by numpy."""
+    m = _number.search(text, pos)
+    if m is None:
+        raise IOError("%s: data block not found" % fname)
+    end = _text.search(text, m.start())
+    end = end.start() if end else len(text)
+    raw = text[m.start():end]
+    data = np.fromstring(raw, sep=" ")
+    if len(data) != count: # Fortran D exponents
+        data = np.array(raw.replace("D", "E").replace("d", "e").split(), dtype=np.float64)
+    if len(data) != count:
+        raise IOError("%s: %d values found in the data block, %d expected" % (fname, len(data), count))
+    return data, end
+
+class Ascii:
+    """Formatted output of USRBIN, USRBDX or USRTRACK of a single cycle.
+    Each detector holds its binary header record, the low energy neutron group record (if any)
+    and the data array in the order of the binary output."""
+    def __init__(self, fname):
+        self.fname = fname
+        self.detector = []
+        with open(fname) as f:
+            text = f.read()
+        m = _ncase.search(text)
+        if m is None:
+            raise IOError("%s: number of primaries not found" % fname)
+        self.ncase, self.weight = int(m.group(1)), float(m.group(2))
+        m = _title.search(text)
+        self.title = m.group(1) if m else ""
+        m = _time.search(text)
+        self.time = m.group(1) if m else ""
+
+        found = [(tool, list(pattern.finditer(text)), parse) for tool, pattern, parse in
+                 (("usbsuw", _usrbin, self.parseUsrbin),
+                  ("usxsuw", _usrbdx, self.parseUsrbdx),
+                  ("ustsuw", _usrtrack, self.parseUsrtrack))]
+        found = [f for f in found if f[1]]
+        if not found:
+            raise IOError("%s: no USRBIN, USRBDX or USRTRACK detectors found" % fname)
+        if len(found) > 1:
+            raise IOError("%s: detectors of more than one estimator type (%s) written to the same unit are not supported" %
+                          (fname, ", ".join(tool for tool, headers, parse in found)))
+        tool, headers, parse = found[0]
+        self.tool = tool # merge tool of the binary equivalent
+        for m, next in zip(headers, headers[1:]+[None]):
+            self.detector.append(parse(m, text[m.end():next.start() if next else len(text)]))
+
+    def getBinning(self, pattern, section, name):
+        """Return (log, low, high, n, width) of the energy or angular binning"""
+        m = pattern.search(section)
+        if m is None:
+            raise IOError("%s: binning of %s not found" % (self.fname, name))
+        return m.group(1) == "logar.", float(m.group(2)), float(m.group(3)), int(m.group(4)), float(m.group(5))
+
+    def getData(self, section, count, na=1):
+        """Return the group record and the data array of count high energy values followed by
+        the na blocks of the low energy neutron groups (as in the binary output)"""
+        m = _format.search(section)
+        data, end = getBlock(section, m.end() if m else 0, count, self.fname)
+        m = _groups.search(section, end)
+        if m is None:
+            return b"", data
+        ngroup = int(m.group(2)) - int(m.group(1)) + 1
+        low = getBlock(section, m.end(), ngroup*na, self.fname)[0]
+        m = _bounds.search(section)
+        if m is None:
+            raise IOError("%s: low energy neutron group boundaries not found" % self.fname)
+        egroup = getBlock(section, m.end(), ngroup+1, self.fname)[0]
+        return struct.pack("=i", ngroup) + egroup.astype("=f4").tobytes(), np.concatenate((data, low))
+
+    def parseUsrbin(self, m, section):
+        det = Detector()
+        det.name = m.group(3).strip()
+        kind = m.group(1).strip().lower()
+        if kind not in BINNINGS:
+            raise IOError("%s: %s binning of %s is not supported" % (self.fname, m.group(1), det.name))
+        coords = dict((c.group(1), c.groups()[1:]) for c in _coord.finditer(section))
+        axes = ("R", "P", "Z") if BINNINGS[kind] == 1 else ("X", "Y", "Z")
+        if not all(a in coords for a in axes):
+            raise IOError("%s: coordinates of %s not found" % (self.fname, det.name))
+        low, high, n, width = zip(*[coords[a] for a in axes])
+        n = [int(x) for x in n]
+        bins = [(float(l), float(h), k, float(w)) for l, h, k, w in zip(low, high, n, width)]
+        lntzer = 1 if "accurate deposition" in section else 0
+        det.header = struct.pack("=i10sii", int(m.group(2)), det.name.encode().ljust(10), BINNINGS[kind], int(m.group(4))) + \
+                     b"".join(struct.pack("=ffif", *b) for b in bins) + struct.pack("=ifff", lntzer, 0.0, 0.0, 0.0)
+        det.groups, det.data = self.getData(section, n[0]*n[1]*n[2])
+        return det
+
+    def parseUsrbdx(self, m, section):
+        det = Detector()
+        det.name = m.group(2).strip()
+        elog, elow, ehigh, ne, de = self.getBinning(_energy, section, det.name)
+        alog, alow, ahigh, na, da = self.getBinning(_angle, section, det.name)
+        area = _area.search(section)
+        twoway = 1 if "two ways" in section else 0
+        fluence = 1 if "fluence like" in section else 0
+        i1 = (2 if alog else 1) * (-1 if elog else 1)
+        det.groups, det.data = self.getData(section, ne*na, na)
+        lowneu = 1 if det.groups else 0
+        det.header = struct.pack("=i10siiiifiiiffifffif", int(m.group(1)), det.name.encode().ljust(10),
+                                 i1 + 10*twoway + 100*fluence, int(m.group(3)), int(m.group(4)), int(m.group(5)),
+                                 float(area.group(1)) if area else 1.0, twoway, fluence, lowneu,
+                                 elow, ehigh, ne, de, alow, ahigh, na, da)
+        return det
+
+    def parseUsrtrack(self, m, section):
+        det = Detector()
+        det.name = m.group(2).strip()
+        elog, elow, ehigh, ne, de = self.getBinning(_energy, section, det.name)
+        volume = _volume.search(section)
+        det.groups, det.data = self.getData(section, ne)
+        det.header = struct.pack("=i10siiififfif", int(m.group(1)), det.name.encode().ljust(10), -1 if elog else 1,
+                                 int(m.group(3)), int(m.group(4)), float(volume.group(1)) if volume else 1.0,
+                                 1 if det.groups else 0, elow, ehigh, ne, de)
+        return det
+
+    def write(self, fname):
+        """Write the equivalent binary output of the cycle"""
+        with open(fname, "wb") as f:
+            fortran.write(f, struct.pack("=80s32sfiii", self.title.encode()[:80].ljust(80), self.time.encode()[:32].ljust(32),
+                                         self.weight, self.ncase % 1000000000, self.ncase // 1000000000, 1))
+            for det in self.detector:
+                fortran.write(f, det.header)
+                if det.groups:
+                    fortran.write(f, det.groups)
+                fortran.write(f, det.data.astype("=f4").tobytes())
+
+def merge(tool, fnames, fout_name):
+    """Average the formatted cycle files as flukamerge.merge does with the binary ones and return the output file name"""
+    tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+    try:
+        cycles = []
+        for i, fname in enumerate(fnames):
+            usr = Ascii(fname)
+            if usr.tool != tool:
+                raise IOError("%s: %s output expected" % (fname, tool))
+            cycles.append(os.path.join(tmpdir, "%d_%s" % (i, os.path.basename(fname))))
+            usr.write(cycles[-1])
+        return flukamerge.merge(tool, cycles, fout_name)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,145 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+# Arithmetic and comparison of the USRBIN detectors of two runs
+#
+
+from __future__ import print_function
+import sys, struct, argparse
+import numpy as np
+from mctools.fluka.flair import Data, fortran
+from mctools.fluka import sparsebin
+
+CHUNK = 1<<24 # number of bins processed at once
+OPERATIONS = ("add", "sub", "mul", "div", "pull", "chi2")
+
+def isCompatible(det1, det2):
+    """Return True if the detectors have the same binning type and axes"""
+    return det1.type == det2.type and np.allclose(sparsebin.getAxes(det1), sparsebin.getAxes(det2))
+
+def getPairs(ua, ub):
+    """Return the list of (i, j) indices of the detectors of ua and ub with the same names.
+    Raise IOError if a detector of ua is missing in ub or has a different mesh"""
+    names = dict((det.name, j) for j, det in enumerate(ub.detector))
+    pairs = []
+    for i, det in enumerate(ua.detector):
+        if det.name not in names:
+            raise IOError("usrbinmath: detector %s is not found in %s" % (det.name, ub.file))
+        j = names[det.name]
+        if not isCompatible(det, ub.detector[j]):
+            raise IOError("usrbinmath: detector %s has different meshes in %s and %s" % (det.name, ua.file, ub.file))
+        pairs.append((i, j))
+    return pairs
+
+def compute(op, a, ea, b, eb):
+    """Return the (value, relative error) arrays of the operation on a and b with the relative errors ea and eb.
+    pull is (a-b)/sigma and chi2 is its square, they have zero errors."""
+    a, ea, b, eb = (np.asarray(x, dtype=np.float64) for x in (a, ea, b, eb))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if op in ("add", "sub"):
+            val = a+b if op == "add" else a-b
+            sigma = np.hypot(a*ea, b*eb)
+            return val, np.where(val != 0, sigma/np.abs(val), 0.0)
+        if op in ("mul", "div"):
+            val = a*b if op == "mul" else np.where(b != 0, a/b, 0.0)
+            return val, np.where(val != 0, np.hypot(ea, eb), 0.0)
+        if op in ("pull", "chi2"):
+            sigma = np.hypot(a*ea, b*eb)
+            pull = np.where(sigma > 0, (a-b)/sigma, 0.0)
+            return pull*pull if op == "chi2" else pull, np.zeros(pull.shape)
+    raise ValueError("usrbinmath: operation %s is not supported" % op)
+
+def chunks(op, ua, i, ub, j, scale=(1.0, 1.0), chunk=CHUNK):
+    """Iterate over the (value, relative error, sigma>0 mask) arrays of the operation
+    on the detector i of ua and j of ub in chunks of flat bins of the memory-mapped data"""
+    a, ea = ua.array(i)
+    b, eb = ub.array(j)
+    a, b = a.reshape(-1), b.reshape(-1)
+    for k in range(0, len(a), chunk):
+        s = slice(k, k+chunk)
+        ca, cb = scale[0]*a[s], scale[1]*b[s]
+        cea = 0.0 if ea is None else ea.reshape(-1)[s] # no statistics of a single cycle
+        ceb = 0.0 if eb is None else eb.reshape(-1)[s]
+        val, err = compute(op, ca, cea, cb, ceb)
+        yield val, err, (ca*cea != 0) | (cb*ceb != 0)
+
+def getChi2(ua, i, ub, j, scale=(1.0, 1.0), chunk=CHUNK):
+    """Return (chi2, ndf) of the comparison of the detector i of ua and j of ub.
+    Only the bins with a non-zero uncertainty are counted."""
+    chi2, ndf = 0.0, 0
+    for val, err, ok in chunks("chi2", ua, i, ub, j, scale, chunk):
+        chi2 += float(val.sum())
+        ndf += int(np.count_nonzero(ok))
+    return chi2, ndf
+
+def writeRecord(f, arrays, size):
+    """Write the fortran record of the float32 arrays with the total size in bytes"""
+    f.write(struct.pack("=i", size))
+    for x in arrays:
+        f.write(x.astype("=f4").tobytes())
+    f.write(struct.pack("=i", size))
+
+def write(fname, op, ua, ub, scale=(1.0, 1.0), chunk=CHUNK):
+    """Write the result of the operation in the usbsuw format of ua: the records of ua are copied
+    with the detector data replaced by the result and the statistics by its relative errors.
+    Each detector is processed twice (values, then errors) so that no full-size array is kept in memory."""
+    pairs = dict(getPairs(ua, ub))
+    data = dict((det.datapos, i) for i, det in enumerate(ua.detector))
+    src = ua.hnd
+    src.seek(0)
+    with open(fname, "wb") as f:
+        while True:
+            pos = src.tell()
+            rec = fortran.read(src)
+            if rec is None or (len(rec) == 14 and rec[:10] == b"STATISTICS"):
+                break
+            if pos in data:
+                i = data[pos]
+                writeRecord(f, (x[0] for x in chunks(op, ua, i, ub, pairs[i], scale, chunk)), len(rec))
+            else:
+                fortran.write(f, rec)
+        fortran.write(f, struct.pack("=10si", b"STATISTICS", 0))
+        for i, det in enumerate(ua.detector):
+            size = 4*int(np.prod(ua.getShape(i)))
+            writeRecord(f, (x[1] for x in chunks(op, ua, i, ub, pairs[i], scale, chunk)), size)
+
+def main():
+    """
+    Element-wise operations on the USRBIN detectors of two usbsuw files with the same meshes.
+    The relative errors are propagated assuming uncorrelated runs. The result is written
+    in the usbsuw format, so it can be converted by usbsuw2root, usbsuw2vtk etc.
+    pull writes (A-B)/sigma and chi2 writes its square, both print chi2/ndf of each detector.
+    Example: usrbinmath div new.usrbin old.usrbin -o ratio.usrbin
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('op', type=str, choices=OPERATIONS, help='operation')
+    parser.add_argument('A', type=str, help='first usbsuw file')
+    parser.add_argument('B', type=str, help='second usbsuw file')
+    parser.add_argument('-o', dest='out', type=str, default=None, help='output usbsuw file name')
+    parser.add_argument('-scale', dest='scale', type=float, nargs=2, default=(1.0, 1.0), metavar=('SA', 'SB'), help='scale factors of A and B')
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of bins processed at once', default=CHUNK)
+    args = parser.parse_args()
+
+    ua, ub = Data.Usrbin(args.A), Data.Usrbin(args.B)
+    try:
+        pairs = getPairs(ua, ub)
+    except IOError as e:
+        sys.exit(str(e))
+
+    if args.op in ("pull", "chi2"):
+        for i, j in pairs:
+            chi2, ndf = getChi2(ua, i, ub, j, args.scale, args.chunk)
+            name = ua.detector[i].name
+            print("%s: chi2/ndf = %g/%d = %g" % (name.decode() if isinstance(name, bytes) else name,
+                                                chi2, ndf, chi2/ndf if ndf else 0.0))
+
+    if args.out:
+        write(args.out, args.op, ua, ub, args.scale, args.chunk)
+    elif args.op not in ("pull", "chi2"):
+        sys.exit("usrbinmath: the output file name is required for %s" % args.op)
+    ua.close()
+    ub.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,12 @@
 #! /usr/bin/python2 -W all
 
 from __future__ import print_function
-import sys, argparse, struct
+import sys, argparse
 from os import path
 import numpy as np
 from mctools import fluka
-from mctools.fluka.flair import Data, fortran
+from mctools.fluka.flair import Data
+from mctools.common import FillHist
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
@@ -61,102 +62,23 @@ def histN(det):
         return 0
 
 
-class Usrtrack(Data.Usrxxx):
-    """ Reads the ustsuw binary output
-        (USRTRACK / USRCOLL estimators)
-    """
-    def readHeader(self, filename):
-        """ Reads the file header info 
-            Based on Data.Usrbdx
-        """
-        f = Data.Usrxxx.readHeader(self, filename)
-#        self.sayHeader()
-        
-        while True:
-            data = fortran.read(f)
-            if data is None: break
-            size = len(data)
-#            print("size: ", size)
-
-            if size == 14 and data[:10] == "STATISTICS":
-                self.statpos = f.tell()
-                for det in self.detector:
-                    data = Data.unpackArray(fortran.read(f))
-                    det.total = data[0]
-                    det.totalerror = data[1]
-#                    for j in range(6):
-#                        fortran.skip(f)
-                break
-
-            if size != 50: raise IOError("Invalid USRTRACK/USRCOLL file")
-
-            header = struct.unpack("=i10siiififfif", data)
-
-            det = Data.Detector()
-            det.nb = header[0]
-            det.name = header[1].strip() # titutc - track/coll name
-            det.type = header[2] # itustc - type of binning: 1 - linear energy etc
-            det.dist = header[3] # idustc = distribution to be scored
-            det.reg  = header[4] # nrustc = region
-            det.volume = header[5] # vusrtc = volume (cm**3) of the detector
-            det.lowneu = header[6] # llnutc = low energy neutron flag
-            det.elow = header[7] # etclow = minimum energy [GeV]
-            det.ehigh = header[8] # etchgh = maximum energy [GeV]
-            det.ne = header[9] # netcbn = number of energy intervals
-            det.de = header[10] # detcbn = energy bin width
-
-            self.detector.append(det)
-
-            if det.lowneu:
-                data = fortran.read(f)
-                det.ngroup = struct.unpack("=i",data[:4])[0]
-                det.egroup = struct.unpack("=%df"%(det.ngroup+1), data[4:])
-                print("Low energy neutrons scored with %d groups" % det.ngroup)
-            else:
-		det.ngroup = 0
-		det.egroup = []
-
-	    size  = (det.ngroup+det.ne) * 4
-	    if size != fortran.skip(f):
-		raise IOError("Invalid USRTRACK file")
-        f.close()
-
-    def printHeader(self, i):
-        """ Prints the header """
-        det = self.detector[i]
-        print("Detector:", det.name)
-        print(" binning type: ", det.type)
-        print(" distribution to be scored:", det.dist)
-        print(" region:", det.reg)
-        print(" volume:", det.volume)
-        print(" low energy neutrons:", det.lowneu)
-        print(" %g < E < %g GeV / %d bins; bin width: %g" % (det.elow, det.ehigh, det.ne, det.de))
-        
-    def readStat(self, det,lowneu):
-	""" Read detector # det statistical data """
-	if self.statpos < 0: return None
-	with open(self.file,"rb") as f:
-	    f.seek(self.statpos)
-	    for i in range(det+3): # check that 3 gives correct errors with 1 USRTRACK detector
-	        fortran.skip(f)	# skip previous detectors
-	    data = fortran.read(f)
-	return data
-
-    def readData(self, det,lowneu):
-	"""Read detector det data structure"""
-	f = open(self.file,"rb")
-	fortran.skip(f)	# Skip header
-	for i in range(2*det):
-	    fortran.skip(f)	# Detector Header & Data
-	fortran.skip(f)		# Detector Header
-        if lowneu:
-            fortran.skip(f) # skip low enery neutron data
-	data = fortran.read(f)
-	f.close()
-	return data
-
-            
-                
+def write(b):
+    """ Write histograms of all detectors of the Data.Usrtrack b into the current ROOT directory """
+    for i in range(len(b.detector)):
+        det = b.detector[i]
+        val = b.readDataArray(i)
+        stat = b.readStatArray(i) # None for single-cycle files
+        err = np.zeros(val.shape, dtype=val.dtype) if stat is None else stat[::-1] * val # relative errors are stored in the reversed order
+
+        h = hist(det)
+        hn = histN(det) # filled only if det.lowneu
+
+        FillHist(h, val, err)
+
+        h.SetEntries(b.weight)
+        h.Write()
+        if det.lowneu:
+            hn.Write()
 
 def main():
     """ Converts ustsuw output into a ROOT TH1F histogram """
@@ -178,7 +100,7 @@ def main():
     else:
         rootFileName = args.root
     
-    b = Usrtrack()
+    b = Data.Usrtrack()
     b.readHeader(args.usrtrack)
 
     ND = len(b.detector)
@@ -186,33 +108,11 @@ def main():
     if args.verbose:
         #b.sayHeader()
         for i in range(ND):
-            b.printHeader(i)
+            b.say(i)
             print("")
 
     fout = ROOT.TFile(rootFileName, "recreate")
-    for i in range(ND):
-        val = Data.unpackArray(b.readData(i,b.detector[i].lowneu))
-        err = Data.unpackArray(b.readStat(i,b.detector[i].lowneu))
-
-        det = b.detector[i]
-
-        h = hist(det)
-        hn = histN(det) # filled only if det.lowneu
-            
-        n = h.GetNbinsX()
-        print(n, len(val), det.ne, val)
-
-        for i in range(det.ne):
-            h.SetBinContent(i+1, val[i])
-
-        for i in range(det.ne):
-            h.SetBinError(i+1,   err[n-i-1]*val[i])
-
-        h.SetEntries(b.weight)
-        h.Write()
-        if det.lowneu:
-            hn.Write()
-
+    write(b)
     fout.Close()
 
 if __name__=="__main__":
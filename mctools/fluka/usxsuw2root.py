@@ -6,6 +6,7 @@ from os import path
 import numpy as np
 from mctools import fluka
 from mctools.fluka.flair import Data
+from mctools.common import FillHist
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
@@ -79,6 +80,20 @@ def hist(det):
     title += getAxesTitle(det,w1[0])
     return ROOT.TH2F(det.name, title, det.ne, getEbins(det, w1[0]), det.na, getAbins(det, w1[0]))
 
+def write(b):
+    """ Write histograms of all detectors of the Data.Usrbdx b into the current ROOT directory """
+    for i in range(len(b.detector)):
+        val = b.readDataArray(i) # (na, ne)
+        stat = b.readStatArray(i) # None for single-cycle files
+        err = np.zeros(val.shape, dtype=val.dtype) if stat is None else stat * val
+        det = b.detector[i]
+
+        h = hist(det)
+
+        FillHist(h, val, err)
+        h.SetEntries(b.weight)
+        h.Write()
+
 def main():
     """ Converts usxsuw output into a ROOT TH2F histogram """
 
@@ -112,21 +127,7 @@ def main():
             print("")
 
     fout = ROOT.TFile(rootFileName, "recreate")
-    for i in range(ND):
-        val = Data.unpackArray(b.readData(i))
-        err = Data.unpackArray(b.readStat(i))
-        det = b.detector[i]
-
-        h = hist(det)
-        
-        for i in range(det.ne):
-            for j in range(det.na):
-                    gbin = i + j * det.ne
-                    h.SetBinContent(i+1, j+1, val[gbin])
-                    h.SetBinError(i+1, j+1, err[gbin]*val[gbin])
-        h.SetEntries(b.weight)
-        h.Write()
-
+    write(b)
     fout.Close()
 
 if __name__=="__main__":
@@ -4,21 +4,23 @@
 
 from __future__ import print_function
 import sys, math, struct
+import numpy as np
+from mctools.fluka.flair import fortran
+
+CHUNK = 262144 # number of hits read/written at once by the chunked methods
+
+# struct format of the second header record and positions of (np1, nrss, niss) in it
+_counters = { 20 : ("=5i",   0, 1, 4), # MCNPX 2.6.0
+              40 : ("=5i5i", 0, 2, 8), # MCNPX 2.7.0
+              32 : ("=4i4i", 0, 2, 7)  # MCNP6
+}
 
 #-------------------------------------------------------------------------------
 # Read a fortran structure from a binary file
 # @return data, None for EOF
+# Kept for the external users, SSW reads the records with fortran.Reader
 #-------------------------------------------------------------------------------
-def fortranRead(f):
-        blen = f.read(4)
-        if len(blen)==0: return None
-        (size,) = struct.unpack("=i", blen)
-#       print("length:", size)
-        data  = f.read(size)
-        blen2 = f.read(4)
-        if blen != blen2:
-                raise IOError("Reading fortran block")
-        return data
+fortranRead = fortran.read
 
 
 #-------------------------------------------------------------------------------
@@ -28,6 +30,33 @@ def unpackArray(data):
         return struct.unpack("=%df"%(len(data)//4),  data)
 
 
+# names of the SSB record values (see ssw2txt for their meaning)
+columns = ("history", "id", "weight", "energy", "time", "x", "y", "z", "wx", "wy", "k")
+
+def getColumn(ssb, name):
+        """Return the given SSB value or a derived variable for all hits of a (nhits, nrcd) array.
+        The derived variables are defined as the corresponding ssw2root aliases.
+        """
+        if name in columns:
+                return ssb[:, columns.index(name)]
+        id = ssb[:, 1]
+        if name == "surface": # surface crossed
+                return np.abs(id) % 1000000
+        i = np.rint(np.abs(id/1E+6))
+        JGP = -np.rint(i/200.0) # energy group
+        if name == "JGP":
+                return JGP
+        if name == "IPT": # particle type: 1=neutron, 2=photon, 3=electron
+                JC = np.rint(i/100.0) + 2*JGP
+                return i-100*JC+200*JGP
+        if name == "wz": # z-direction cosine
+                wx, wy = ssb[:, 8], ssb[:, 9]
+                return np.sqrt(np.maximum(0, 1-wx*wx-wy*wy)) * np.sign(id)
+        if name == "theta":
+                return np.degrees(np.arctan2(ssb[:, 5], ssb[:, 6])) % 360.0
+        raise ValueError("ssw.py: unknown variable %s" % name)
+
+
 #       """Class to read the SSW output file (wssa)"""
 class SSW:
     def __init__(self, filename=None):
@@ -39,6 +68,7 @@ class SSW:
     def reset(self):
         """Reset header information"""
         self.file = None
+        self.reader = None # buffered fortran reader of the file
         self.fname = ""
         self.kods = "" # 8 Code ID
         self.vers = "" # 5 Version
@@ -57,6 +87,12 @@ class SSW:
         self.nrcd = 0 # length of ssb-array (?) = evtl+1 (?)
         self.nrcdo = 0
         self.N = 0 # number of incident particles
+        self.np1 = 0 # signed history number of the SSW-run as written in the header
+        self.niss = 0 # number of histories in RSSA data
+
+        self.cntpos = 0 # file position of the (np1, nrss, niss) header record
+        self.cntsize = 0 # its length
+        self.datapos = 0 # file position of the first SSB record
 
 #     Structure of SSB-Arrays -- see Harold Breitkreutz thesis for details
         self.ssb  = [] # 11   Surface-Source info
@@ -67,6 +103,21 @@ class SSW:
         self.supported_mcnp_versions = self.supported_mcnpx_verstions + self.supported_mcnp6_versions
 
 
+    def close(self):
+        """Close the fortran reader and the file opened by readHeader"""
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def getTitle(self):
         """Return the problem title"""
         return self.aids
@@ -84,8 +135,9 @@ class SSW:
         self.reset()
         self.fname = filename
         self.file = open(self.fname, "rb")
+        self.reader = fortran.Reader(self.file, "=", 4)
 
-        data = fortranRead(self.file)
+        data = self.reader.read()
         if data is None: raise IOError("Invalid SSW file")
         size = len(data)
         # This is according to Esben's subs.f, but the format seems to be wrong
@@ -95,7 +147,7 @@ class SSW:
         if size == 8: # mcnp 6
                 (tmpi0) = struct.unpack('8s',data) # wssa file type
  #               print(" type_of_rssa:", tmpi0[0].decode())
-                data = fortranRead(self.file)
+                data = self.reader.read()
                 (self.kods, self.vers, self.lods, self.idtms, self.aids, self.knods) = struct.unpack("=8s5s28s18s80si", data)
                 self.vers = self.vers.decode().strip()
                 if self.vers not in self.supported_mcnp6_versions:
@@ -131,8 +183,10 @@ class SSW:
         if self.kods not in ['mcnpx', 'mcnp'] or self.vers not in self.supported_mcnp_versions:
                 self.unsupported()
 
-        data = fortranRead(self.file)
+        data = self.reader.read()
         size = len(data)
+        self.cntpos = self.reader.tell() - size - 4
+        self.cntsize = size
         # np1 - history number in ssw-run
         # nrss - number of tracks in RSSA data
         # njsw - number of surfaces in RSSA data
@@ -154,6 +208,8 @@ class SSW:
                 sys.exit(1)
 
         self.N = abs(np1)
+        self.np1 = np1
+        self.niss = niss
         print("number of incident particles:\t%i" % abs(np1))
         print("number of tracks:\t%i" % nrss)
         print("length of ssb array:\t%i" % self.nrcd)
@@ -170,9 +226,10 @@ class SSW:
 #        print("Number of tracks:", nevt)
         self.nevt = nevt
         tmp = []
+        niwr = 0
         if np1 < 0:
             np1 = abs(np1)
-            data = fortranRead(self.file)
+            data = self.reader.read()
 #            print(len(data))
             # (niwr, mipts,tmp
             tmp = struct.unpack("=%di" % int(len(data)/4) ,data) # ??? why tmp ???
@@ -183,7 +240,7 @@ class SSW:
         if self.nrcd != 6 and self.nrcd != 10: self.nrcd = self.nrcd - 1
 
         for i in range(njsw+niwr):
-            data = fortranRead(self.file)
+            data = self.reader.read()
             size = len(data)
 #            print("size", size)
             tmpii, tmpkk, tmpnn, tmp = struct.unpack("=3i%ds" % int(size-12), data) #  12=3*4 due to '3i'
@@ -199,17 +256,92 @@ class SSW:
             self.kstpps.append(tmpkk)
             self.ntppsp.append(tmpnn)
 
-        data = fortranRead(self.file)
+        data = self.reader.read()
 #        print(len(data), (2+4*mipts), (njsw+niwr))
 #        for i in range(2+4*mipts):
 #            for j in range(njsw+niwr):
 #                a = 1 # !!! to be implemented
-        
+
+        self.datapos = self.reader.tell()
+        self.file.seek(self.datapos) # the chunked methods read the hits from the file handle
         return self.file
 
+    def getHeader(self, np1=None, nrss=None, niss=None):
+        """Return the raw header records with the given (np1, nrss, niss) counters.
+        The sign of np1 is kept from the original header.
+        """
+        pos = self.file.tell()
+        self.file.seek(0)
+        header = bytearray(self.file.read(self.datapos))
+        self.file.seek(pos)
+        fmt, inp1, inrss, iniss = _counters[self.cntsize]
+        val = list(struct.unpack_from(fmt, header, self.cntpos))
+        if np1 is not None:
+                val[inp1] = -np1 if val[inp1] < 0 else np1
+        if nrss is not None:
+                val[inrss] = nrss
+        if niss is not None:
+                val[iniss] = niss
+        struct.pack_into(fmt, header, self.cntpos, *val)
+        return bytes(header)
+
+    def getRecordLength(self):
+        """Return the number of values in the SSB record"""
+        if self.nevt == 0:
+                return self.nrcd+1
+        pos = self.file.tell()
+        self.file.seek(self.datapos)
+        (size,) = struct.unpack("=i", self.file.read(4))
+        self.file.seek(pos)
+        return size//8
+
+    def getDtype(self):
+        """Return numpy dtype of the SSB record including the fortran record markers"""
+        return recordDtype(self.getRecordLength())
+
+    def readRecords(self, nhits=CHUNK):
+        """Read up to nhits raw SSB records starting from the current file position.
+        Return a structured array with the fortran markers, empty at EOF.
+        """
+        dt = self.getDtype()
+        data = self.file.read(nhits*dt.itemsize)
+        rec = np.frombuffer(data, dtype=dt, count=len(data)//dt.itemsize)
+        if np.any(rec["blen"] != dt["ssb"].itemsize) or np.any(rec["blen2"] != rec["blen"]):
+                raise IOError("Reading fortran block")
+        return rec
+
+    def records(self, chunk=CHUNK):
+        """Iterate over all raw SSB records in chunks of the given number of hits"""
+        self.file.seek(self.datapos)
+        left = self.nevt
+        while left > 0:
+                rec = self.readRecords(min(chunk, left))
+                if len(rec) == 0:
+                        break
+                left -= len(rec)
+                yield rec
+
+    def chunks(self, chunk=CHUNK):
+        """Iterate over all hits in chunks of the given size.
+        Each chunk is a (nhits, nrcd) array with the SSB values of a hit in a row.
+        """
+        for rec in self.records(chunk):
+                yield rec["ssb"]
+
+    def getRanges(self, n):
+        """Split the SSB records into n contiguous ranges of about the same size.
+        Return a list of RecordRange objects which can be processed independently.
+        """
+        reclen = self.getRecordLength()
+        bounds = [self.nevt*i//n for i in range(n+1)]
+        return [RecordRange(self.fname, self.datapos, reclen, bounds[i], bounds[i+1]-bounds[i])
+                for i in range(n)]
+
     def readHit(self):
         """Read neutron data and return the SSB array"""
-        data = fortranRead(self.file)
+        self.reader.seek(self.file.tell())
+        data = self.reader.read()
+        self.file.seek(self.reader.tell())
         if self.vers in ("6", "6.mpi"):
                 size = len(data)
 #               print("here", self.nrcd, size)
@@ -218,3 +350,152 @@ class SSW:
         else:
                 ssb = struct.unpack("=%dd" % int(self.nrcd+1), data) # ??? why +1 Esben does not have it
         return ssb
+
+
+def recordDtype(reclen):
+    """Return numpy dtype of the SSB record of reclen values including the fortran record markers"""
+    return np.dtype([("blen",  "=i4"),
+                     ("ssb",   "=f8", (reclen,)),
+                     ("blen2", "=i4")])
+
+
+class RecordRange:
+    """A range of SSB records of a SSW file.
+    The records are memory-mapped only when processed, so the range can be
+    sent to a worker process.
+    """
+    def __init__(self, fname, datapos, reclen, first, nhits):
+        self.fname = fname
+        self.datapos = datapos # file position of the first SSB record of the file
+        self.reclen = reclen   # number of values in the SSB record
+        self.first = first     # index of the first record of the range
+        self.nhits = nhits     # number of records in the range
+
+    def records(self):
+        """Return the memory-mapped raw SSB records of the range"""
+        if self.nhits == 0:
+            return np.zeros(0, dtype=recordDtype(self.reclen))
+        dt = recordDtype(self.reclen)
+        return np.memmap(self.fname, dtype=dt, mode="r",
+                         offset=self.datapos+self.first*dt.itemsize, shape=(self.nhits,))
+
+    def chunks(self, chunk=CHUNK):
+        """Iterate over the hits of the range in chunks of the given size"""
+        rec = self.records()
+        for i in range(0, self.nhits, chunk):
+            part = rec[i:i+chunk]
+            if np.any(part["blen"] != 8*self.reclen) or np.any(part["blen2"] != part["blen"]):
+                raise IOError("Reading fortran block")
+            yield np.array(part["ssb"])
+
+
+def mapRanges(func, ranges, workers, *args):
+    """Return the list of func(r, *args) for each RecordRange r in ranges.
+    The ranges are processed by a pool of worker processes if workers > 1.
+    """
+    if workers <= 1:
+        return [func(r, *args) for r in ranges]
+    from concurrent.futures import ProcessPoolExecutor # not in the Python 2.7 standard library
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(func, r, *args) for r in ranges]
+        return [f.result() for f in futures]
+
+
+class SSWWriter:
+    """Writes SSB records into a new SSW file with the header of an existing one"""
+    def __init__(self, filename, ssw):
+        self.ssw = ssw
+        self.file = open(filename, "wb")
+        self.file.write(ssw.getHeader())
+        self.nrss = 0 # number of tracks written
+        self.niss = 0 # number of histories written
+        self.last = None # last history number written
+
+    def write(self, rec, offset=0):
+        """Write raw SSB records (as returned by SSW.records) shifting the history numbers by offset"""
+        if len(rec) == 0: return
+        if offset:
+                h = rec["ssb"][:,0]
+                rec["ssb"][:,0] = np.copysign(np.abs(h)+offset, h)
+        h = np.abs(rec["ssb"][:,0])
+        self.niss += int(np.count_nonzero(h[1:] != h[:-1])) + int(h[0] != self.last)
+        self.last = h[-1]
+        self.nrss += len(rec)
+        self.file.write(rec.tobytes())
+
+    def close(self, np1):
+        """Update the header counters with np1 incident particles and close the file"""
+        self.file.seek(0)
+        self.file.write(self.ssw.getHeader(np1, self.nrss, self.niss))
+        self.file.close()
+
+
+def merge(fnames, fout_name, chunk=CHUNK):
+    """Concatenate SSW files of independent runs into fout_name.
+    History numbers of each file are shifted by the number of incident
+    particles of the preceding files, and np1 of the output is their sum.
+    """
+    ssws = [SSW(f) for f in fnames]
+    first = ssws[0]
+    for s in ssws[1:]:
+        if s.vers != first.vers or s.cntsize != first.cntsize or \
+           s.getRecordLength() != first.getRecordLength() or s.isurfs != first.isurfs:
+                raise IOError("ssw.py: %s is not compatible with %s" % (s.fname, first.fname))
+
+    fout = SSWWriter(fout_name, first)
+    offset = 0
+    for s in ssws:
+        for rec in s.records(chunk):
+            fout.write(rec.copy(), offset)
+        offset += s.N
+    fout.close(offset)
+    for s in ssws:
+        s.close()
+
+    return offset
+
+
+def split(fname, nshards, prefix=None, chunk=CHUNK):
+    """Split a SSW file into nshards files named prefix.0, prefix.1, ...
+    Each shard gets about the same number of tracks, but the tracks of a
+    history are never split between shards. History numbers are counted
+    from the beginning of each shard and np1 of a shard is the number of
+    histories it covers, so merging the shards restores the original file.
+    Return the list of file names produced.
+    """
+    if prefix is None:
+        prefix = fname
+    s = SSW(fname)
+    target = max(1, -(-s.nevt // nshards)) # tracks per shard
+    names = ["%s.%d" % (prefix, i) for i in range(nshards)]
+
+    k = 0
+    base = 0 # last history of the previous shards
+    fout = SSWWriter(names[k], s)
+    for rec in s.records(chunk):
+        rec = rec.copy()
+        h = np.abs(rec["ssb"][:,0])
+        pos = 0
+        while pos < len(rec):
+            if k == nshards-1:
+                n = len(rec)-pos
+            elif fout.nrss < target:
+                n = min(len(rec)-pos, target-fout.nrss)
+            else: # shard is full: continue up to the end of the current history
+                last = fout.last + base
+                idx = np.flatnonzero(h[pos:] != last)
+                n = idx[0] if len(idx) else len(rec)-pos
+                if n == 0:
+                    fout.close(int(last-base))
+                    base = int(last)
+                    k += 1
+                    fout = SSWWriter(names[k], s)
+                    continue
+            fout.write(rec[pos:pos+n], -base)
+            pos += n
+    fout.close(s.N-base)
+    for name in names[k+1:]: # fewer histories than shards
+        SSWWriter(name, s).close(0)
+    s.close()
+
+    return names
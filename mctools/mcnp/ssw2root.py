@@ -2,8 +2,9 @@
 # https://github.com/kbat/mc-tools
 #
 
-import sys, argparse
-from mctools.mcnp.ssw import SSW
+import sys, os, argparse
+import numpy as np
+from mctools.mcnp.ssw import SSW, CHUNK, mapRanges
 # from ROOT import TFile, TTree, gROOT
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -23,32 +24,35 @@ ROOT.gROOT.ProcessLine(
    Float_t k;\
 };" );
 
+# Fills the tree with n hits from the (n, reclen) array of SSB records in one call
+ROOT.gInterpreter.Declare(
+"void ssw2root_fill(TTree *T, hit_t &hits, const Double_t *ssb, Long64_t n, Int_t reclen) {\
+   for (Long64_t i=0; i<n; i++) {\
+      const Double_t *hit = ssb + i*reclen;\
+      hits.history = hit[0];\
+      hits.id      = hit[1];\
+      hits.weight  = hit[2];\
+      hits.energy  = hit[3];\
+      hits.time    = hit[4];\
+      hits.x       = hit[5];\
+      hits.y       = hit[6];\
+      hits.z       = hit[7];\
+      hits.wx      = hit[8];\
+      hits.wy      = hit[9];\
+      hits.k       = hit[10];\
+      T->Fill();\
+   }\
+}" );
 
-def main():
-    """
-    Converts SSW binary to the ROOT format as a TTree object
-    """
-
-    allowed_splitlevels = (1, 99)
-    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools')
-    parser.add_argument('-splitlevel', dest='splitlevel', type=int, help='split level (see TTree::Branch documentation)', required=False, default=1, choices=allowed_splitlevels)
-    parser.add_argument('wssa', type=str, help='ssw output file name')
-    arguments = parser.parse_args()
-
-    fin_name = arguments.wssa
-    fout_name = fin_name + ".root"
-
-    hits = ROOT.hit_t()
-
-    ssw = SSW(fin_name)
 
-    fout = ROOT.TFile(fout_name, "recreate", ssw.getTitle())
-    T = ROOT.TTree("T", ssw.probs)
+def makeTree(title, splitlevel, hits):
+    """Create the TTree with branches pointing to the hits structure"""
+    T = ROOT.TTree("T", title)
 #    T.SetMaxTreeSize((Long64_t)1e+18)
 
-    if arguments.splitlevel==99:
+    if splitlevel==99:
         T.Branch("hits", hits, "history:id:weight:energy:time:x:y:z:wx:wy:k")
-    elif arguments.splitlevel == 1:
+    elif splitlevel == 1:
         T.Branch("history", ROOT.AddressOf(hits, 'history'), "history")
         T.Branch("id",      ROOT.AddressOf(hits, 'id'),      "id")
         T.Branch("weight",  ROOT.AddressOf(hits, 'weight'),  "weight")
@@ -61,24 +65,27 @@ def main():
         T.Branch("wy",      ROOT.AddressOf(hits, 'wy'),      "wy")
         T.Branch("k",       ROOT.AddressOf(hits, 'k'),       "k")
 
-    for i in range(ssw.nevt):
-        ssb = ssw.readHit()
-        hits.history = ssb[0] # >0 = with collision, <0 = without collision
-        hits.id = ssb[1] # surface + particle type + multigroup problem info
-        hits.weight = ssb[2]
-        hits.energy = ssb[3] # [MeV]
-        hits.time = ssb[4] # [shakes]
-        hits.x = ssb[5] # [cm]
-        hits.y = ssb[6] # [cm]
-        hits.z = ssb[7] # [cm]
-        hits.wx = ssb[8]
-        hits.wy = ssb[9]
-        hits.k = ssb[10] # cosine of angle between track and normal to surface jsu (in MCNPX it is called cs)
-        T.Fill()
-
-    ssw.file.close()
-        
-    sinfo = ROOT.TObjString("%d" % ssw.N); # number of incident particles for correct normalisation
+    return T
+
+def fillTree(T, hits, chunks):
+    """Fill the tree with the SSB arrays from the chunks iterator.
+    The SSB values are:
+      history # >0 = with collision, <0 = without collision
+      id      # surface + particle type + multigroup problem info
+      weight
+      energy  # [MeV]
+      time    # [shakes]
+      x y z   # [cm]
+      wx wy   # direction cosines
+      k       # cosine of angle between track and normal to surface jsu (in MCNPX it is called cs)
+    """
+    for ssb in chunks:
+        ssb = np.ascontiguousarray(ssb, dtype=np.float64)
+        ROOT.ssw2root_fill(T, hits, ssb, ssb.shape[0], ssb.shape[1])
+
+def setInfo(T, N):
+    """Save the number of incident particles and define the aliases"""
+    sinfo = ROOT.TObjString("%d" % N); # number of incident particles for correct normalisation
     T.GetUserInfo().Add(sinfo);
 
 #    T.Print()
@@ -89,9 +96,61 @@ def main():
     T.SetAlias("IPT","i-100*JC+200*JGP");              # particle type: 1=neutron, 2=photon, 3=electron
     T.SetAlias("wz", "TMath::Sqrt(TMath::Max(0, 1-wx*wx-wy*wy)) * id/TMath::Abs(id)") # z-direction cosine
     T.SetAlias("surface", "TMath::Abs(id) % 1000000") # surface crossed
+
+def convertRange(r, prefix, title, splitlevel, chunk):
+    """Convert the hits of the ssw.RecordRange r into a TTree in a separate ROOT file and return its name"""
+    fname = "%s.%d" % (prefix, r.first)
+    hits = ROOT.hit_t()
+    fout = ROOT.TFile(fname, "recreate")
+    T = makeTree(title, splitlevel, hits)
+    fillTree(T, hits, r.chunks(chunk))
+    T.Write()
+    fout.Close()
+    return fname
+
+def main():
+    """
+    Converts SSW binary to the ROOT format as a TTree object
+    """
+
+    allowed_splitlevels = (1, 99)
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools')
+    parser.add_argument('-splitlevel', dest='splitlevel', type=int, help='split level (see TTree::Branch documentation)', required=False, default=1, choices=allowed_splitlevels)
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of tracks processed at once', default=CHUNK)
+    parser.add_argument('-workers', dest='workers', type=int, help='number of worker processes', default=1)
+    parser.add_argument('wssa', type=str, help='ssw output file name')
+    arguments = parser.parse_args()
+
+    fin_name = arguments.wssa
+    fout_name = fin_name + ".root"
+
+    ssw = SSW(fin_name)
+
+    parts = []
+    if arguments.workers <= 1:
+        hits = ROOT.hit_t()
+        fout = ROOT.TFile(fout_name, "recreate", ssw.getTitle())
+        T = makeTree(ssw.probs, arguments.splitlevel, hits)
+        fillTree(T, hits, ssw.chunks(arguments.chunk))
+    else:
+        # each worker converts its range into a separate file, the trees are concatenated in order at the end
+        ranges = ssw.getRanges(arguments.workers)
+        parts = mapRanges(convertRange, ranges, arguments.workers, fout_name, ssw.probs, arguments.splitlevel, arguments.chunk)
+        chain = ROOT.TChain("T")
+        for fname in parts:
+            chain.Add(fname)
+        fout = ROOT.TFile(fout_name, "recreate", ssw.getTitle())
+        T = chain.CloneTree(-1, "fast")
+
+    ssw.close()
+
+    setInfo(T, ssw.N)
     T.Write()
     fout.Purge()
     fout.Close()
 
+    for fname in parts:
+        os.unlink(fname)
+
 if __name__ == "__main__":
         sys.exit(main())
@@ -1,8 +1,53 @@
 #! /usr/bin/python -W all
 
 from __future__ import print_function
-import sys, argparse
-from mctools.mcnp.ssw import SSW
+import sys, os, argparse, shutil, zipfile
+import numpy as np
+from mctools.mcnp.ssw import SSW, CHUNK, columns, mapRanges
+
+BUFSIZE = 1<<24 # output buffer size [bytes]
+# history and id are integers; the other values are written with the full double precision
+FMT = " ".join(["%d", "%d"] + ["%.17g"]*9)
+
+def writeHits(f, ssb):
+    """Write the hits of the (nhits, nrcd) SSB array into the text file f"""
+    # history id weight energy time x y z wx wy k
+    np.savetxt(f, ssb[:, :11], fmt=FMT)
+
+def writeRange(r, prefix, chunk):
+    """Write the hits of the ssw.RecordRange r into a text file and return its name"""
+    fname = "%s.%d" % (prefix, r.first)
+    with open(fname, "w", BUFSIZE) as f:
+        for ssb in r.chunks(chunk):
+            writeHits(f, ssb)
+    return fname
+
+def getColumnFileName(prefix, name):
+    """Return the .npy file name of the given column"""
+    return "%s.%s.npy" % (prefix, name)
+
+def writeColumns(r, prefix, chunk):
+    """Write the hits of the ssw.RecordRange r into the preallocated .npy column files"""
+    cols = [np.lib.format.open_memmap(getColumnFileName(prefix, name), mode="r+") for name in columns]
+    first = r.first
+    for ssb in r.chunks(chunk):
+        for i, col in enumerate(cols):
+            col[first:first+len(ssb)] = ssb[:, i]
+        first += len(ssb)
+    for col in cols:
+        col.flush()
+
+def saveColumns(ssw, prefix, fmt, workers, chunk):
+    """Save the SSB values into one .npy file per column, or into a single compressed .npz file"""
+    for name in columns:
+        np.lib.format.open_memmap(getColumnFileName(prefix, name), mode="w+", dtype=np.float64, shape=(ssw.nevt,))
+    mapRanges(writeColumns, ssw.getRanges(max(1, workers)), workers, prefix, chunk)
+
+    if fmt == "npz":
+        with zipfile.ZipFile(prefix+".npz", "w", zipfile.ZIP_DEFLATED, allowZip64=True) as z:
+            for name in columns:
+                z.write(getColumnFileName(prefix, name), name+".npy")
+                os.unlink(getColumnFileName(prefix, name))
 
 def main():
     """
@@ -19,31 +64,42 @@ def main():
 
     parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('wssa', type=str, help='ssw output file name')
+    parser.add_argument('-o', dest='out', type=str, help='output file name (prefix of the column files if format is npy). By default the text is written to stdout and columns to wssa.npy/wssa.npz', default=None)
+    parser.add_argument('-format', dest='format', type=str, help='output format: plain text, one .npy file per column or single compressed .npz file', default='txt', choices=('txt', 'npy', 'npz'))
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of tracks processed at once', default=CHUNK)
+    parser.add_argument('-workers', dest='workers', type=int, help='number of worker processes', default=1)
     arguments = parser.parse_args()
 
     fin_name = arguments.wssa
-    fout_name = fin_name + ".root"
 
     ssw = SSW(fin_name)
 
-    print("history id weight energy time x y z wx wy k")
-
-    for i in range(ssw.nevt):
-        ssb = ssw.readHit()
-        history = ssb[0] # >0 = with collision, <0 = without collision
-        id = ssb[1] # surface + particle type + multigroup problem info
-        weight = ssb[2]
-        energy = ssb[3] # [MeV]
-        time = ssb[4] # [shakes]
-        x = ssb[5] # [cm]
-        y = ssb[6] # [cm]
-        z = ssb[7] # [cm]
-        wx = ssb[8] # x-direction cosine
-        wy = ssb[9] # y-direction cosine
-        k = ssb[10] # cosine of angle between track and normal to surface jsu (in MCNPX it is called cs)
-        print(history, id, weight, energy, time, x, y, z, wx, wy, k)
-
-    ssw.file.close()
+    if arguments.format != 'txt':
+        prefix = arguments.out if arguments.out else fin_name
+        if prefix.endswith(".npz"):
+            prefix = prefix[:-4]
+        saveColumns(ssw, prefix, arguments.format, arguments.workers, arguments.chunk)
+        ssw.close()
+        return 0
+
+    fout = open(arguments.out, "w", BUFSIZE) if arguments.out else sys.stdout
+    print("history id weight energy time x y z wx wy k", file=fout)
+
+    if arguments.workers <= 1:
+        for ssb in ssw.chunks(arguments.chunk):
+            writeHits(fout, ssb)
+    else:
+        # each worker writes its range into a separate file, concatenated in order at the end
+        ranges = ssw.getRanges(arguments.workers)
+        fout.flush()
+        for fname in mapRanges(writeRange, ranges, arguments.workers, fin_name + ".txt", arguments.chunk):
+            with open(fname) as f:
+                shutil.copyfileobj(f, fout, BUFSIZE)
+            os.unlink(fname)
+
+    if fout is not sys.stdout:
+        fout.close()
+    ssw.close()
 
 if __name__ == "__main__":
 	sys.exit(main())
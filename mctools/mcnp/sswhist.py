@@ -0,0 +1,191 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, argparse
+import numpy as np
+from mctools.mcnp import ssw
+
+class Axis:
+    """Histogram axis with equal (or log10 equal) bin widths"""
+    def __init__(self, var, nbins, xmin, xmax, log=False):
+        if nbins < 1 or xmin >= xmax or (log and xmin <= 0):
+            raise ValueError("sswhist: wrong binning of %s" % var)
+        self.var   = var
+        self.nbins = nbins
+        self.xmin  = xmin
+        self.xmax  = xmax
+        self.log   = log
+
+    @classmethod
+    def parse(cls, s):
+        """Construct an axis from the 'var:nbins:min:max[:log]' string"""
+        w = s.split(":")
+        if len(w) not in (4, 5) or (len(w) == 5 and w[4] != "log"):
+            raise ValueError("sswhist: wrong axis definition '%s'" % s)
+        return cls(w[0], int(w[1]), float(w[2]), float(w[3]), len(w) == 5)
+
+    def getEdges(self):
+        """Return array of bin edges"""
+        if self.log:
+            return np.logspace(np.log10(self.xmin), np.log10(self.xmax), self.nbins+1)
+        return np.linspace(self.xmin, self.xmax, self.nbins+1)
+
+    def getIndex(self, x):
+        """Return bin indices of the given values, -1 if out of range"""
+        lo, hi = self.xmin, self.xmax
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.log:
+                x, lo, hi = np.log10(x), np.log10(lo), np.log10(hi)
+            u = (x-lo) * (self.nbins/(hi-lo))
+        idx = np.full(len(x), -1, dtype=np.int64)
+        ok = (u >= 0) & (u < self.nbins)
+        idx[ok] = u[ok].astype(np.int64)
+        return idx
+
+
+class SSWHist:
+    """N-dimensional weighted histograms of SSW hits, one per (surface, particle type)"""
+    def __init__(self, axes, surfaces=None, particles=None):
+        self.axes = axes
+        self.shape = tuple(a.nbins for a in axes)
+        self.nbins = int(np.prod(self.shape))
+        self.surfaces = surfaces   # surfaces to histogram (all if None)
+        self.particles = particles # particle types to histogram (all if None)
+        self.sumw  = {} # (surface, IPT) : sum of weights
+        self.sumw2 = {} # (surface, IPT) : sum of squared weights
+
+    def fill(self, ssb):
+        """Fill histograms with the hits of the (nhits, nrcd) SSB array"""
+        idx = np.zeros(len(ssb), dtype=np.int64)
+        ok = np.ones(len(ssb), dtype=bool)
+        for a in self.axes:
+            i = a.getIndex(ssw.getColumn(ssb, a.var))
+            ok &= i >= 0
+            idx = idx*a.nbins + i
+
+        surface = ssw.getColumn(ssb, "surface").astype(np.int64)
+        ipt = ssw.getColumn(ssb, "IPT").astype(np.int64)
+        if self.surfaces is not None:
+            ok &= np.isin(surface, self.surfaces)
+        if self.particles is not None:
+            ok &= np.isin(ipt, self.particles)
+
+        w = ssw.getColumn(ssb, "weight")[ok]
+        keys, inv = np.unique(surface[ok]*1000 + ipt[ok], return_inverse=True)
+        flat = inv.ravel()*self.nbins + idx[ok]
+        n = len(keys)*self.nbins
+        sumw  = np.bincount(flat, weights=w,   minlength=n).reshape((len(keys),)+self.shape)
+        sumw2 = np.bincount(flat, weights=w*w, minlength=n).reshape((len(keys),)+self.shape)
+        for key, s, s2 in zip(keys, sumw, sumw2):
+            self.accumulate((int(key)//1000, int(key)%1000), s, s2)
+
+    def accumulate(self, key, sumw, sumw2):
+        """Add sums of weights to the histogram of the given (surface, particle) key"""
+        if key in self.sumw:
+            self.sumw[key]  += sumw
+            self.sumw2[key] += sumw2
+        else:
+            self.sumw[key]  = sumw.copy()
+            self.sumw2[key] = sumw2.copy()
+
+    def add(self, other):
+        """Add histograms filled by another SSWHist with the same axes"""
+        for key in other.sumw:
+            self.accumulate(key, other.sumw[key], other.sumw2[key])
+
+    def getName(self, key):
+        return "s%d_p%d" % key
+
+    def getHists(self, N):
+        """Return dictionary of (value, error) arrays normalised by N incident particles"""
+        return dict((self.getName(key), (self.sumw[key]/N, np.sqrt(self.sumw2[key])/N))
+                    for key in sorted(self.sumw))
+
+    def saveNPZ(self, fname, N):
+        """Save normalised histograms and axes definitions into the NPZ file"""
+        data = { "N" : N, "axes" : np.array([a.var for a in self.axes]) }
+        for i, a in enumerate(self.axes):
+            data["edges%d" % i] = a.getEdges()
+        for name, (val, err) in self.getHists(N).items():
+            data[name] = val
+            data[name+"_err"] = err
+        np.savez_compressed(fname, **data)
+
+    def saveROOT(self, fname, N, title=""):
+        """Save normalised histograms as TH1D/TH2D/TH3D into the ROOT file"""
+        import ROOT
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        from mctools.common import FillHist
+        if len(self.axes) > 3:
+            raise ValueError("sswhist: ROOT output supports up to 3 axes")
+        cls = (ROOT.TH1D, ROOT.TH2D, ROOT.TH3D)[len(self.axes)-1]
+        htitle = title + ";" + ";".join(a.var for a in self.axes)
+
+        fout = ROOT.TFile(fname, "recreate", title)
+        for name, (val, err) in self.getHists(N).items():
+            args = []
+            for a in self.axes:
+                args += [a.nbins, a.getEdges()]
+            h = cls(name, htitle, *args)
+            FillHist(h, val.T, err.T) # ROOT bins are x-fastest
+            h.SetEntries(N)
+            h.Write()
+        fout.Close()
+
+    def save(self, fname, N, title=""):
+        """Save histograms in the ROOT format if fname ends with .root, and in the NPZ format otherwise"""
+        if fname.endswith(".root"):
+            self.saveROOT(fname, N, title)
+        else:
+            self.saveNPZ(fname, N)
+
+
+def fillRange(r, axes, surfaces, particles, chunk=ssw.CHUNK):
+    """Return SSWHist filled with the hits of the ssw.RecordRange r"""
+    h = SSWHist(axes, surfaces, particles)
+    for ssb in r.chunks(chunk):
+        h.fill(ssb)
+    return h
+
+
+def main():
+    """
+    Histograms SSW hits without conversion into ROOT.
+    One weighted histogram is filled per surface and particle type (IPT)
+    in a single pass over the file, and normalised by the number of incident particles.
+    Axes are defined as var:nbins:min:max[:log] where var is one of the SSB values
+    (history id weight energy time x y z wx wy k) or derived variables (surface IPT JGP wz theta).
+    Example: sswhist wssa -axis energy:100:1e-9:20:log -axis theta:36:0:360 -o out.root
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wssa', type=str, help='ssw output file name')
+    parser.add_argument('-axis', dest='axes', type=str, action='append', required=True, help='axis definition var:nbins:min:max[:log] (up to 3 axes for ROOT output)')
+    parser.add_argument('-o', dest='out', type=str, help='output file name (.root or .npz)', default=None)
+    parser.add_argument('-surface', dest='surfaces', type=int, nargs='+', help='surfaces to histogram', default=None)
+    parser.add_argument('-particle', dest='particles', type=int, nargs='+', help='particle types (IPT) to histogram', default=None)
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of tracks processed at once', default=ssw.CHUNK)
+    parser.add_argument('-workers', dest='workers', type=int, help='number of worker processes', default=1)
+    arguments = parser.parse_args()
+
+    try:
+        axes = [Axis.parse(a) for a in arguments.axes]
+    except ValueError as e:
+        parser.error(str(e))
+
+    fout_name = arguments.out if arguments.out else arguments.wssa + ".npz"
+
+    s = ssw.SSW(arguments.wssa)
+    h = SSWHist(axes, arguments.surfaces, arguments.particles)
+    ranges = s.getRanges(max(1, arguments.workers))
+    for part in ssw.mapRanges(fillRange, ranges, arguments.workers,
+                              axes, arguments.surfaces, arguments.particles, arguments.chunk):
+        h.add(part)
+    s.close()
+
+    h.save(fout_name, s.N, s.getTitle())
+
+if __name__ == "__main__":
+        sys.exit(main())
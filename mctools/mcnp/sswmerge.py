@@ -0,0 +1,31 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, argparse
+from os import path
+from mctools.mcnp import ssw
+
+def main():
+    """
+    Concatenates SSW files (wssa) produced by independent MCNP(X) runs into a single file.
+    History numbers are renumbered and the number of incident particles (np1) is summed up,
+    so the merged file is normalised as if produced by a single run.
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wssa', type=str, nargs='+', help='ssw output file names')
+    parser.add_argument('-o', dest='out', type=str, help='output file name', required=True)
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of tracks processed at once', default=ssw.CHUNK)
+    parser.add_argument('-f', '--force', action='store_true', default=False, dest='overwrite', help='overwrite the output file')
+    arguments = parser.parse_args()
+
+    if not arguments.overwrite and path.isfile(arguments.out):
+        sys.exit("%s exists. Use '-f' to overwrite it." % arguments.out)
+
+    N = ssw.merge(arguments.wssa, arguments.out, arguments.chunk)
+    print("%s: %d incident particles" % (arguments.out, N))
+
+if __name__ == "__main__":
+        sys.exit(main())
@@ -0,0 +1,31 @@
+#! /usr/bin/python -W all
+# https://github.com/kbat/mc-tools
+#
+
+from __future__ import print_function
+import sys, argparse
+from mctools.mcnp import ssw
+
+def main():
+    """
+    Splits a SSW file (wssa) into several shards to be processed in parallel.
+    Tracks of the same history are kept in the same shard, and the number of
+    incident particles (np1) of each shard is the number of histories it covers.
+    The shards are called wssa.0, wssa.1 etc. unless a prefix is given.
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__, epilog='Homepage: https://github.com/kbat/mc-tools', formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wssa', type=str, help='ssw output file name')
+    parser.add_argument('-n', dest='n', type=int, help='number of shards', required=True)
+    parser.add_argument('-o', dest='prefix', type=str, help='output file name prefix', default=None)
+    parser.add_argument('-chunk', dest='chunk', type=int, help='number of tracks processed at once', default=ssw.CHUNK)
+    arguments = parser.parse_args()
+
+    if arguments.n < 1:
+        parser.error("the number of shards must be positive")
+
+    for name in ssw.split(arguments.wssa, arguments.n, arguments.prefix, arguments.chunk):
+        print(name)
+
+if __name__ == "__main__":
+        sys.exit(main())
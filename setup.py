@@ -66,15 +66,24 @@ setup(
             "root2txt     = mctools.common.root2txt:main",
             # FLUKA
             "fluka2root    = mctools.fluka.fluka2root:main",
+            "flukamerge    = mctools.fluka.flukamerge:main",
+            "flukamonitor  = mctools.fluka.flukamonitor:main",
             "eventdat2root = mctools.fluka.eventdat2root:main",
+            "mgdrawscore   = mctools.fluka.mgdrawscore:main",
             "plotgeom2root = mctools.fluka.plotgeom2root:main",
+            "resnuclei2root = mctools.fluka.resnuclei2root:main",
             "usbsuw2root   = mctools.fluka.usbsuw2root:main",
+            "usbsuw2vtk    = mctools.fluka.usbsuw2vtk:main",
+            "usrbinmath    = mctools.fluka.usrbinmath:main",
             "ustsuw2root   = mctools.fluka.ustsuw2root:main",
             "usxsuw2root   = mctools.fluka.usxsuw2root:main",
             # MCNP
             "mctal2root   = mctools.mcnp.mctal2root:main",
             "ssw2root     = mctools.mcnp.ssw2root:main",
             "ssw2txt      = mctools.mcnp.ssw2txt:main",
+            "sswhist      = mctools.mcnp.sswhist:main",
+            "sswmerge     = mctools.mcnp.sswmerge:main",
+            "sswsplit     = mctools.mcnp.sswsplit:main",
             "mcnpview     = mctools.mcnp.mcnpview:main",
             "mcnpxview    = mctools.mcnp.mcnpview:main",
             # PHITS
@@ -0,0 +1,672 @@
+#! /bin/python
+
+import os
+import struct
+import tempfile
+import numpy as np
+from mctools.fluka.flair import Data, fortran
+from mctools.fluka import flukamerge, flukamonitor, resnuclei2root, eventdat, eventdat2root, mgdraw, mgdrawscore, plotgeom
+from mctools.fluka.fluka import USXSUW
+from mctools.fluka import sparsebin, usbsuw2root, usbsuw2vtk, usrbinmath, usrascii
+
+def makeUsrbin(fname, bins, weight=1.0, stat=True):
+        """Write a usbsuw-like file with the given list of (name, val, err, (xlow,xhigh,ylow,yhigh,zlow,zhigh)) detectors.
+        val and err are (nx, ny, nz) arrays. Without stat a single cycle file is written."""
+        with open(fname, "wb") as f:
+                if stat:
+                        fortran.write(f, struct.pack("=80s32sfii", b"title", b"time", weight, 100, 10))
+                else:
+                        fortran.write(f, struct.pack("=80s32sfi", b"title", b"time", weight, 100))
+                for i, (name, val, err, lim) in enumerate(bins):
+                        nx, ny, nz = val.shape
+                        fortran.write(f, struct.pack("=i10siiffifffifffififff", i+1, name.ljust(10), 10, 208,
+                                                     lim[0], lim[1], nx, 0.0,
+                                                     lim[2], lim[3], ny, 0.0,
+                                                     lim[4], lim[5], nz, 0.0,
+                                                     0, 0, 0.0, 0.0))
+                        fortran.write(f, np.asarray(val, dtype="=f4").ravel(order="F").tobytes())
+                if not stat:
+                        return
+                fortran.write(f, b"STATISTICS\0\0\0\0")
+                for name, val, err, lim in bins:
+                        fortran.write(f, np.asarray(err, dtype="=f4").ravel(order="F").tobytes())
+
+def randomBins(n=3):
+        rng = np.random.default_rng(1)
+        bins = []
+        for i in range(n):
+                shape = (2+i, 3, 4+i)
+                bins.append((b"bin%d" % i, rng.random(shape), rng.random(shape), (0, 2, -1, 1, 0, 4)))
+        return bins
+
+def test_usrbin_index():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "usrbin")
+        bins = randomBins()
+        makeUsrbin(fname, bins)
+        usr = Data.Usrbin(fname)
+        assert len(usr.detector) == len(bins)
+        for i in (2, 0, 1):
+                name, val, err, lim = bins[i]
+                assert usr.detector[i].name == name
+                data = np.array(Data.unpackArray(usr.readData(i)))
+                stat = np.array(Data.unpackArray(usr.readStat(i)))
+                assert np.allclose(data, val.ravel(order="F"))
+                assert np.allclose(stat, err.ravel(order="F"))
+                assert np.allclose(usr.readDataArray(i), val.T)
+                assert np.allclose(usr.readStatArray(i), err.T)
+        usr.close()
+
+def test_usrbin_mmap():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "usrbin")
+        bins = randomBins()
+        makeUsrbin(fname, bins)
+        with Data.Usrbin(fname) as usr:
+                data, stat = usr.array(2)
+        name, val, err, lim = bins[2]
+        assert data.shape == (6, 3, 4)
+        assert np.allclose(data[:, :, 1], val[1].T)
+        assert np.allclose(stat[3], err[:, :, 3].T)
+        # x in [0,2] with 4 bins, z in [0,4] with 6 bins
+        box = usr.getSlice(2, xlim=(0.6, 1.4), zlim=(1.0, 2.0))
+        assert box == (slice(1, 3), slice(None), slice(1, 3))
+        assert np.allclose(data[box], val[1:3, :, 1:3].T)
+
+def test_merge_usrbin():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        bins = randomBins(2)
+        weights = (100.0, 300.0)
+        cycles = []
+        for k, w in enumerate(weights):
+                fname = os.path.join(tmpdir, "cycle%d_fort.50" % k)
+                makeUsrbin(fname, [(name, val*(k+1), err, lim) for name, val, err, lim in bins], w, False)
+                cycles.append(fname)
+        fout = flukamerge.merge("usbsuw", cycles, os.path.join(tmpdir, "merged"))
+
+        usr = Data.Usrbin(fout)
+        assert usr.weight == sum(weights) and usr.ncase == 200 and usr.nbatch == 2
+        for i, (name, val, err, lim) in enumerate(bins):
+                assert usr.detector[i].name == name
+                data, stat = usr.array(i, False)
+                # mean = (100*val + 300*2val)/400 = 1.75 val, variance of the mean = 0.1875 val^2
+                assert np.allclose(data, 1.75*val.T)
+                assert np.allclose(stat, np.sqrt(0.1875)/1.75)
+        usr.close()
+
+def test_monitor():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        bins = randomBins(2)
+        rng = np.random.default_rng(2)
+        m = flukamonitor.Monitor(units=[50])
+        batch = [flukamerge.Batch() for b in bins]
+        for k in range(5):
+                cycle = [(name, val*rng.random(val.shape), err, lim) for name, val, err, lim in bins]
+                makeUsrbin(os.path.join(tmpdir, "cycle%03d_fort.50" % k), cycle, 10.0*(k+1), False)
+                for b, (name, val, err, lim) in zip(batch, cycle):
+                        b.add(val.ravel(order="F"), 10.0*(k+1))
+                assert m.update(tmpdir) == [50]
+                assert m.update(tmpdir) == []
+        for (name, w), b in zip(m.stat[50], batch):
+                assert np.allclose(w.getMean(), b.getMean())
+                assert np.allclose(w.getError(), b.getError())
+        summary = m.getSummary([50, 95])
+        assert [s[:4] for s in summary] == [(50, "bin0", 5, 24), (50, "bin1", 5, 45)]
+        assert m.isConverged(1.0, 95) and not m.isConverged(1e-3, 95)
+
+def test_monitor_formatted():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        with open(os.path.join(tmpdir, "cycle001_fort.21"), "w") as f:
+                f.write(" *****  formatted output  *****\n\n 1.0000E+00 2.0000E+00\n")
+        bins = randomBins(1)
+        fname = os.path.join(tmpdir, "cycle001_fort.50")
+        makeUsrbin(fname, bins, 10.0, False)
+        with open(fname, "rb") as f:
+                data = f.read()
+        with open(fname, "wb") as f: # the cycle file is still being written
+                f.write(data[:len(data)//2])
+        m = flukamonitor.Monitor()
+        assert flukamerge.getReader(os.path.join(tmpdir, "cycle001_fort.21")) is None
+        assert m.update(tmpdir) == []
+        assert sorted(m.rejected) == [os.path.join(tmpdir, "cycle001_fort.21"), fname]
+        added = []
+        m.add = lambda f, add=m.add: added.append(f) or add(f)
+        assert m.update(tmpdir) == [] and added == [] # the unchanged files are not read again
+        with open(fname, "wb") as f:
+                f.write(data)
+        assert m.update(tmpdir) == [50] and added == [fname]
+        assert m.update(tmpdir) == []
+        assert list(m.rejected) == [os.path.join(tmpdir, "cycle001_fort.21")]
+
+def test_monitor_detectors():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        bins = randomBins(2)
+        fnames = [os.path.join(tmpdir, "cycle%03d_fort.50" % k) for k in range(2)]
+        makeUsrbin(fnames[0], bins[:1], 10.0, False) # the second detector is not written yet
+        makeUsrbin(fnames[1], bins, 30.0, False)
+        os.utime(fnames[0], (1, 1))
+        m = flukamonitor.Monitor()
+        m.update(tmpdir)
+        assert [(name, w.n) for name, w in m.stat[50]] == [("bin0", 1), ("bin1", 1)]
+        assert list(m.rejected) == [fnames[0]]
+        makeUsrbin(fnames[0], bins, 10.0, False)
+        assert m.update(tmpdir) == [50]
+        for (name, w), (bname, val, err, lim) in zip(m.stat[50], bins):
+                assert w.n == 2 and np.allclose(w.getMean(), val.ravel(order="F"))
+
+def makeResnuclei(fname, val, iso, weight=1.0):
+        """Write a RESNUCLEi cycle file with one detector of the (mhigh, zhigh) data val and isomers iso"""
+        mhigh, zhigh = val.shape
+        with open(fname, "wb") as f:
+                fortran.write(f, struct.pack("=80s32sfi", b"title", b"time", weight, 100))
+                fortran.write(f, struct.pack("=i10siif3i", 1, b"res".ljust(10), 1, 3, 1.0, mhigh, zhigh, -4))
+                fortran.write(f, np.asarray(val, dtype="=f4").tobytes())
+                fortran.write(f, struct.pack("=10si", b"ISOMERS:", 1))
+                fortran.write(f, np.asarray(iso, dtype="=f4").tobytes())
+
+def test_resnuclei():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        rng = np.random.default_rng(3)
+        val = rng.random((6, 4))
+        cycles = []
+        for k in range(3):
+                cycles.append(os.path.join(tmpdir, "cycle%d_fort.64" % k))
+                makeResnuclei(cycles[-1], val*(k+1), val*0.1, 10.0)
+        assert flukamerge.getReader(cycles[0]) is Data.Resnuclei
+        m = flukamonitor.Monitor() # RESNUCLEi is not monitored
+        assert m.update(tmpdir) == [] and m.files == set(cycles) and not m.rejected
+        fout = flukamerge.merge("usrsuw", cycles, os.path.join(tmpdir, "merged"))
+
+        usr = Data.Resnuclei(fout)
+        det = usr.detector[0]
+        data = resnuclei2root.read(usr, 0)
+        assert np.allclose(data[""][0], 2*val)
+        assert np.allclose(data["_iso"][0], 0.1*val)
+        assert np.allclose(data["_iso"][1], 0)
+        # projections as in the loops of Data.py
+        Z = [sum(2*val[m, z] for m in range(det.mhigh)) for z in range(det.zhigh)]
+        A = np.zeros(resnuclei2root.getAmax(det))
+        for z in range(det.zhigh):
+                for m in range(det.mhigh):
+                        a = m + 2*z + det.nmzmin + 3
+                        if a >= 1:
+                                A[a-1] += 2*val[m, z]
+        assert np.allclose(data["_Z"][0], Z)
+        assert np.allclose(data["_A"][0], A)
+        # relative error of (1, 2, 3)*x is 1/(2 sqrt(3))
+        assert np.allclose(data["_Z"][1], 0.5/np.sqrt(3))
+        table = resnuclei2root.getTable(det, *data[""])
+        assert len(table) == val.size
+        assert np.array_equal(table["A"], resnuclei2root.getMassNumbers(det).ravel())
+        usr.close()
+
+def makeEventDat(fname, data, first=1):
+        """Write an EVENTDAT file with the (nevents, nsco, nregs) data, one record per distribution"""
+        nevents, nsco, nregs = data.shape
+        with open(fname, "wb") as f:
+                fortran.write(f, struct.pack("=80s32sii%di" % nsco, b"title".ljust(80), b"time".ljust(32), nregs, nsco, *range(208, 208+nsco)))
+                for i in range(nevents):
+                        fortran.write(f, struct.pack("=3i", first+i, 0, 0))
+                        fortran.write(f, np.arange(12, dtype="=f4").tobytes())
+                        for j in range(nsco):
+                                fortran.write(f, np.asarray(data[i, j], dtype="=f4").tobytes())
+                        fortran.write(f, struct.pack("=2i", 1, 2))
+
+def test_eventdat():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        rng = np.random.default_rng(4)
+        data = [rng.random((7, 2, 5)), rng.random((4, 2, 5))]
+        fnames = [os.path.join(tmpdir, "ev%d" % i) for i in range(2)]
+        makeEventDat(fnames[0], data[0])
+        makeEventDat(fnames[1], data[1], 8)
+
+        ed = eventdat.EventDat(fnames[0])
+        assert (ed.nregs, ed.nsco, ed.iscore, ed.nevents) == (5, 2, (208, 209), 7)
+        assert ed.sizes == [12, 48, 20, 20, 8]
+        chunks = list(ed.chunks(3))
+        assert [len(ev) for ev in chunks] == [3, 3, 1]
+        assert np.allclose(np.concatenate([ed.getData(ev) for ev in chunks]), data[0])
+        assert np.array_equal(ed.getNCase(ed.events()), np.arange(1, 8))
+
+        eds = [eventdat.EventDat(f) for f in fnames]
+        out = os.path.join(tmpdir, "out.npz")
+        eventdat2root.saveNPZ(eds, out, 2, 3)
+        npz = np.load(out)
+        assert np.allclose(npz["data"], np.concatenate(data))
+        assert np.array_equal(npz["ncase"], np.arange(1, 12))
+        assert np.array_equal(npz["iscore"], [208, 209])
+
+def makeMgdraw(fname, nevents, seed=5):
+        """Write a MGDRAW dump with random tracking, energy deposition and source events"""
+        rng = np.random.default_rng(seed)
+        with open(fname, "wb") as f:
+                for i in range(nevents):
+                        kind = rng.integers(3)
+                        if kind == 0:
+                                n, m = rng.integers(1, 5), rng.integers(0, 3)
+                                fortran.write(f, struct.pack("=iiiff", n, m, 8, 1.0, 0.5))
+                                fortran.write(f, rng.random(3*(n+1)+m+1).astype("=f4").tobytes())
+                        elif kind == 1:
+                                fortran.write(f, struct.pack("=iiiff", 0, 11, 7, 2.0, 1.0))
+                                fortran.write(f, rng.random(4).astype("=f4").tobytes())
+                        else:
+                                npflka = rng.integers(1, 3)
+                                fortran.write(f, struct.pack("=iiiff", -(i+1), npflka, 1, 3.0, 1.0))
+                                fortran.write(f, b"".join(struct.pack("=i8f", 1, *rng.random(8)) for j in range(npflka)))
+
+def test_mgdraw():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "dump")
+        makeMgdraw(fname, 200)
+
+        # reference: event by event reader
+        ref = { 0 : [], 1 : [], 2 : [] }
+        old = Data.Mgdraw(fname)
+        while True:
+                kind = old.readEvent()
+                if kind is None:
+                        break
+                ref[kind].append(old.data)
+        old.close()
+
+        mg = mgdraw.Mgdraw(fname)
+        for chunks in (list(mg.chunks(chunk=256)),
+                       [c for start, stop in mg.getRanges(4) for c in mg.chunks(start=start, stop=stop)]):
+                tracks = np.concatenate([c.tracks for c in chunks])
+                assert len(tracks) == len(ref[0])
+                t = 0
+                for c in chunks:
+                        for tr in c.tracks:
+                                xyz = c.points[tr["first"]:tr["first"]+tr["ntrack"]+1]
+                                assert np.allclose(xyz.ravel(), ref[0][t][:3*(tr["ntrack"]+1)])
+                                assert np.isclose(tr["ctrack"], ref[0][t][-1])
+                                t += 1
+                deposits = np.concatenate([c.deposits for c in chunks])
+                assert np.allclose(deposits["rull"], [d[3] for d in ref[1]])
+                sources = np.concatenate([c.sources for c in chunks])
+                assert np.allclose(sources["wtflk"], [d[9*j+8] for d in ref[2] for j in range(len(d)//9)])
+
+        assert len(mg.getRanges(4)) > 1
+        only = list(mg.chunks(types=(mgdraw.DEPOSIT,)))
+        assert all(c.tracks is None and c.sources is None for c in only)
+
+        # the data record of the first event looks like a whole event
+        fake = [20, 1, 0, 0, 0, 0, 20, 8, 7, 7, 8, 0]
+        wi = np.array([20, 1, 0, 0, 0, 0, 20, 48] + fake + [48] + [20, 0, 0, 0, 0, 0, 20, 16, 1, 2, 3, 4, 16, 20, 1], dtype=np.int32)
+        starts, end = mgdraw.scan(wi, len(wi))
+        assert list(starts) == [0, 21] and end == 34
+        starts, end = mgdraw.scan(wi, 30)
+        assert list(starts) == [0] and end == 21
+
+def test_mgdrawscore():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "dump")
+        with open(fname, "wb") as f:
+                def source(ncase):
+                        fortran.write(f, struct.pack("=iiiff", -ncase, 1, 1, 1.0, 1.0))
+                        fortran.write(f, struct.pack("=i8f", 1, 1.0, 0, 0, 0, 1, 0, 0, 1.0))
+                def deposit(x, rull):
+                        fortran.write(f, struct.pack("=iiiff", 0, 11, 7, 1.0, 1.0))
+                        fortran.write(f, struct.pack("=4f", x, 0, 0, rull))
+                source(1)
+                # 2.5 cm long track with 3 GeV continuous losses: 0.5, 1.0 and 1.0 cm in the x bins 0, 1 and 2
+                fortran.write(f, struct.pack("=iiiff", 2, 1, 8, 1.0, 1.0))
+                fortran.write(f, struct.pack("=11f", 0.5, 0, 0, 2.5, 0, 0, 2.5, 0, 0.5, 3.0, 0.0))
+                deposit(3.5, 2.0)
+                source(2)
+                deposit(3.5, 4.0)
+                deposit(9.0, 1.0) # outside the mesh
+
+        mesh = mgdrawscore.Mesh(np.linspace(0, 4, 5), [-1, 1], [-1, 1])
+        for chunk in (64, mgdraw.CHUNK):
+                scores = mgdrawscore.score([fname], mesh, workers=2, chunk=chunk)
+                energy, err = mgdrawscore.getDensity(mesh, scores[mgdrawscore.ENERGY])
+                length, lerr = mgdrawscore.getDensity(mesh, scores[mgdrawscore.LENGTH])
+                assert scores[mgdrawscore.ENERGY].n == 2
+                assert np.allclose(energy.ravel(), np.array([0.6, 1.2, 1.2, 6.0])/2/4)
+                assert np.allclose(err.ravel(), [1, 1, 1, 1/3.0])
+                assert np.allclose(length.ravel(), np.array([0.5, 1.0, 1.0, 0.0])/2/4)
+
+def test_mgdrawscore_weights():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "dump")
+        rng = np.random.default_rng(6)
+        mesh = mgdrawscore.Mesh(np.linspace(0, 4, 5), [-1, 1], [-1, 1])
+        ref = flukamerge.Batch()
+        with open(fname, "wb") as f:
+                for ncase in range(1, 8):
+                        weipri = rng.uniform(0.1, 3.0)
+                        fortran.write(f, struct.pack("=iiiff", -ncase, 1, 1, 1.0, weipri))
+                        fortran.write(f, struct.pack("=i8f", 1, 1.0, 0, 0, 0, 1, 0, 0, weipri))
+                        s = np.zeros(4)
+                        for k in range(rng.integers(1, 4)):
+                                x, rull = rng.uniform(0, 4), rng.random()
+                                fortran.write(f, struct.pack("=iiiff", 0, 11, 7, 1.0, weipri))
+                                fortran.write(f, struct.pack("=4f", x, 0, 0, rull))
+                                s[int(x)] += weipri*np.float32(rull)
+                        ref.add(s/weipri, weipri) # score of the primary per unit weight
+        for chunk in (64, mgdraw.CHUNK):
+                score = mgdrawscore.score([fname], mesh, (mgdrawscore.ENERGY,), workers=2, chunk=chunk)[mgdrawscore.ENERGY]
+                assert score.n == 7 and np.isclose(score.sumw, ref.sumw)
+                assert np.allclose(score.getMean(), ref.getMean(), rtol=1e-5)
+                assert np.allclose(score.getError(), ref.getError(), rtol=1e-5)
+
+def test_plotgeom():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "plotgeom")
+        worms = [np.array([[0, 0], [1, 0], [1, 1]]), np.array([[2, 2], [3, 3]]), np.array([[5, 5], [6, 6], [7, 7]])]
+        with open(fname, "wb") as f:
+                fortran.write(f, b"test".ljust(80))
+                fortran.write(f, struct.pack("=14f", 10, 20, 0, 0, 0, 0, 0, 1, 0, 1, 0, 0, 1, 1))
+                fortran.write(f, struct.pack("=2i", len(worms), 0))
+                for i, w in enumerate(worms):
+                        fortran.write(f, struct.pack("=3i", i+1, 0, len(w)))
+                        fortran.write(f, w.astype("=f4").tobytes())
+
+        pg = plotgeom.PlotGeom(fname)
+        assert len(pg) == 3
+        assert pg.windex.tolist() == [1, 2, 3]
+        for i, w in enumerate(worms):
+                assert np.allclose(pg.getWorm(i), w + [20, 10]) # shifted by (Y0, X0)
+        points, offsets = plotgeom.split(pg.getSeparated())
+        assert np.allclose(points, pg.xy)
+        assert offsets.tolist() == pg.offsets.tolist()
+
+def test_tablis():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "example_tab.lis")
+        with open(fname, "w") as f:
+                f.write(" # Detector n:   1  fluence (cm**-2 GeV**-1)\n # N. of energy intervals 2\n")
+                f.write("   1.0E-03  2.0E-03  1.5E+00  3.0E+00\n   2.0E-03  3.0E-03  2.5E+00  4.0E+00\n\n\n")
+                f.write(" # Detector n:   2  dose\n # Block n: 1 angle 1\n   1.0  2.0  3.0  4.0\n\n")
+                f.write(" # Block n: 2 angle 2\n   5.0  6.0  7.0  8.0\n   9.0  10.0  11.0  12.0\n")
+
+        tab = Data.TabLis(fname)
+        assert [det.name for det in tab.detector] == ["fluence", "dose"]
+        assert [len(det.blocks) for det in tab.detector] == [1, 2]
+        assert tab.detector[1].blocks[1].name == "angle 2"
+        assert np.allclose(tab.readData(0), [[1e-3, 2e-3, 1.5, 3], [2e-3, 3e-3, 2.5, 4]])
+        assert np.allclose(tab.readData(1, 1), [[5, 6, 7, 8], [9, 10, 11, 12]])
+        name, xmin, xmax, val, err = Data.tabLis(fname, 1, 1)
+        assert name == "dose" and np.allclose(val, [7, 11])
+
+def test_usxsuw_values():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "example.usxsuw")
+        ne, na, ng = 2, 3, 2
+        data = np.arange((ne+ng)*na, dtype="=f4") + 1
+        err = data / 100
+        with open(fname, "wb") as f:
+                fortran.write(f, struct.pack("=80s32s1f3i", b"test", b"now", 1.0, 10, 0, 1))
+                fortran.write(f, struct.pack("=1i10s4i1f3i2f1i1f2f1i1f", 1, b"bdx", 1, 8, 1, 2, 1.0, 0, 1, 1,
+                                             1e-3, 1.0, ne, 0.5, 0.0, 2*np.pi, na, 2*np.pi/na))
+                fortran.write(f, struct.pack("=i", ng) + np.array([2e-8, 1e-9, 1e-11], dtype="=f4").tobytes())
+                fortran.write(f, data.tobytes())
+                fortran.write(f, b"STATISTICS" + struct.pack("=i", 0))
+                fortran.write(f, struct.pack("=2f", 1.0, 0.1))
+                fortran.write(f, struct.pack("=2i", ne, ng) + np.zeros(1+ne+ng, dtype="=f4").tobytes())
+                for i in range(4):
+                        fortran.write(f, np.zeros(ne+ng, dtype="=f4").tobytes())
+                fortran.write(f, err.tobytes())
+
+        u = USXSUW(fname)
+        u.Read()
+        ubs = u.ubsarray[0]
+        assert np.allclose(ubs.getALowEdge(), np.linspace(0, 2*np.pi, na+1))
+        assert ubs.getALowEdge() is ubs.getALowEdge() # computed once
+        val, e = ubs.getValues('sr')
+        assert val.shape == (ne, na)
+        assert np.allclose(val, data[:ne*na].reshape(na, ne).T)
+        low, elow = ubs.getValues('deg', True)
+        assert low.shape == (ng, na)
+        assert np.allclose(low, data[ne*na:].reshape(na, ng).T * ubs.getDegFactor())
+        assert np.allclose(elow, low / ubs.getDegFactor() / 100)
+        for ie in range(ng):
+                for ia in range(na):
+                        assert np.allclose(ubs.getData(ie, ia, 'deg', True), (low[ie,ia], elow[ie,ia]))
+
+def test_sparse_usrbin():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "usrbin")
+        rng = np.random.default_rng(3)
+        val = rng.random((5, 4, 3)) * (rng.random((5, 4, 3)) > 0.8)
+        err = rng.random((5, 4, 3))
+        makeUsrbin(fname, [(b"dose", val, err, (0, 5, 0, 4, 0, 3))])
+        with Data.Usrbin(fname) as b:
+                usbsuw2root.saveNPZ(b, fname+".npz", sparse=True)
+
+        s = sparsebin.load(fname+".npz")["dose"]
+        assert s.shape == (3, 4, 5)
+        assert len(s) == np.count_nonzero(val)
+        dval, derr = s.dense()
+        assert np.allclose(dval, val.T)
+        assert np.allclose(derr, np.where(val.T != 0, err.T, 0))
+        assert np.allclose(s.getEdges("y"), np.linspace(0, 4, 5))
+        for axis, n in (("x", 5), ("y", 4), ("z", 3)):
+                for i in range(n):
+                        sval, serr = s.getSlice(axis, i)
+                        index = [slice(None)]*3
+                        index[2-"xyz".index(axis)] = i
+                        assert np.allclose(sval, dval[tuple(index)])
+                        assert np.allclose(serr, derr[tuple(index)])
+
+def test_usbsuw2vtk():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        fname = os.path.join(tmpdir, "usrbin")
+        bins = randomBins(1)
+        makeUsrbin(fname, bins)
+        with Data.Usrbin(fname) as b:
+                usbsuw2vtk.writeVTK(b, 0, fname+".vtk")
+
+        with open(fname+".vtk", "rb") as f:
+                raw = f.read()
+        name, val, err, lim = bins[0]
+        nx, ny, nz = val.shape
+        assert b"DATASET RECTILINEAR_GRID\nDIMENSIONS %d %d %d\n" % (nx+1, ny+1, nz+1) in raw
+        pos = raw.index(b"Y_COORDINATES %d float\n" % (ny+1)) + len(b"Y_COORDINATES %d float\n" % (ny+1))
+        assert np.allclose(np.frombuffer(raw, dtype=">f4", count=ny+1, offset=pos), np.linspace(lim[2], lim[3], ny+1))
+        for scalar, a in ((b"value", val), (b"error", err)):
+                header = b"SCALARS %s float 1\nLOOKUP_TABLE default\n" % scalar
+                pos = raw.index(header) + len(header)
+                assert np.allclose(np.frombuffer(raw, dtype=">f4", count=val.size, offset=pos), a.ravel(order="F"))
+
+        det = Data.Detector()
+        det.xlow, det.xhigh, det.nx = 0.0, 2.0, 2
+        det.ylow, det.yhigh, det.ny = -np.pi, np.pi, 4
+        det.zlow, det.zhigh, det.nz = 0.0, 1.0, 1
+        points = usbsuw2vtk.getPoints(det)
+        assert points.shape == (2, 5, 3, 3)
+        assert np.allclose(np.hypot(points[...,0], points[...,1]), np.broadcast_to([0, 1, 2], (2, 5, 3)))
+
+def test_usrbinmath():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        rng = np.random.default_rng(7)
+        shape = (4, 3, 5)
+        a, b = rng.random(shape)+0.5, rng.random(shape)+0.5
+        ea, eb = rng.random(shape)/10, rng.random(shape)/10
+        lim = (0, 4, 0, 3, 0, 5)
+        makeUsrbin(os.path.join(tmpdir, "a"), [(b"dose", a, ea, lim)])
+        makeUsrbin(os.path.join(tmpdir, "b"), [(b"dose", b, eb, lim)])
+        makeUsrbin(os.path.join(tmpdir, "c"), [(b"dose", b, eb, (0, 4, 0, 3, 0, 6))])
+        ua, ub = Data.Usrbin(os.path.join(tmpdir, "a")), Data.Usrbin(os.path.join(tmpdir, "b"))
+        with Data.Usrbin(os.path.join(tmpdir, "c")) as uc:
+                try:
+                        usrbinmath.getPairs(ua, uc)
+                        assert False
+                except IOError:
+                        pass
+
+        out = os.path.join(tmpdir, "ratio")
+        usrbinmath.write(out, "div", ua, ub, chunk=7)
+        with Data.Usrbin(out) as r:
+                val, err = r.readDataArray(0), r.readStatArray(0)
+        assert np.allclose(val, (a/b).T, rtol=1e-6)
+        assert np.allclose(err, np.hypot(ea, eb).T, rtol=1e-6)
+
+        usrbinmath.write(out, "sub", ua, ub, scale=(2.0, 1.0))
+        with Data.Usrbin(out) as r:
+                diff = 2*a-b
+                assert np.allclose(r.readDataArray(0), diff.T, rtol=1e-5)
+                assert np.allclose(r.readStatArray(0), (np.hypot(2*a*ea, b*eb)/np.abs(diff)).T, rtol=1e-4)
+
+        chi2, ndf = usrbinmath.getChi2(ua, 0, ub, 0, chunk=11)
+        ua.close()
+        ub.close()
+        assert ndf == a.size
+        assert np.isclose(chi2, (((a-b)**2)/((a*ea)**2+(b*eb)**2)).sum())
+
+def test_fortran_reader():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        records = [b"header", np.arange(10, dtype="=f4").tobytes(), b""]
+        for endian, marker in (("<", 4), (">", 4), ("<", 8), (">", 8)):
+                fname = os.path.join(tmpdir, "records%s%d" % (endian, marker))
+                fmt = endian + ("i" if marker == 4 else "q")
+                with open(fname, "wb") as f:
+                        for rec in records:
+                                f.write(struct.pack(fmt, len(rec)) + rec + struct.pack(fmt, len(rec)))
+                with fortran.Reader(fname) as r:
+                        assert (r.endian, r.marker) == (endian, marker)
+                        assert [size for pos, size in r.records()] == [len(rec) for rec in records]
+                        assert [bytes(rec) for rec in r] == records
+                        r.seek(0)
+                        assert r.skip() == len(records[0])
+                        buf = np.zeros(10, dtype="=f4")
+                        assert r.readinto(buf) == 40
+                        assert np.array_equal(buf, np.arange(10))
+
+        with open(fname, "rb") as f:
+                data = bytearray(f.read())
+        data[-1] ^= 1 # corrupt the last marker
+        r = fortran.Reader(data, ">", 8)
+        try:
+                r.records()
+                assert False
+        except IOError:
+                pass
+
+def formatBlock(data):
+        """Return the data in the (1(5x,1p,10(1x,e11.4))) format of the FLUKA formatted output"""
+        data = np.asarray(data).ravel(order="F")
+        return "\n".join("     " + "".join(" %11.4E" % x for x in data[i:i+10]) for i in range(0, len(data), 10)) + "\n"
+
+def makeAsciiHeader(ncase, weight):
+        return """ *****  ascii test  *****
+
+ DATE:  1/ 1/26,  TIME: 12:00:00
+
+          Total number of particles followed %11d, for a total weight of  %.4E
+
+""" % (ncase, weight)
+
+def test_usrascii():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        rng = np.random.default_rng(3)
+        val = rng.random((3, 2, 4)) # (nx, ny, nz)
+        usrbin = """   1
+
+ Cartesian binning n.   1  "dose      " , generalized particle n.  228
+      X coordinate: from  0.0000E+00 to  3.0000E+00 cm,     3 bins ( 1.0000E+00 cm wide)
+      Y coordinate: from -1.0000E+00 to  1.0000E+00 cm,     2 bins ( 1.0000E+00 cm wide)
+      Z coordinate: from  0.0000E+00 to  8.0000E+00 cm,     4 bins ( 2.0000E+00 cm wide)
+      Data follow in a matrix A(ix,iy,iz), format (1(5x,1p,10(1x,e11.4)))
+
+      accurate deposition along the tracks requested
+"""
+        track, low = rng.random(5), rng.random(3)
+        usrtrack = """ Track n.   1  "neutron   " , generalized particle n.    8, region n.    3
+      detector volume:  2.0000E+00 cm**3
+      logar. energy binning from  1.0000E-03 to  1.0000E+02 GeV,     5 bins (ratio :  1.0000E+01)
+      Data follow in a matrix A(ie), format (1(5x,1p,10(1x,e11.4)))
+
+%s
+      low energy neutron data from group   1 to group   3 follow in a matrix A(ig), format (1(5x,1p,10(1x,e11.4)))
+
+%s
+      low energy neutron group energy boundaries:
+%s"""
+        bins, tracks = [], []
+        for k, w in enumerate((100.0, 300.0)):
+                bins.append(os.path.join(tmpdir, "cycle%d_fort.21" % k))
+                with open(bins[-1], "w") as f:
+                        f.write(makeAsciiHeader(100, w) + usrbin + formatBlock(val*(k+1)))
+                tracks.append(os.path.join(tmpdir, "cycle%d_fort.22" % k))
+                with open(tracks[-1], "w") as f:
+                        f.write(makeAsciiHeader(100, w) + usrtrack % (formatBlock(track*(k+1)), formatBlock(low*(k+1)),
+                                                                       formatBlock([2e-5, 1e-6, 1e-7, 1e-8])))
+
+        usr = Data.Usrbin(usrascii.merge("usbsuw", bins, os.path.join(tmpdir, "merged.usrbin")))
+        assert usr.weight == 400.0 and usr.ncase == 200 and usr.nbatch == 2
+        det = usr.detector[0]
+        assert det.name == b"dose" and det.score == 228 and (det.nx, det.ny, det.nz) == (3, 2, 4)
+        assert np.isclose(det.ylow, -1.0) and np.isclose(det.dz, 2.0)
+        data, stat = usr.array(0, False)
+        assert np.allclose(data, 1.75*val.T, rtol=1e-4)
+        assert np.allclose(stat, np.sqrt(0.1875)/1.75, rtol=1e-4)
+        usr.close()
+
+        usr = Data.Usrtrack(usrascii.merge("ustsuw", tracks, os.path.join(tmpdir, "merged.usrtrack")))
+        det = usr.detector[0]
+        assert det.type == -1 and det.reg == 3 and det.volume == 2.0 and det.ngroup == 3
+        assert np.allclose(det.egroup, [2e-5, 1e-6, 1e-7, 1e-8])
+        assert np.allclose(usr.readDataArray(0), 1.75*track, rtol=1e-4)
+        assert np.allclose(usr.readDataArray(0, True), 1.75*low, rtol=1e-4)
+        usr.close()
+
+        try:
+                usrascii.merge("usxsuw", tracks, os.path.join(tmpdir, "merged.usrbdx"))
+                assert False
+        except IOError:
+                pass
+
+        mixed = os.path.join(tmpdir, "mixed_fort.23")
+        with open(mixed, "w") as f:
+                f.write(makeAsciiHeader(100, 1.0) + usrbin + formatBlock(val) +
+                        usrtrack % (formatBlock(track), formatBlock(low), formatBlock([2e-5, 1e-6, 1e-7, 1e-8])))
+        try:
+                usrascii.Ascii(mixed)
+                assert False
+        except IOError as e:
+                assert "usbsuw, ustsuw" in str(e)
+
+def test_usrascii_usrbdx():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        rng = np.random.default_rng(4)
+        ne, na, ng = 4, 2, 3
+        val, low = rng.random((ne, na)), rng.random((ng, na))
+        usrbdx = """ Bdrx n.   1  "bdx       " , generalized particle n.    8, from region n.    2 to region n.    3
+      detector area:  1.0000E+02 cm**2
+      this is a two ways estimator
+      this is a fluence like estimator
+      logar. energy binning from  1.0000E-03 to  1.0000E+01 GeV,     4 bins (ratio :  1.0000E+01)
+      linear angular binning from  0.0000E+00 to  1.2566E+01 sr ,     2 bins ( 6.2832E+00 sr  wide )
+      Data follow in a matrix A(ie,ia), format (1(5x,1p,10(1x,e11.4)))
+
+%s
+      low energy neutron data from group   1 to group   3 follow in a matrix A(ig,ia), format (1(5x,1p,10(1x,e11.4)))
+
+%s
+      low energy neutron group energy boundaries:
+%s"""
+        cycles = []
+        for k, w in enumerate((100.0, 300.0)):
+                cycles.append(os.path.join(tmpdir, "cycle%d_fort.24" % k))
+                with open(cycles[-1], "w") as f:
+                        f.write(makeAsciiHeader(100, w) + usrbdx % (formatBlock(val*(k+1)), formatBlock(low*(k+1)),
+                                                                     formatBlock([2e-5, 1e-6, 1e-7, 1e-8])))
+
+        usr = Data.Usrbdx(usrascii.merge("usxsuw", cycles, os.path.join(tmpdir, "merged.usrbdx")))
+        assert usr.weight == 400.0 and usr.nbatch == 2
+        det = usr.detector[0]
+        # logarithmic energy and linear angular binning (i1=-1), two ways and fluence like
+        assert det.name == b"bdx" and det.type == -1+10+100 and flukamerge.getBdxType(det.type) == -1
+        assert (det.dist, det.reg1, det.reg2, det.twoway, det.fluence, det.lowneu) == (8, 2, 3, 1, 1, 1)
+        assert det.area == 100.0 and (det.ne, det.na, det.ngroup) == (ne, na, ng)
+        assert np.isclose(det.elow, 1e-3) and np.isclose(det.ehigh, 10.0) and np.isclose(det.de, 10.0)
+        assert det.alow == 0.0 and np.isclose(det.ahigh, 4*np.pi, rtol=1e-4) and np.isclose(det.da, 2*np.pi, rtol=1e-4)
+        assert np.allclose(det.egroup, [2e-5, 1e-6, 1e-7, 1e-8])
+        data, stat = usr.array(0, False)
+        assert data.shape == (na, ne)
+        assert np.allclose(data, 1.75*val.T, rtol=1e-4)
+        assert np.allclose(stat, np.sqrt(0.1875)/1.75, rtol=1e-4)
+        assert np.allclose(usr.readDataArray(0, True), 1.75*low.T, rtol=1e-4)
+        usr.close()
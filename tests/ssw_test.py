@@ -0,0 +1,113 @@
+#! /bin/python
+
+import os
+import struct
+import tempfile
+import pytest
+import numpy as np
+from mctools.mcnp import ssw
+
+def fortranWrite(f, data):
+        f.write(struct.pack("=i", len(data)))
+        f.write(data)
+        f.write(struct.pack("=i", len(data)))
+
+def makeWSSA(fname, histories, np1):
+        """Write a MCNPX 2.7.0-like wssa file with one hit per history given"""
+        histories = np.asarray(histories, dtype=float)
+        with open(fname, "wb") as f:
+                fortranWrite(f, struct.pack("=8s5s28s19s19s80si", b"mcnpx   ", b"2.7.0", b"date", b"machine", b"probid", b"title", 0))
+                niss = len(np.unique(np.abs(histories)))
+                fortranWrite(f, struct.pack("=5i", np1, len(histories), 11, 1, niss))
+                fortranWrite(f, struct.pack("=3i8s", 10, 1, 0, b""))
+                fortranWrite(f, struct.pack("=2i", 0, 0))
+                for i, h in enumerate(histories):
+                        ssb = [h, 1000010, 1.0, 1.0+i, 0.0, i, 0.0, 0.0, 0.0, 0.0, 1.0]
+                        fortranWrite(f, struct.pack("=11d", *ssb))
+        return histories
+
+def readAll(fname):
+        with ssw.SSW(fname) as s:
+                hits = np.concatenate(list(s.chunks(3))) if s.nevt else np.zeros((0, 11))
+        return s, hits
+
+def test_merge_split():
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        a = os.path.join(tmpdir, "a")
+        b = os.path.join(tmpdir, "b")
+        c = os.path.join(tmpdir, "c")
+        makeWSSA(a, [1, -1, 3, 4, -4, 4], 5)
+        makeWSSA(b, [2, 2, -5], 6)
+
+        assert ssw.merge([a, b], c, chunk=2) == 11
+        s, hits = readAll(c)
+        assert s.N == 11 and s.nevt == 9 and s.niss == 5
+        assert list(hits[:,0]) == [1, -1, 3, 4, -4, 4, 7, 7, -10]
+        assert list(hits[:,3]) == [1, 2, 3, 4, 5, 6, 1, 2, 3]
+
+        names = ssw.split(c, 2, chunk=2)
+        shards = [readAll(name)[0] for name in names]
+        assert [x.nevt for x in shards] == [6, 3]
+        assert [x.N for x in shards] == [4, 7]
+        _, hits = readAll(names[1])
+        assert list(hits[:,0]) == [3, 3, -6]
+
+        ssw.merge(names, a)
+        s, merged = readAll(a)
+        _, orig = readAll(c)
+        assert s.N == 11 and np.array_equal(merged, orig)
+
+def test_hist():
+        from mctools.mcnp.sswhist import Axis, SSWHist
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        a = os.path.join(tmpdir, "a")
+        makeWSSA(a, [1, 2, 2, 3, 4], 5)
+        s = ssw.SSW(a)
+        h = SSWHist([Axis.parse("energy:4:0:8"), Axis("x", 2, 0, 4)])
+        for ssb in s.chunks(2):
+                h.fill(ssb)
+        s.close()
+        hists = h.getHists(s.N)
+        assert list(hists) == ["s10_p1"]
+        val, err = hists["s10_p1"]
+        assert val.shape == (4, 2)
+        assert np.allclose(val, [[0.2, 0], [0.2, 0.2], [0, 0.2], [0, 0]])
+        assert np.allclose(err, val)
+
+def test_hist_workers():
+        pytest.importorskip("concurrent.futures")
+        from mctools.mcnp.sswhist import Axis, SSWHist, fillRange
+        tmpdir = tempfile.mkdtemp(suffix='.mc-tools')
+        a = os.path.join(tmpdir, "a")
+        makeWSSA(a, np.arange(1, 101), 100)
+        s = ssw.SSW(a)
+        axes = [Axis("energy", 10, 0, 100), Axis("x", 5, 0, 100)]
+        serial = fillRange(s.getRanges(1)[0], axes, None, None)
+        parallel = SSWHist(axes)
+        for part in ssw.mapRanges(fillRange, s.getRanges(3), 3, axes, None, None, 7):
+                parallel.add(part)
+        s.close()
+        assert np.array_equal(serial.sumw[(10, 1)], parallel.sumw[(10, 1)])
+        assert serial.sumw[(10, 1)].sum() == 99
+
+def TMathNint(x):
+        """Port of TMath::Nint of ROOT"""
+        if x >= 0:
+                i = int(x + 0.5)
+                if i & 1 and x + 0.5 == i: i -= 1
+        else:
+                i = int(x - 0.5)
+                if i & 1 and x - 0.5 == i: i += 1
+        return i
+
+def test_rint():
+        # getColumn rounds with np.rint: half integers to even as TMath::Nint of the ssw2root aliases
+        x = np.concatenate((np.arange(-5, 5.5, 0.5), [0.49999, 2.50001, -1.50001, 100.5, 101.5]))
+        assert np.array_equal(np.rint(x), [TMathNint(v) for v in x])
+        # the IPT of the ids whose i/100 or i/200 are half integers
+        ssb = np.zeros((3, 11))
+        ssb[:, 1] = [50e6, 150e6, -250e6]
+        i = np.array([50, 150, 250])
+        JGP = -np.array([TMathNint(v/200.0) for v in i])
+        JC = np.array([TMathNint(v/100.0) for v in i]) + 2*JGP
+        assert np.array_equal(ssw.getColumn(ssb, "IPT"), i-100*JC+200*JGP)